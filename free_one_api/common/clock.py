@@ -0,0 +1,16 @@
+"""Clock of routing code.
+
+Routing statistics, circuit breakers and cooldowns read time from here
+instead of `time.time`, so that simulations can run them on a virtual clock.
+"""
+import time
+
+
+now = time.time
+"""Current time in seconds."""
+
+
+def use(fn):
+    """Replace the clock, e.g. with a virtual one. `use(time.time)` restores it."""
+    global now
+    now = fn
@@ -0,0 +1,194 @@
+"""Rate limit signals of upstream responses.
+
+Understands `429` status, `Retry-After` and the OpenAI style
+`x-ratelimit-{limit,remaining,reset}-{requests,tokens}` headers.
+"""
+import re
+import time
+import email.utils
+
+from ..entities import exceptions
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """Parse reset duration like `1s`, `6m0s`, `20ms` or plain seconds.
+
+    Returns None if not parsable.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parts = _DURATION.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+def parse_retry_after(value: str, now: float=None) -> float:
+    """Parse `Retry-After` in seconds or HTTP date, returns seconds to wait.
+
+    Returns None if not parsable.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, date.timestamp() - now)
+
+
+def _int(value: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitInfo:
+    """Rate limit signals of an upstream response."""
+
+    default_cooldown: float = 10.0
+    """Cooldown seconds of a 429 without any reset hint."""
+
+    max_cooldown: float = 600.0
+    """Upper bound of cooldown seconds."""
+
+    status: int
+
+    received_at: float
+
+    retry_after: float
+    """Seconds, None if not provided."""
+
+    limit_requests: int
+
+    remaining_requests: int
+
+    reset_requests: float
+    """Seconds until request quota resets."""
+
+    limit_tokens: int
+
+    remaining_tokens: int
+
+    reset_tokens: float
+    """Seconds until token quota resets."""
+
+    def __init__(
+        self,
+        status: int,
+        retry_after: float=None,
+        limit_requests: int=None,
+        remaining_requests: int=None,
+        reset_requests: float=None,
+        limit_tokens: int=None,
+        remaining_tokens: int=None,
+        reset_tokens: float=None,
+    ):
+        self.status = status
+        self.received_at = time.time()
+        self.retry_after = retry_after
+        self.limit_requests = limit_requests
+        self.remaining_requests = remaining_requests
+        self.reset_requests = reset_requests
+        self.limit_tokens = limit_tokens
+        self.remaining_tokens = remaining_tokens
+        self.reset_tokens = reset_tokens
+
+    @classmethod
+    def from_headers(cls, status: int, headers) -> 'RateLimitInfo':
+        """Parse status and headers, returns None if there's no rate limit signal."""
+        info = cls(
+            status,
+            retry_after=parse_retry_after(headers.get("retry-after")),
+            limit_requests=_int(headers.get("x-ratelimit-limit-requests")),
+            remaining_requests=_int(headers.get("x-ratelimit-remaining-requests")),
+            reset_requests=parse_duration(headers.get("x-ratelimit-reset-requests")),
+            limit_tokens=_int(headers.get("x-ratelimit-limit-tokens")),
+            remaining_tokens=_int(headers.get("x-ratelimit-remaining-tokens")),
+            reset_tokens=parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+        if status != 429 and info.retry_after is None \
+                and info.remaining_requests is None and info.remaining_tokens is None:
+            return None
+        return info
+
+    def quota(self) -> float:
+        """Smallest remaining fraction of known quotas, None if unknown."""
+        fractions = [
+            remaining / limit
+            for remaining, limit in (
+                (self.remaining_requests, self.limit_requests),
+                (self.remaining_tokens, self.limit_tokens),
+            )
+            if remaining is not None and limit
+        ]
+        if self.remaining_requests == 0 or self.remaining_tokens == 0:
+            fractions.append(0.0)
+        return min(fractions) if fractions else None
+
+    def quota_reset(self) -> float:
+        """Seconds until the exhausted (or closest) quota resets, None if unknown."""
+        resets = [r for r in (self.reset_requests, self.reset_tokens) if r is not None]
+        exhausted = [
+            r for r, remaining in ((self.reset_requests, self.remaining_requests), (self.reset_tokens, self.remaining_tokens))
+            if r is not None and remaining == 0
+        ]
+        if exhausted:
+            return max(exhausted)
+        return min(resets) if resets else None
+
+    def cooldown(self) -> float:
+        """Seconds the channel should not be used, 0 if usable."""
+        cooldown = 0.0
+        if self.retry_after is not None:
+            cooldown = self.retry_after
+        elif self.status == 429:
+            reset = self.quota_reset()
+            cooldown = reset if reset is not None else self.default_cooldown
+        elif self.quota() == 0:
+            cooldown = self.quota_reset() or 0.0
+        return min(cooldown, self.max_cooldown)
+
+    def dump(self) -> dict:
+        return {
+            "status": self.status,
+            "received_at": self.received_at,
+            "retry_after": self.retry_after,
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "quota": self.quota(),
+            "cooldown": self.cooldown(),
+        }
+
+
+def raise_for_status(response) -> RateLimitInfo:
+    """Check status of a `httpx.Response`, returns its rate limit signals.
+
+    Raises `exceptions.RateLimitedError` on 429, `httpx.HTTPStatusError`
+    on other error statuses.
+    """
+    info = RateLimitInfo.from_headers(response.status_code, response.headers)
+    if response.status_code == 429:
+        raise exceptions.RateLimitedError(info)
+    response.raise_for_status()
+    return info
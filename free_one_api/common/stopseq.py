@@ -0,0 +1,119 @@
+"""Streaming stop sequence matching."""
+
+
+class StopMatcher:
+    """Aho-Corasick matcher of stop sequences over a stream of text chunks.
+
+    Text which may be the beginning of a stop sequence is held back until
+    the next chunk decides, so a stop sequence split across chunks is never
+    emitted partially.
+    """
+
+    goto: list[dict[str, int]]
+    """Trie transitions of every state."""
+
+    fail: list[int]
+    """Failure link of every state."""
+
+    depth: list[int]
+    """Length of the prefix every state stands for."""
+
+    out: list[int]
+    """Length of the longest stop sequence ending at every state, 0 if none."""
+
+    state: int
+
+    pending: str
+    """Held back text, always the last `depth[state]` characters read."""
+
+    def __init__(self, stops: list[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.out = [0]
+
+        for stop in stops:
+            if not stop:
+                continue
+            state = 0
+            for ch in stop:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[state] + 1)
+                    self.out.append(0)
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.out[state] = max(self.out[state], len(stop))
+
+        # breadth first, so failure links of shallower states are ready
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = max(self.out[nxt], self.out[self.fail[nxt]])
+                queue.append(nxt)
+
+        self.state = 0
+        self.pending = ""
+
+    def feed(self, text: str) -> tuple[str, bool]:
+        """Feed a chunk.
+
+        Returns:
+            str: text safe to emit.
+            bool: True if a stop sequence is found, text after it is discarded.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        state = self.state
+        offset = len(self.pending)
+
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = offset + i + 1
+                emitted = (self.pending + text[:i + 1])[:end - out[state]]
+                self.state = 0
+                self.pending = ""
+                return emitted, True
+
+        buf = self.pending + text
+        keep = self.depth[state]
+        self.state = state
+        self.pending = buf[len(buf) - keep:] if keep else ""
+        return buf[:len(buf) - keep], False
+
+    def flush(self) -> str:
+        """End of stream, returns held back text."""
+        pending = self.pending
+        self.state = 0
+        self.pending = ""
+        return pending
+
+
+if __name__ == "__main__":
+    # throughput of matching a typical completion split into small chunks
+    import time
+    import random
+    import string
+
+    text = "".join(random.choices(string.ascii_letters + " \n", k=1_000_000))
+    chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+
+    matcher = StopMatcher(["\n\nHuman:", "###", "</answer>", "<|im_end|>"])
+    start = time.perf_counter()
+    emitted = 0
+    for chunk in chunks:
+        part, stopped = matcher.feed(chunk)
+        emitted += len(part)
+        if stopped:
+            break
+    spent = time.perf_counter() - start
+    print(f"{emitted / spent / 1e6:.1f} M chars/s")
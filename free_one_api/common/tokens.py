@@ -0,0 +1,163 @@
+"""Prompt token estimation, trimming and context windows of known models."""
+import tiktoken
+
+
+PER_MESSAGE_TOKENS = 4
+"""Tokens wrapping every message, e.g. <|start|>role<|message|>...<|end|>."""
+
+REPLY_PRIMER_TOKENS = 3
+"""Every reply is primed with <|start|>assistant<|message|>."""
+
+
+KNOWN_MODELS: dict[str, tuple[int, int]] = {
+    "gpt-4o-mini": (128000, 16384),
+    "gpt-4o": (128000, 16384),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4-1106": (128000, 4096),
+    "gpt-4-0125": (128000, 4096),
+    "gpt-4-vision": (128000, 4096),
+    "gpt-4-32k": (32768, 32768),
+    "gpt-4": (8192, 8192),
+    "gpt-3.5-turbo-instruct": (4096, 4096),
+    "gpt-3.5-turbo-16k": (16385, 4096),
+    "gpt-3.5-turbo-0613": (4096, 4096),
+    "gpt-3.5-turbo-0301": (4096, 4096),
+    "gpt-3.5-turbo": (16385, 4096),
+    "claude-3": (200000, 4096),
+    "claude-2": (100000, 4096),
+    "mixtral-8x7b": (32768, 32768),
+}
+"""Model name prefix to (context window, max output tokens), longest prefix wins.
+
+A prefix only matches up to a `-` or `:`, so that `gpt-4` covers
+`gpt-4-0613` but not `gpt-4.1` or `gpt-4o`, which are other models.
+"""
+
+VARIANT_SEPARATORS = ("-", ":")
+"""Characters which may follow a prefix of `KNOWN_MODELS` in a variant name."""
+
+
+_encoding = None
+
+
+def encoding() -> tiktoken.Encoding:
+    """Encoding used for estimation, shared by all models."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_text(text: str) -> int:
+    return len(encoding().encode_ordinary(text))
+
+
+def truncate_text(text: str, max_tokens: int) -> tuple[str, int]:
+    """Keep at most `max_tokens` tokens of text, returns kept text and its tokens."""
+    encoded = encoding().encode_ordinary(text)
+    if len(encoded) <= max_tokens:
+        return text, len(encoded)
+    return encoding().decode(encoded[:max_tokens]), max_tokens
+
+
+def count_message(message: dict) -> int:
+    """Estimate tokens of a message, including its wrapping tokens."""
+    num_tokens = PER_MESSAGE_TOKENS
+    for key, value in message.items():
+        if isinstance(value, str):
+            num_tokens += count_text(value)
+        elif isinstance(value, list):  # content parts
+            for part in value:
+                if isinstance(part, dict) and isinstance(part.get("text"), str):
+                    num_tokens += count_text(part["text"])
+    return num_tokens
+
+
+def count_messages(messages: list[dict]) -> tuple[list[int], int]:
+    """Estimate tokens of messages.
+
+    Returns:
+        list[int]: tokens of every message.
+        int: prompt tokens in total, including reply primer.
+    """
+    message_tokens = [count_message(message) for message in messages]
+    return message_tokens, sum(message_tokens) + REPLY_PRIMER_TOKENS
+
+
+def context_window(model: str) -> tuple[int, int]:
+    """(context window, max output tokens) of a known model, None if unknown.
+
+    Unknown models are not filtered by context window at all, guessing
+    from an older model of the family would reject prompts which fit.
+    """
+    name = model.lower()
+    if name in KNOWN_MODELS:
+        return KNOWN_MODELS[name]
+
+    best = None
+    for prefix in KNOWN_MODELS:
+        if (
+            name.startswith(prefix)
+            and name[len(prefix)] in VARIANT_SEPARATORS
+            and (best is None or len(prefix) > len(best))
+        ):
+            best = prefix
+    return KNOWN_MODELS[best] if best is not None else None
+
+
+def min_prompt_tokens(messages: list[dict], message_tokens: list[int]) -> int:
+    """Prompt tokens left after trimming as much as possible.
+
+    System messages and the last message are never trimmed.
+    """
+    kept = sum(
+        tokens for i, (message, tokens) in enumerate(zip(messages, message_tokens))
+        if message.get("role") == "system" or i == len(messages) - 1
+    )
+    return kept + REPLY_PRIMER_TOKENS
+
+
+def trim_messages(
+    messages: list[dict],
+    message_tokens: list[int],
+    budget: int,
+) -> tuple[list[dict], list[int], int, int]:
+    """Drop the oldest non-system messages until prompt fits budget.
+
+    Uses the per-message counts only, nothing is tokenized again. Tool
+    results whose calling message is dropped are dropped with it.
+
+    Returns:
+        list[dict]: kept messages.
+        list[int]: tokens of kept messages.
+        int: amount of dropped messages.
+        int: dropped tokens.
+    """
+    total = sum(message_tokens) + REPLY_PRIMER_TOKENS
+    if total <= budget:
+        return messages, message_tokens, 0, 0
+
+    last = len(messages) - 1
+    dropped = set()
+    dropped_tokens = 0
+
+    i = 0
+    while i < last and total - dropped_tokens > budget:
+        if messages[i].get("role") != "system":
+            dropped.add(i)
+            dropped_tokens += message_tokens[i]
+
+            # tool results can't outlive their call
+            while i + 1 < last and messages[i + 1].get("role") in ("tool", "function"):
+                i += 1
+                dropped.add(i)
+                dropped_tokens += message_tokens[i]
+        i += 1
+
+    kept = [i for i in range(len(messages)) if i not in dropped]
+    return (
+        [messages[i] for i in kept],
+        [message_tokens[i] for i in kept],
+        len(dropped),
+        dropped_tokens,
+    )
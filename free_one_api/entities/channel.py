@@ -1,6 +1,7 @@
 import asyncio
 import json
 import time
+import enum
 
 import tiktoken
 
@@ -8,6 +9,21 @@ from ..models.adapter import llm
 from ..models import adapter
 from ..models.channel import evaluation
 from ..impls.channel import eval as evl
+from ..impls.channel import breaker as brk
+from ..common import clock
+
+
+class DisabledReason(enum.Enum):
+    """Why a channel is disabled, persisted."""
+
+    NONE = ""
+    """Channel is enabled."""
+
+    ADMIN = "admin"
+    """Disabled by admin, only admin can enable it."""
+
+    HEARTBEAT = "heartbeat"
+    """Disabled by heartbeat, can be recovered automatically."""
 
 
 class Channel:
@@ -24,6 +40,8 @@ class Channel:
 
     enabled: bool
 
+    disabled_reason: DisabledReason
+
     latency: int
     
     eval: evaluation.AbsChannelEvaluation
@@ -31,7 +49,22 @@ class Channel:
     fail_count: int
     """Amount of sequential failures. Only in memory."""
 
-    def __init__(self, id: int, name: str, adapter: llm.LLMLibAdapter, model_mapping: dict, enabled: bool, latency: int, eval: evaluation.AbsChannelEvaluation):
+    breaker: brk.CircuitBreaker
+    """Circuit breaker fed by real requests. Only in memory."""
+
+    ramp_started_at: float
+    """Time this channel started ramping up after recovery. Only in memory."""
+
+    ramp_duration: float
+    """Seconds to ramp traffic share up to 1. Only in memory."""
+
+    ramp_initial_share: float
+    """Traffic share at the start of ramping. Only in memory."""
+
+    cooldown_until: float
+    """Channel is not selected until this time, set by upstream rate limits. Only in memory."""
+
+    def __init__(self, id: int, name: str, adapter: llm.LLMLibAdapter, model_mapping: dict, enabled: bool, latency: int, eval: evaluation.AbsChannelEvaluation, disabled_reason: DisabledReason=DisabledReason.NONE):
         self.id = id
         self.name = name
         self.adapter = adapter
@@ -39,8 +72,14 @@ class Channel:
         self.enabled = enabled
         self.latency = latency
         self.eval = eval
+        self.disabled_reason = disabled_reason
         
         self.fail_count = 0
+        self.breaker = brk.CircuitBreaker()
+        self.ramp_started_at = 0.0
+        self.ramp_duration = 0.0
+        self.ramp_initial_share = 1.0
+        self.cooldown_until = 0.0
 
     @classmethod
     def dump_channel(cls, chan: 'Channel') -> dict:
@@ -50,6 +89,7 @@ class Channel:
             "adapter": adapter.dump_adapter(chan.adapter),
             "model_mapping": chan.model_mapping,
             "enabled": chan.enabled,
+            "disabled_reason": chan.disabled_reason.value,
             "latency": chan.latency,
         }
 
@@ -65,6 +105,7 @@ class Channel:
             data["enabled"],
             data["latency"],
             eval,
+            DisabledReason(data.get("disabled_reason") or ""),
         )
 
     def count_tokens(
@@ -85,7 +126,7 @@ class Channel:
         return num_tokens
     
     async def heartbeat(self, timeout: int=300) -> int:
-        """Call adapter test, returns fail count.
+        """Call adapter probe, returns fail count.
     
         Args:
             timeout: Maximum time to wait for response in seconds
@@ -95,7 +136,7 @@ class Channel:
         """
         try:
             start = time.time()
-            succ, err = await asyncio.wait_for(self.adapter.test(), timeout=timeout)
+            succ, err = await asyncio.wait_for(self.adapter.probe(), timeout=timeout)
             if succ:
                 latency = int((time.time() - start)*100)/100
                 self.fail_count = 0
@@ -123,6 +164,28 @@ class Channel:
         """
         self.fail_count = chan1.fail_count
         self.eval = chan1.eval
+        self.breaker = chan1.breaker
+        self.ramp_started_at = chan1.ramp_started_at
+        self.ramp_duration = chan1.ramp_duration
+        self.ramp_initial_share = chan1.ramp_initial_share
+        self.cooldown_until = chan1.cooldown_until
+
+    def start_ramp(self, duration: float, initial_share: float):
+        """Start ramping traffic share up from initial share."""
+        self.ramp_started_at = clock.now()
+        self.ramp_duration = duration
+        self.ramp_initial_share = initial_share
+
+    def traffic_share(self) -> float:
+        """Share of traffic this channel should take, 1 if not ramping."""
+        if self.ramp_duration <= 0:
+            return 1.0
+
+        progress = (clock.now() - self.ramp_started_at) / self.ramp_duration
+        if progress >= 1:
+            return 1.0
+
+        return self.ramp_initial_share + (1 - self.ramp_initial_share) * progress
 
     def __repr__(self) -> str:
         return f"<Channel {self.id} {self.name}>"
@@ -0,0 +1,59 @@
+import time
+import uuid
+
+
+class Conversation:
+    """Conversation history stored by the proxy.
+
+    Clients send only the new turn with its id, the proxy sends the whole
+    history upstream.
+    """
+
+    id: str
+
+    owner: int
+    """Id of the API key which created this conversation, only it can continue it."""
+
+    messages: list[dict]
+    """OpenAI GPT style message list, including replies."""
+
+    message_tokens: list[int]
+    """Estimated tokens of every message, kept so history is never counted again."""
+
+    size: int
+    """Size of messages serialized as JSON, in bytes."""
+
+    created_at: float
+
+    updated_at: float
+
+    def __init__(
+        self,
+        id: str,
+        owner: int,
+        messages: list[dict],
+        message_tokens: list[int],
+        size: int,
+        created_at: float,
+        updated_at: float,
+    ):
+        self.id = id
+        self.owner = owner
+        self.messages = messages
+        self.message_tokens = message_tokens
+        self.size = size
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def make_new(cls, owner: int) -> 'Conversation':
+        now = time.time()
+        return cls(
+            id=f"conv-{uuid.uuid4().hex}",
+            owner=owner,
+            messages=[],
+            message_tokens=[],
+            size=2,
+            created_at=now,
+            updated_at=now,
+        )
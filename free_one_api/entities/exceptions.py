@@ -22,3 +22,14 @@ class QueryHandlingError(Exception):
         self.message = message
         self.type = type
         self.param = param
+
+
+class RateLimitedError(Exception):
+    """Raised by adapters when upstream responds 429."""
+
+    info: 'ratelimit.RateLimitInfo'
+    """Rate limit signals of the response, see `common.ratelimit`."""
+
+    def __init__(self, info):
+        self.info = info
+        super().__init__(f"Upstream rate limited, cooldown {info.cooldown():.1f}s")
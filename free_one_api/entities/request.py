@@ -16,14 +16,114 @@ class Request:
     stream: bool
     """True if this is a streaming request, processed by http interface level."""
 
+    raw_body: bytes
+    """Raw request body from client, for passthrough to OpenAI compatible upstreams."""
+
+    session_key: str
+    """Client provided session identifier, for affinity routing."""
+
+    sticky: bool
+    """True if the channel of this request is selected by affinity routing."""
+
+    max_tokens: int
+    """Maximum completion tokens requested by client, None if not set."""
+
+    stop: list[str]
+    """Stop sequences requested by client, None if not set."""
+
+    n: int
+    """Amount of choices requested by client."""
+
+    choice_index: int
+    """Index of the choice this request generates, when choices are fanned out."""
+
+    excluded_channels: set[int]
+    """Channels avoided by channel manager unless no other can serve, to spread choices."""
+
+    message_tokens: list[int]
+    """Estimated tokens of every message, None until counted by channel manager."""
+
+    prompt_tokens: int
+    """Estimated prompt tokens, None until counted by channel manager."""
+
+    owner: str
+    """Raw API key of the client, only it can resume the streamed response."""
+
+    resumable: bool
+    """True if client asked for a resumable stream, False if it refused, None for configured default."""
+
+    trim: bool
+    """True if oldest messages may be dropped to fit the context window of selected channel."""
+
+    trimmed_messages: int
+    """Amount of messages dropped by trimming."""
+
+    trimmed_tokens: int
+    """Estimated tokens dropped by trimming."""
+
+    conversation: 'conversation.Conversation'
+    """Stored conversation this request continues, None if client sent the whole history."""
+
+    turn_messages: list[dict[str, str]]
+    """Messages sent by client in this turn of a stored conversation."""
+
+    turn_tokens: list[int]
+    """Estimated tokens of every message of this turn."""
+
+    history_hash: bytes
+    """Hash of messages, None until computed by channel manager."""
+
+    continuation: dict
+    """Upstream handle of the conversation to continue, None to send whole history."""
+
+    continued_messages: int
+    """Amount of leading messages upstream already has when continuing."""
+
+    next_continuation: dict
+    """Upstream handle of the conversation including this reply, set by adapters supporting continuation."""
+
+    rate_limit: 'ratelimit.RateLimitInfo'
+    """Rate limit signals of the upstream response to this request, set by adapters."""
+
     def __init__(
         self,
         model: str,
         messages: list[dict[str, str]],
         functions: list[dict[str, str]],
         stream: bool=False,
+        session_key: str=None,
+        raw_body: bytes=None,
+        max_tokens: int=None,
+        trim: bool=False,
+        stop: list[str]=None,
+        n: int=1,
+        owner: str=None,
+        resumable: bool=None,
     ):
         self.model = model
         self.messages = messages
         self.functions = functions
         self.stream = stream
+        self.session_key = session_key
+        self.raw_body = raw_body
+        self.sticky = False
+        self.max_tokens = max_tokens
+        self.stop = stop
+        self.n = n
+        self.owner = owner
+        self.resumable = resumable
+        self.choice_index = 0
+        self.excluded_channels = None
+        self.message_tokens = None
+        self.prompt_tokens = None
+        self.trim = trim
+        self.trimmed_messages = 0
+        self.trimmed_tokens = 0
+        self.conversation = None
+        self.turn_messages = None
+        self.turn_tokens = None
+        self.history_hash = None
+        self.continuation = None
+        self.continued_messages = 0
+        self.next_continuation = None
+        self.rate_limit = None
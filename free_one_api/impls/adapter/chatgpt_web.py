@@ -5,6 +5,7 @@ from ...models.adapter import llm
 from ...entities import request
 from ...entities import response, exceptions
 from ...models.channel import evaluation
+from ...common import stream, ratelimit
 
 
 @adapter.llm_adapter
@@ -40,7 +41,10 @@ class ChatGPTWebAdapter(llm.LLMLibAdapter):
     "url": "your_chat_url",
     "models": "Optional. Default is 'gpt-3.5-turbo'.
 It should be a list of available models in this API, separated by commas without spaces. 
-For example: 'gpt4,gpt-4-o,gpt-4-turbo'
+For example: 'gpt4,gpt-4-o,gpt-4-turbo'",
+    "continuation": "Optional. Default is false.
+Set to true to continue conversations kept by chatgpt-web (conversationId/parentMessageId),
+only new messages are sent. chatgpt-web keeps them in memory, don't enable it if it restarts often."
 }
 """
 
@@ -48,6 +52,9 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
     def supported_path(cls) -> str:
         return "/v1/chat/completions"
 
+    def continuation_supported(self) -> bool:
+        return bool(self.config.get("continuation", False))
+
     def __init__(self, config: dict, eval: evaluation.AbsChannelEvaluation):
         self.config = config
         self.eval = eval
@@ -57,12 +64,20 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         return f"{formatted}\nAssistant:"
 
     async def test(self) -> typing.Union[bool, str]:
+        return await self.check("Hi, respond 'Hello, world!' please.", 4000)
+
+    async def probe(self) -> typing.Union[bool, str]:
+        """Request a 1-token completion."""
+        return await self.check("Hi", 1)
+
+    async def check(self, content: str, max_tokens: int) -> typing.Union[bool, str]:
+        """Query content and check if upstream responds."""
         try:
             async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
                 api_url = self.config["url"]
                 models = self.supported_models()
                 model = "gpt-3.5-turbo" if "gpt-3.5-turbo" in models else random.choice(models)
-                messages = [{"role": "user", "content": "Hi, respond 'Hello, world!' please."}]
+                messages = [{"role": "user", "content": content}]
                 headers = {
                     'Accept': 'application/json, text/plain, */*',
                     'Content-Type': 'application/json',
@@ -78,19 +93,16 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
                     "presence_penalty": 0,
                     "frequency_penalty": 0,
                     "top_p": 1,
-                    "max_tokens": 4000,
+                    "max_tokens": max_tokens,
                     "user": str(uuid.uuid4())
                 }
                 answer = ""
                 async with client.stream("POST", f"{api_url}/api/chat-process", json=data, headers=headers) as model_response:
-                    model_response.raise_for_status()
-                    async for line in model_response.aiter_lines():
-                        if line:
-                            line = ujson.loads(line)
-                            if "detail" not in line:
-                                raise RuntimeError(f"Response: {{line}}")
-                            if content := line["detail"]["choices"][0]["delta"].get("content"):
-                                answer+=content
+                    ratelimit.raise_for_status(model_response)
+                    async for line in stream.aiter_ndjson(model_response.aiter_bytes()):
+                        content, _ = stream.chat_chunk_delta(line, unwrap="detail")
+                        if content:
+                            answer+=content
 
             return True, ""
         except Exception as e:
@@ -101,6 +113,12 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         model = req.model
         api_url = self.config["url"]
 
+        options = dict()
+        if req.continuation is not None:
+            # chatgpt-web has the history, send the new turn only
+            messages = messages[req.continued_messages:]
+            options = dict(req.continuation)
+
         async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
             headers = {
                 'Accept': 'application/json, text/plain, */*',
@@ -111,7 +129,7 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
             data = {
                 "prompt": await self.format_prompt(messages),
                 "model": model,
-                "options": dict(),
+                "options": options,
                 "systemMessage": "You are ChatGPT. Respond in the language the user is speaking to you. Use markdown formatting in your response.",
                 "temperature": 0.9,
                 "presence_penalty": 0,
@@ -122,19 +140,28 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
             }
             random_int = random.randint(0, 1000000000)
             async with client.stream("POST", f"{api_url}/api/chat-process", json=data, headers=headers) as model_response:
-                model_response.raise_for_status()
-                async for line in model_response.aiter_lines():
-                    if line:
-                        line = ujson.loads(line)
-                        if "detail" not in line:
-                            raise RuntimeError(f"Response: {{line}}")
-                        if content := line["detail"]["choices"][0]["delta"].get("content"):
-                            yield response.Response(
-                                id=random_int,
-                                finish_reason=response.FinishReason.NULL,
-                                normal_message=content,
-                                function_call=None
-                            )
+                req.rate_limit = ratelimit.raise_for_status(model_response)
+                last_line = None
+                async for line in stream.aiter_ndjson(model_response.aiter_bytes()):
+                    last_line = line
+                    content, _ = stream.chat_chunk_delta(line, unwrap="detail")
+                    if content:
+                        yield response.Response(
+                            id=random_int,
+                            finish_reason=response.FinishReason.NULL,
+                            normal_message=content,
+                            function_call=None
+                        )
+
+                if self.continuation_supported() and last_line is not None:
+                    # every line carries ids of the reply, decode only the last one
+                    last = ujson.loads(last_line)
+                    if last.get("conversationId") and last.get("id"):
+                        req.next_continuation = {
+                            "conversationId": last["conversationId"],
+                            "parentMessageId": last["id"],
+                        }
+
                 yield response.Response(
                     id=random_int,
                     finish_reason=response.FinishReason.STOP,
@@ -5,6 +5,7 @@ from ...models.adapter import llm
 from ...entities import request
 from ...entities import response, exceptions
 from ...models.channel import evaluation
+from ...common import stream, ratelimit
 
 
 @adapter.llm_adapter
@@ -41,7 +42,14 @@ class GPTAdapter(llm.LLMLibAdapter):
     "url": "your_openai_api_base",
     "models": "Optional. Default is 'gpt-3.5-turbo'.
 It should be a list of available models in this API, separated by commas without spaces. 
-For example: 'gpt4,gpt-4-o,gpt-4-turbo'
+For example: 'gpt4,gpt-4-o,gpt-4-turbo'",
+    "embedding_models": "Optional. Embedding models of this API served on /v1/embeddings, separated by commas without spaces.
+For example: 'text-embedding-3-small,text-embedding-3-large'",
+    "embeddings_url": "Optional. Default is url with /chat/completions replaced by /embeddings.",
+    "passthrough": "Optional. Default is false.
+Set to true if the API is fully OpenAI compatible, requests and responses are forwarded as is.",
+    "context_windows": "Optional. Context window of models unknown to free-one-api or served with a smaller window,
+e.g. {"my-model": 8192} or {"my-model": [32768, 4096]} for [context window, max output tokens]."
 }
 """
 
@@ -49,6 +57,24 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
     def supported_path(cls) -> str:
         return "/v1/chat/completions"
 
+    def passthrough_supported(self) -> bool:
+        return bool(self.config.get("passthrough", False))
+
+    def embedding_supported(self) -> bool:
+        return len(self.embedding_models()) > 0
+
+    def embedding_models(self) -> list[str]:
+        models_string = self.config.get("embedding_models", "")
+        return [model for model in models_string.split(",") if model]
+
+    def embeddings_url(self) -> str:
+        if self.config.get("embeddings_url"):
+            return self.config["embeddings_url"]
+        api_url = self.config["url"].rstrip("/")
+        if api_url.endswith("/chat/completions"):
+            api_url = api_url[:-len("/chat/completions")]
+        return api_url + "/embeddings"
+
     def __init__(self, config: dict, eval: evaluation.AbsChannelEvaluation):
         self.config = config
         self.eval = eval
@@ -75,11 +101,25 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         except Exception as e:
             return False, str(e)
 
-    async def create_completion_data(self, chunk):
+    async def probe(self) -> typing.Union[bool, str]:
+        """List models instead of a completion if url is a standard OpenAI path."""
+        api_url = self.config["url"]
+        if not api_url.rstrip("/").endswith("/chat/completions"):
+            return await self.test()
+
         try:
-            return ujson.loads(chunk)
-        except ValueError as e:
-            raise ValueError(f"Error loading JSON from chunk: {e}\nChunk: {chunk}")
+            models_url = api_url.rstrip("/")[:-len("/chat/completions")] + "/models"
+            api_key = self.config["key"]
+            headers = {
+                "Authorization": f"Bearer {api_key}"
+            }
+            async with httpx.AsyncClient() as client:
+                response = await client.get(models_url, headers=headers, timeout=None)
+                response.raise_for_status()
+
+            return True, ""
+        except Exception as e:
+            return False, str(e)
 
     async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:        
         messages = req.messages
@@ -96,35 +136,59 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
                 "messages": messages,
                 "stream": True
             }
+            if req.max_tokens is not None:
+                data["max_tokens"] = req.max_tokens
+            if req.stop:
+                data["stop"] = req.stop
             async with client.stream("POST", self.config["url"], json=data, headers=headers) as model_response:
-                model_response.raise_for_status()
-                async for line in model_response.aiter_lines():
-                    if line:
-                        line_content = line[6:]
-                        if line_content == "[DONE]":
-                            yield response.Response(
-                                id=random_int,
-                                finish_reason=response.FinishReason.STOP,
-                                normal_message="",
-                                function_call=None
-                            )
-                            break
-                        try:
-                            chunk = await self.create_completion_data(line_content)
-                            if chunk["choices"][0]["finish_reason"]=="stop":
-                                yield response.Response(
-                                    id=random_int,
-                                    finish_reason=response.FinishReason.NULL,
-                                    normal_message=text,
-                                    function_call=None
-                                )
-                            else:
-                                text = chunk["choices"][0]["delta"]["content"]
-                                yield response.Response(
-                                    id=random_int,
-                                    finish_reason=response.FinishReason.NULL,
-                                    normal_message=text,
-                                    function_call=None
-                                )
-                        except ValueError as e:
-                            raise ValueError(f"JSON decoding error: {e}\nLine content: {line_content}")
+                req.rate_limit = ratelimit.raise_for_status(model_response)
+                finish_reason = None
+                async for text, reason in stream.aiter_chat_deltas(model_response.aiter_bytes()):
+                    if reason:
+                        finish_reason = reason
+                    if text:
+                        yield response.Response(
+                            id=random_int,
+                            finish_reason=response.FinishReason.NULL,
+                            normal_message=text,
+                            function_call=None
+                        )
+                yield response.Response(
+                    id=random_int,
+                    finish_reason=response.FinishReason.LENGTH if finish_reason == "length" else response.FinishReason.STOP,
+                    normal_message="",
+                    function_call=None
+                )
+
+    async def passthrough(self, req: request.Request, body: bytes) -> typing.AsyncGenerator[bytes, None]:
+        api_key = self.config["key"]
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        async with httpx.AsyncClient(timeout=None) as client:
+            async with client.stream("POST", self.config["url"], content=body, headers=headers) as model_response:
+                req.rate_limit = ratelimit.raise_for_status(model_response)
+                async for chunk in model_response.aiter_bytes():
+                    yield chunk
+
+    async def embed(self, model: str, inputs: list, options: dict) -> tuple[list, int, ratelimit.RateLimitInfo]:
+        api_key = self.config["key"]
+        headers = {
+            "Authorization": f"Bearer {api_key}"
+        }
+        data = {
+            **options,
+            "model": model,
+            "input": inputs,
+        }
+        async with httpx.AsyncClient(timeout=None) as client:
+            model_response = await client.post(self.embeddings_url(), json=data, headers=headers)
+            info = ratelimit.raise_for_status(model_response)
+            response_data = model_response.json()
+
+        items = sorted(response_data["data"], key=lambda item: item["index"])
+        if len(items) != len(inputs):
+            raise ValueError(f"Upstream returned {len(items)} embeddings for {len(inputs)} inputs")
+        usage = response_data.get("usage") or {}
+        return [item["embedding"] for item in items], usage.get("prompt_tokens", 0), info
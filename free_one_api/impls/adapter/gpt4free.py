@@ -9,6 +9,7 @@ from ...models.adapter import llm
 from ...entities import request
 from ...entities import response, exceptions
 from ...models.channel import evaluation
+from ...common import stream, ratelimit
 
 @adapter.llm_adapter
 class GPT4FreeAdapter(llm.LLMLibAdapter):
@@ -43,7 +44,10 @@ class GPT4FreeAdapter(llm.LLMLibAdapter):
     "url": "your_chat_url",
     "models": "Optional. Default is 'gpt-3.5-turbo'.
 It should be a list of available models in this API, separated by commas without spaces. 
-For example: 'gpt4,gpt-4-o,gpt-4-turbo'
+For example: 'gpt4,gpt-4-o,gpt-4-turbo'",
+    "continuation": "Optional. Default is false.
+Set to true to keep one conversation_id per conversation and send only new messages.
+Only for providers which keep history by conversation_id."
 }
 """
 
@@ -51,10 +55,25 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
     def supported_path(cls) -> str:
         return "/v1/chat/completions"
 
+    def continuation_supported(self) -> bool:
+        return bool(self.config.get("continuation", False))
+
     def __init__(self, config: dict, eval: evaluation.AbsChannelEvaluation):
         self.config = config
         self.eval = eval
 
+    def line_content(self, line: bytes) -> str:
+        """Get content of a stream line, None if it is not a content line."""
+        if line.startswith(b'{"type": "content"'):
+            text = stream.fast_string(line, b'"content": "')
+            if text is not None:
+                return text
+
+        line_data = ujson.loads(line)
+        if line_data.get("type") == "content":
+            return line_data.get("content", "")
+        return None
+
     async def test(self) -> typing.Union[bool, str]:
         try:
             api_url = self.config["url"]
@@ -86,12 +105,9 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
 
             async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
                 async with client.stream("POST", f"{api_url}/backend-api/v2/conversation", json=data, headers=headers) as model_response:
-                    model_response.raise_for_status()
-                    async for line in model_response.aiter_lines():
-                        if line:
-                            line_data = ujson.loads(line)
-                            if line_data.get("type") == "content":
-                                answer += line_data.get("content", "")
+                    ratelimit.raise_for_status(model_response)
+                    async for line in stream.aiter_ndjson(model_response.aiter_bytes()):
+                        answer += self.line_content(line) or ""
 
             if answer == "":
                 return False, "Gpt4free test failed."
@@ -107,6 +123,11 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         unique_id = str(uuid.uuid4())
         api_url = self.config["url"]
 
+        if req.continuation is not None:
+            # upstream has the history, send the new turn only
+            messages = messages[req.continued_messages:]
+            unique_id = req.continuation["conversation_id"]
+
         async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
             headers = {
                 'Accept-Language': 'ru-RU',
@@ -132,18 +153,18 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
             }
             try:
                 async with client.stream("POST", f"{api_url}/backend-api/v2/conversation", json=data, headers=headers) as model_response:
-                    model_response.raise_for_status()
-                    async for line in model_response.aiter_lines():
-                        if line:
-                            line_data = ujson.loads(line)
-                            if line_data.get("type") == "content":
-                                text = line_data.get("content", "")
-                                yield response.Response(
-                                    id=random_int,
-                                    finish_reason=response.FinishReason.NULL,
-                                    normal_message=text,
-                                    function_call=None
-                                )
+                    req.rate_limit = ratelimit.raise_for_status(model_response)
+                    async for line in stream.aiter_ndjson(model_response.aiter_bytes()):
+                        text = self.line_content(line)
+                        if text is not None:
+                            yield response.Response(
+                                id=random_int,
+                                finish_reason=response.FinishReason.NULL,
+                                normal_message=text,
+                                function_call=None
+                            )
+                    if self.continuation_supported():
+                        req.next_continuation = {"conversation_id": unique_id}
                     yield response.Response(
                         id=random_int,
                         finish_reason=response.FinishReason.STOP,
@@ -1,6 +1,11 @@
 import typing
 import uuid
 import random
+import time
+import asyncio
+import functools
+import threading
+import concurrent.futures
 
 import requests
 
@@ -14,9 +19,237 @@ from ...entities import response, exceptions
 from ...models.channel import evaluation
 
 
+_END = object()
+"""End of a bridged stream."""
+
+
+class HuggingChatAccount:
+    """A HuggingChat account and its logged in chatbot.
+
+    Methods of this class are blocking, run them in the executor.
+    """
+
+    email: str
+
+    passwd: str
+
+    chatbot: hugchat.ChatBot
+
+    model_names: list[str]
+    """Remote models of this account, index is used for switching model."""
+
+    def __init__(self, email: str, passwd: str):
+        self.email = email
+        self.passwd = passwd
+        self.chatbot = None
+        self.model_names = []
+        # chatbot switches model by its shared state
+        self.lock = threading.Lock()
+
+    def login(self) -> hugchat.ChatBot:
+        """Login if not logged in, cookies are persisted under `data/hugchatCookies`."""
+        with self.lock:
+            if self.chatbot is None:
+                sign = login.Login(self.email, self.passwd)
+                cookie: requests.sessions.RequestsCookieJar = None
+                try:
+                    cookie = sign.loadCookiesFromDir("data/hugchatCookies")
+                except:
+                    cookie = sign.login()
+                    sign.saveCookiesToDir("data/hugchatCookies")
+
+                self.chatbot = hugchat.ChatBot(cookies=cookie.get_dict())
+            return self.chatbot
+
+    def refresh_models(self) -> list[str]:
+        """Fetch remote models."""
+        chatbot = self.login()
+        self.model_names = [model.name for model in chatbot.get_remote_llms()]
+        return self.model_names
+
+    def new_conversation(self, model: str) -> str:
+        """Create a conversation of model, current model of chatbot is used if model is unknown."""
+        chatbot = self.login()
+        with self.lock:
+            if model in self.model_names:
+                chatbot.switch_llm(self.model_names.index(model))
+            return chatbot.new_conversation()
+
+    def delete_conversation(self, conversation_id: str):
+        """Delete a conversation."""
+        self.login().delete_conversation(conversation_id)
+
+    def query(self, conversation_id: str, text: str) -> typing.Iterator[dict]:
+        """Stream reply of text in a conversation.
+
+        Chatbot sends to its current conversation, so switching to the
+        conversation holds the lock until the first item arrived, i.e. the
+        query was sent. The rest of the stream is read without it.
+        """
+        chatbot = self.login()
+        with self.lock:
+            chatbot.change_conversation(conversation_id)
+            stream = iter(chatbot.query(text=text, stream=True))
+            first = next(stream, _END)
+
+        if first is _END:
+            return
+        yield first
+        yield from stream
+
+
+class ConversationPool:
+    """Pre-created conversations per model and account.
+
+    A request checks out a conversation exclusively, the conversation is
+    deleted after use and a new one is created in background.
+    """
+
+    adapter: 'HuggingChatAdapter'
+
+    idle: dict[str, asyncio.Queue]
+    """Model to queue of idle (account, conversation id)."""
+
+    members: dict[tuple[str, str], int]
+    """(model, email) to amount of conversations idle, in use or being created."""
+
+    checkouts: int
+    """Amount of checkouts."""
+
+    checkout_wait: float
+    """Total seconds waited by checkouts."""
+
+    recycled: int
+    """Amount of conversations deleted after use."""
+
+    closed: bool
+    """True once the adapter is closed, conversations are deleted instead of pooled."""
+
+    def __init__(self, adapter: 'HuggingChatAdapter'):
+        self.adapter = adapter
+        self.idle = {}
+        self.members = {}
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.recycled = 0
+        self.closed = False
+        self.created_at = time.time()
+
+    def _queue(self, model: str) -> asyncio.Queue:
+        if model not in self.idle:
+            self.idle[model] = asyncio.Queue()
+        return self.idle[model]
+
+    def fill(self, model: str):
+        """Create conversations in background until pool of model is full."""
+        if self.closed:
+            return
+        loop = asyncio.get_running_loop()
+
+        for account in self.adapter.accounts:
+            key = (model, account.email)
+            while self.members.get(key, 0) < self.adapter.pool_size:
+                self.members[key] = self.members.get(key, 0) + 1
+                loop.create_task(self._create(model, account))
+
+    async def _create(self, model: str, account: HuggingChatAccount):
+        try:
+            conversation_id = await self.adapter.run_blocking(account.new_conversation, model)
+        except Exception as e:
+            self.members[(model, account.email)] -= 1
+            print(f"Error creating HuggingChat conversation for {account.email}: {str(e)}")
+            return
+        if self.closed:
+            self.members[(model, account.email)] -= 1
+            self._delete(account, conversation_id)
+            return
+        self._queue(model).put_nowait((account, conversation_id))
+
+    def _delete(self, account: HuggingChatAccount, conversation_id: str):
+        async def delete():
+            try:
+                await self.adapter.run_blocking(account.delete_conversation, conversation_id)
+            except Exception as e:
+                print(f"Error deleting HuggingChat conversation for {account.email}: {str(e)}")
+
+        asyncio.get_running_loop().create_task(delete())
+
+    async def checkout(self, model: str) -> tuple[HuggingChatAccount, str]:
+        """Check out an idle conversation of model exclusively."""
+        if self.closed:
+            raise ValueError("Huggingchat error: adapter is closed.")
+        self.fill(model)
+
+        start = time.time()
+        try:
+            item = await asyncio.wait_for(self._queue(model).get(), timeout=self.adapter.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise ValueError("Huggingchat error: no conversation available.")
+
+        self.checkouts += 1
+        self.checkout_wait += time.time() - start
+        return item
+
+    def recycle(self, model: str, account: HuggingChatAccount, conversation_id: str):
+        """Delete a used conversation and create a new one in background."""
+        self.recycled += 1
+        self.members[(model, account.email)] -= 1
+        self._delete(account, conversation_id)
+        self.fill(model)
+
+    def close(self):
+        """Delete idle conversations, stop creating new ones.
+
+        Checked out conversations are deleted when their requests finish.
+        """
+        self.closed = True
+        for model, queue in self.idle.items():
+            while not queue.empty():
+                account, conversation_id = queue.get_nowait()
+                self.members[(model, account.email)] -= 1
+                self._delete(account, conversation_id)
+
+    def get_stats(self) -> dict:
+        """Get pool size, checkout wait time and recycle rate."""
+        minutes = max((time.time() - self.created_at) / 60, 1 / 60)
+        return {
+            "pool_size": self.adapter.pool_size,
+            "accounts": len(self.adapter.accounts),
+            "idle": {model or "": queue.qsize() for model, queue in self.idle.items()},
+            "checkouts": self.checkouts,
+            "avg_checkout_wait": self.checkout_wait / self.checkouts if self.checkouts else None,
+            "recycled": self.recycled,
+            "recycle_per_minute": self.recycled / minutes,
+        }
+
+
 @adapter.llm_adapter
 class HuggingChatAdapter(llm.LLMLibAdapter):
 
+    max_workers: int = 16
+    """Threads running logins, model lists and conversation creation and deletion."""
+
+    stream_workers: int = 16
+    """Threads iterating token streams, separate so that long streams can't
+    starve logins and pool refills."""
+
+    queue_size: int = 64
+    """Tokens buffered between client thread and event loop, the thread
+    blocks if the buffer is full."""
+
+    models_ttl: int = 600
+    """Seconds before cached remote model list is refreshed."""
+
+    pool_size: int = 2
+    """Idle conversations kept per model and account."""
+
+    checkout_timeout: int = 60
+    """Seconds to wait for an idle conversation."""
+
+    _executor: concurrent.futures.ThreadPoolExecutor = None
+
+    _stream_executor: concurrent.futures.ThreadPoolExecutor = None
+
     @classmethod
     def name(cls) -> str:
         return "Huggingface/hugging-chat"
@@ -26,15 +259,19 @@ class HuggingChatAdapter(llm.LLMLibAdapter):
         return "Use Huggingface/hugging-chat to access reverse engineering huggingchat."
 
     def supported_models(self) -> list[str]:
-        models = self.chatbot.get_remote_llms()
-        model_names = [model.name for model in models]
-        return model_names
+        """Return last fetched remote models, refreshed in background if expired."""
+        if time.time() - self._models_updated_at > self.models_ttl and self._models_refreshing is None:
+            try:
+                self._models_refreshing = asyncio.get_running_loop().create_task(self._refresh_models_background())
+            except RuntimeError:  # no running loop
+                pass
+        return self._models
 
     def function_call_supported(self) -> bool:
         return False
 
     def stream_mode_supported(self) -> bool:
-        return True    
+        return True
 
     def multi_round_supported(self) -> bool:
         return True
@@ -49,6 +286,15 @@ class HuggingChatAdapter(llm.LLMLibAdapter):
     "passwd": "your password"
 }
 
+Or several accounts to share the load of this channel:
+
+{
+    "accounts": [
+        {"email": "your email", "passwd": "your password"},
+        {"email": "another email", "passwd": "another password"}
+    ]
+}
+
 Please refer to https://github.com/Soulter/hugging-chat-api
 """
 
@@ -56,45 +302,169 @@ Please refer to https://github.com/Soulter/hugging-chat-api
     def supported_path(self) -> str:
         return "/v1/chat/completions"
 
-    _chatbot: hugchat.ChatBot = None
-
-    @property
-    def chatbot(self) -> hugchat.ChatBot:
-        if self._chatbot is None:
-            sign = login.Login(self.config['email'], self.config['passwd'])
-            cookie: requests.sessions.RequestsCookieJar = None
-            try:
-                cookie = sign.loadCookiesFromDir("data/hugchatCookies")
-            except:
-                cookie = sign.login()
-                sign.saveCookiesToDir("data/hugchatCookies")
+    @classmethod
+    def executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        """Executor shared by all HuggingChat channels."""
+        if HuggingChatAdapter._executor is None:
+            HuggingChatAdapter._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=cls.max_workers,
+                thread_name_prefix="hugchat",
+            )
+        return HuggingChatAdapter._executor
 
-            self._chatbot = hugchat.ChatBot(cookies=cookie.get_dict())
-        return self._chatbot
+    @classmethod
+    def stream_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        """Executor iterating token streams of all HuggingChat channels."""
+        if HuggingChatAdapter._stream_executor is None:
+            HuggingChatAdapter._stream_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=cls.stream_workers,
+                thread_name_prefix="hugchat-stream",
+            )
+        return HuggingChatAdapter._stream_executor
 
     def __init__(self, config: dict, eval: evaluation.AbsChannelEvaluation):
         self.config = config
         self.eval = eval
 
+        accounts = config.get("accounts") or [{"email": config["email"], "passwd": config["passwd"]}]
+        self.accounts = [HuggingChatAccount(acc["email"], acc["passwd"]) for acc in accounts]
+        self.pool = ConversationPool(self)
+
+        self._models: list[str] = []
+        self._models_updated_at: float = 0
+        self._models_refreshing: asyncio.Task = None
+
+    async def run_blocking(self, func: typing.Callable, *args, **kwargs):
+        """Run blocking function in the executor."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor(),
+            functools.partial(func, *args, **kwargs),
+        )
+
+    async def start(self):
+        """Fetch remote model list, so the channel is selectable once loaded."""
+        try:
+            await self.refresh_models()
+        except Exception as e:
+            print(f"Error fetching HuggingChat models: {str(e)}")
+
+    async def close(self):
+        """Delete pooled conversations of the replaced channel."""
+        self.pool.close()
+
+    async def refresh_models(self) -> list[str]:
+        """Fetch remote model list in the executor and cache it.
+
+        The list of the first account answering is used. If every account
+        fails, the last fetched list is kept and the error is raised.
+        """
+        results = await asyncio.gather(*[
+            self.run_blocking(account.refresh_models) for account in self.accounts
+        ], return_exceptions=True)
+
+        models = [result for result in results if not isinstance(result, Exception)]
+        if not models:
+            # retry in a minute rather than on every channel selection
+            self._models_updated_at = time.time() - self.models_ttl + 60
+            raise results[0]
+
+        self._models = models[0]
+        self._models_updated_at = time.time()
+        return self._models
+
+    async def _refresh_models_background(self):
+        try:
+            await self.refresh_models()
+        except Exception as e:
+            print(f"Error refreshing HuggingChat models: {str(e)}")
+        finally:
+            self._models_refreshing = None
+
+    async def stream_blocking(self, gen_factory: typing.Callable[[], typing.Iterable]) -> typing.AsyncGenerator:
+        """Iterate a blocking generator in the executor.
+
+        Items are passed to event loop through a bounded queue, None items are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+
+        def put(item) -> bool:
+            fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    fut.result(timeout=1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stopped.is_set():
+                        fut.cancel()
+                        return False
+
+        def produce():
+            try:
+                for item in gen_factory():
+                    if stopped.is_set():
+                        return
+                    if item is None:
+                        continue
+                    if not put(item):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                if not stopped.is_set():
+                    put(_END)
+
+        loop.run_in_executor(self.stream_executor(), produce)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            # unblock producer waiting on a full queue
+            while not queue.empty():
+                queue.get_nowait()
+
+    def get_stats(self) -> dict:
+        return self.pool.get_stats()
+
+    async def query_conversation(self, model: str, prompt: str) -> typing.AsyncGenerator[str, None]:
+        """Query prompt with a pooled conversation of model, yields tokens."""
+        account, conversation_id = await self.pool.checkout(model)
+        try:
+            async for data in self.stream_blocking(lambda: account.query(conversation_id, prompt)):
+                yield data["token"]
+        finally:
+            self.pool.recycle(model, account, conversation_id)
+
+    async def probe(self) -> typing.Union[bool, str]:
+        """Fetch remote models, which also checks the login of every account."""
+        try:
+            await self.refresh_models()
+            return True, ""
+        except Exception as e:
+            return False, f"Huggingchat error: {e}"
+
     async def test(self) -> typing.Union[bool, str]:
-        conversation_id = None
         try:
-            conversation_id = self.chatbot.new_conversation()
-            self.chatbot.change_conversation(conversation_id)
+            models = await self.refresh_models()
+            model = models[0] if models else None
+
             answer = ""
-            for data in self.chatbot.query("Hi, respond 'Hello, world!' please.", stream=True):
-                if data is None:
-                    continue
-                answer+=data["token"]
+            async for token in self.query_conversation(model, "Hi, respond 'Hello, world!' please."):
+                answer+=token
 
             return True, ""
         except Exception as e:
             return False, f"Huggingchat error: {e}"
-        finally:
-            if conversation_id:
-                self.chatbot.delete_conversation(conversation_id)
 
-    async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:        
+    async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:
         prompt = ""
 
         for msg in req.messages:
@@ -102,38 +472,25 @@ Please refer to https://github.com/Soulter/hugging-chat-api
 
         prompt += "assistant: "
 
-        model = req.model
-        available_models = self.chatbot.get_remote_llms()
-        model_names = [m.name for m in available_models]
-        model_index = model_names.index(model) if model in model_names else None
-        if model_index is not None:
-            self.chatbot.switch_llm(model_index)
+        model_names = self._models or await self.refresh_models()
+        model = req.model if req.model in model_names else None
 
         random_int = random.randint(0, 1000000000)
-        conversation_id = self.chatbot.new_conversation()
-        self.chatbot.change_conversation(conversation_id)
 
         try:
-            for resp in self.chatbot.query(
-                text=prompt,
-                stream=True
-            ):
-                if resp is None:
-                    continue
+            async for token in self.query_conversation(model, prompt):
                 yield response.Response(
                     id=random_int,
                     finish_reason=response.FinishReason.NULL,
-                    normal_message=resp["token"].replace("\u0000", ""),
+                    normal_message=token.replace("\u0000", ""),
                     function_call=None
                 )
         except Exception as e:
             raise ValueError(f"Huggingchat error: {e}")
-        finally:
-            self.chatbot.delete_conversation(conversation_id)
 
         yield response.Response(
             id=random_int,
             finish_reason=response.FinishReason.STOP,
             normal_message="",
             function_call=None
-        )
\ No newline at end of file
+        )
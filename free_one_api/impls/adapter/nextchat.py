@@ -11,6 +11,7 @@ from ...models.adapter import llm
 from ...entities import request
 from ...entities import response, exceptions
 from ...models.channel import evaluation
+from ...common import stream, ratelimit
 
 
 @adapter.llm_adapter
@@ -46,7 +47,11 @@ class NextChatAdapter(llm.LLMLibAdapter):
     "url": "your_chat_url",
     "models": "Optional. Default is 'gpt-3.5-turbo'.
 It should be a list of available models in this API, separated by commas without spaces. 
-For example: 'gpt4,gpt-4-o,gpt-4-turbo'
+For example: 'gpt4,gpt-4-o,gpt-4-turbo'",
+    "passthrough": "Optional. Default is false.
+Set to true if the upstream is fully OpenAI compatible, requests and responses are forwarded as is.",
+    "context_windows": "Optional. Context window of models unknown to free-one-api or served with a smaller window,
+e.g. {"my-model": 8192} or {"my-model": [32768, 4096]} for [context window, max output tokens]."
 }
 """
 
@@ -54,10 +59,30 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
     def supported_path(cls) -> str:
         return "/v1/chat/completions"
 
+    def passthrough_supported(self) -> bool:
+        return bool(self.config.get("passthrough", False))
+
     def __init__(self, config: dict, eval: evaluation.AbsChannelEvaluation):
         self.config = config
         self.eval = eval
 
+    def make_headers(self, api_url: str) -> dict:
+        return {
+            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:122.0) Gecko/20100101 Firefox/122.0",
+            "Accept": "text/event-stream",
+            "Accept-Language": "de,en-US;q=0.7,en;q=0.3",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Content-Type": "application/json",
+            "Referer": api_url,
+            "x-requested-with": "XMLHttpRequest",
+            "Origin": api_url,
+            "Sec-Fetch-Dest": "empty",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Site": "same-origin",
+            "Connection": "keep-alive",
+            "Alt-Used": api_url,
+        }
+
     async def test(self) -> typing.Union[bool, str]:
         try:
             api_url = self.config["url"]
@@ -68,21 +93,7 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
                 "messages": [{"role": "user", "content": "Hi, respond 'Hello, world!' please."}],
                 "stream": False
             }
-            headers = {
-                "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:122.0) Gecko/20100101 Firefox/122.0",
-                "Accept": "text/event-stream",
-                "Accept-Language": "de,en-US;q=0.7,en;q=0.3",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Content-Type": "application/json",
-                "Referer": api_url,
-                "x-requested-with": "XMLHttpRequest",
-                "Origin": api_url,
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-                "Connection": "keep-alive",
-                "Alt-Used": api_url,
-            }
+            headers = self.make_headers(api_url)
             async with httpx.AsyncClient(verify=False) as client:
                 response = await client.post(f"{api_url}/api/openai/v1/chat/completions", json=data, headers=headers, timeout=None, follow_redirects=True)
                 response_data = response.json()
@@ -92,11 +103,25 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         except:
             return False, "NextChat test failed."
 
-    async def create_completion_data(self, chunk):
+    async def probe(self) -> typing.Union[bool, str]:
+        """Request a 1-token completion."""
         try:
-            return ujson.loads(chunk)
-        except ValueError as e:
-            raise ValueError(f"Error loading JSON from chunk: {e}\nChunk: {chunk}")
+            api_url = self.config["url"]
+            data = {
+                "model": self.supported_models()[0],
+                "messages": [{"role": "user", "content": "Hi"}],
+                "max_tokens": 1,
+                "stream": False
+            }
+            headers = self.make_headers(api_url)
+            async with httpx.AsyncClient(verify=False) as client:
+                response = await client.post(f"{api_url}/api/openai/v1/chat/completions", json=data, headers=headers, timeout=None, follow_redirects=True)
+                response.raise_for_status()
+                response.json()["choices"]
+
+            return True, ""
+        except:
+            return False, "NextChat probe failed."
 
     async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:        
         messages = req.messages
@@ -105,55 +130,42 @@ For example: 'gpt4,gpt-4-o,gpt-4-turbo'
         api_url = self.config["url"]
 
         async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:122.0) Gecko/20100101 Firefox/122.0",
-                "Accept": "text/event-stream",
-                "Accept-Language": "de,en-US;q=0.7,en;q=0.3",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Content-Type": "application/json",
-                "Referer": api_url,
-                "x-requested-with": "XMLHttpRequest",
-                "Origin": api_url,
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-                "Connection": "keep-alive",
-                "Alt-Used": api_url,
-            }
+            headers = self.make_headers(api_url)
             data = {
                 "model": model,
                 "messages": messages,
                 "stream": True
             }
+            if req.max_tokens is not None:
+                data["max_tokens"] = req.max_tokens
+            if req.stop:
+                data["stop"] = req.stop
             async with client.stream("POST", f"{api_url}/api/openai/v1/chat/completions", json=data, headers=headers) as model_response:
-                model_response.raise_for_status()
-                async for line in model_response.aiter_lines():
-                    if line:
-                        line_content = line[6:]
-                        if line_content == "[DONE]":
-                            yield response.Response(
-                                id=random_int,
-                                finish_reason=response.FinishReason.STOP,
-                                normal_message="",
-                                function_call=None
-                            )
-                            break
-                        try:
-                            chunk = await self.create_completion_data(line_content)
-                            if chunk["choices"][0]["finish_reason"] == "stop":
-                                yield response.Response(
-                                    id=random_int,
-                                    finish_reason=response.FinishReason.NULL,
-                                    normal_message=text,
-                                    function_call=None
-                                )
-                            else:
-                                text = chunk["choices"][0]["delta"]["content"]
-                                yield response.Response(
-                                    id=random_int,
-                                    finish_reason=response.FinishReason.NULL,
-                                    normal_message=text,
-                                    function_call=None
-                                )
-                        except ValueError as e:
-                            raise ValueError(f"JSON decoding error: {e}\nLine content: {line_content}")
\ No newline at end of file
+                req.rate_limit = ratelimit.raise_for_status(model_response)
+                finish_reason = None
+                async for text, reason in stream.aiter_chat_deltas(model_response.aiter_bytes()):
+                    if reason:
+                        finish_reason = reason
+                    if text:
+                        yield response.Response(
+                            id=random_int,
+                            finish_reason=response.FinishReason.NULL,
+                            normal_message=text,
+                            function_call=None
+                        )
+                yield response.Response(
+                    id=random_int,
+                    finish_reason=response.FinishReason.LENGTH if finish_reason == "length" else response.FinishReason.STOP,
+                    normal_message="",
+                    function_call=None
+                )
+
+    async def passthrough(self, req: request.Request, body: bytes) -> typing.AsyncGenerator[bytes, None]:
+        api_url = self.config["url"]
+
+        async with httpx.AsyncClient(timeout=None, verify=False, follow_redirects=True) as client:
+            headers = self.make_headers(api_url)
+            async with client.stream("POST", f"{api_url}/api/openai/v1/chat/completions", content=body, headers=headers) as model_response:
+                req.rate_limit = ratelimit.raise_for_status(model_response)
+                async for chunk in model_response.aiter_bytes():
+                    yield chunk
@@ -1,5 +1,7 @@
 import os
 import sys
+import copy
+import time
 import asyncio
 
 import yaml
@@ -11,6 +13,7 @@ from .router import api as apigroup
 from ..models.database import db
 from ..models.channel import mgr as chanmgr
 from ..models.key import mgr as keymgr
+from ..models.conversation import mgr as conversationmgr
 from ..models.router import group as routergroup
 from ..models.watchdog import wd as wdmgr
 
@@ -38,21 +41,31 @@ class Application:
     key: keymgr.AbsAPIKeyManager
     """API Key manager."""
 
+    conversation: conversationmgr.AbsConversationManager
+    """Conversation manager."""
+
     watchdog: wdmgr.AbsWatchDog
 
+    hotreload: 'HotReload'
+    """Applies config and channel changes without restart."""
+
     def __init__(
         self,
         dbmgr: db.DatabaseInterface,
         router: routermgr.RouterManager,
         channel: chanmgr.AbsChannelManager,
         key: keymgr.AbsAPIKeyManager,
+        conversation: conversationmgr.AbsConversationManager,
         watchdog: wdmgr.AbsWatchDog,
+        hotreload: 'HotReload',
     ):
         self.dbmgr = dbmgr
         self.router = router
         self.channel = channel
         self.key = key
+        self.conversation = conversation
         self.watchdog = watchdog
+        self.hotreload = hotreload
 
     async def run(self):
         """Run application."""
@@ -62,6 +75,10 @@ class Application:
 
         await self.router.serve(loop)
 
+    async def reload(self) -> dict:
+        """Apply changes of config file and channel table, see `HotReload`."""
+        return await self.hotreload.reload()
+
 
 default_config = {
     "1-documentation": "ask Metimol",
@@ -78,11 +95,99 @@ default_config = {
             "interval": 3600,
             "timeout": 300,
             "fail_limit": 5,
+            "tick": 5,
+            "retry_interval": 60,
+            "jitter": 0.1,
+            "concurrency": 8,
+        },
+        "recovery": {
+            "tick": 10,
+            "base_delay": 60,
+            "max_delay": 3600,
+            "jitter": 0.2,
+            "confirm_interval": 30,
+            "successes": 3,
+            "timeout": 120,
+            "concurrency": 4,
+            "ramp_duration": 600,
+            "initial_share": 0.1,
+        },
+    },
+    "channel": {
+        "affinity": {
+            "enabled": False,
+            "load_factor": 1.25,
+            "virtual_nodes": 64,
+        },
+        "breaker": {
+            "window": 60,
+            "min_requests": 10,
+            "error_rate_threshold": 0.5,
+            "consecutive_failures": 5,
+            "cooldown": 30,
+            "half_open_trials": 2,
+        },
+        "continuation": {
+            "enabled": True,
+            "capacity": 10000,
+            "ttl": 3600,
+        },
+        "rate_limit": {
+            "default_cooldown": 10,
+            "max_cooldown": 600,
+        },
+        "snapshot": {
+            "enabled": True,
+            "path": "./data/stats_snapshot.json",
+            "interval": 60,
+            "half_life": 600,
+            "max_age": 86400,
+        },
+        "stats": {
+            "quota_threshold": 0.2,
+            "quota_penalty": 60,
+            "quota_ttl": 60,
+        },
+    },
+    "forward": {
+        "trim_prompt_keys": [],
+        "trim_reserve_tokens": 1024,
+        "max_choices": 8,
+        "fanout_concurrency": 4,
+        "fanout_per_channel": 2,
+        "resume": {
+            "enabled": True,
+            "always": False,
+            "ttl": 60,
+            "max_streams": 1000,
+            "max_bytes": 1024 * 1024,
+            "detach_timeout": 30,
+        },
+        "embeddings": {
+            "enabled": True,
+            "max_wait": 0.005,
+            "max_batch_size": 256,
+            "retries": 3,
+        },
+        "shadow": {
+            "enabled": False,
+            "rules": [],
+            "concurrency": 4,
+            "shed_load": 32,
         },
     },
+    "conversation": {
+        "cache_size": 1024,
+        "ttl": 7 * 86400,
+        "max_messages": 200,
+        "max_tokens": 128000,
+        "purge_interval": 3600,
+        "write_delay": 1.0,
+    },
     "router": {
         "port": 3000,
         "token": os.environ.get("password", "123456789"),
+        "fast_path": False,
     },
     "web": {
         "frontend_path": "./web/dist/",
@@ -102,6 +207,184 @@ default_config = {
     }
 }
 
+adapter_config_mapping = {
+    "xtekky_gpt4free": gpt4free.GPT4FreeAdapter,
+    "GPT": gpt.GPTAdapter,
+    "NextChat": nextchat.NextChatAdapter,
+    "ChatGPTWeb": chatgpt_web.ChatGPTWebAdapter,
+    "HugChat": hugchat.HuggingChatAdapter
+}
+"""Adapter classes by their section in `adapters` config."""
+
+restart_required_sections = ["database", "router", "watchdog", "web"]
+"""Config sections only applied at startup."""
+
+
+def load_config(config_path: str) -> dict:
+    """Read config file, completed with default values."""
+    config = {}
+    with open(config_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    # complete config
+    config = cfgutil.complete_config(config, copy.deepcopy(default_config))
+
+    # set default values
+    if 'misc' in config and 'chatgpt_api_base' in config['misc']:  # backward compatibility
+        config['adapters']['acheong08_ChatGPT']['reverse_proxy'] = config['misc']['chatgpt_api_base']
+
+    for adapter_name in adapter_config_mapping:
+        if adapter_name not in config['adapters']:
+            config['adapters'][adapter_name] = {}
+
+    return config
+
+
+def apply_config(config: dict):
+    """Apply config to class settings, instances read them on use."""
+    # save ad to runtime
+    from ..common import randomad
+
+    randomad.enabled = config['random_ad']['enabled']
+    randomad.rate = config['random_ad']['rate']
+    randomad.ads = config['random_ad']['ad_list']
+
+    # apply adapters config
+    for adapter_name in adapter_config_mapping:
+        for k, v in config["adapters"][adapter_name].items():
+            setattr(adapter_config_mapping[adapter_name], k, v)
+
+    # apply channel config
+    from .channel import affinity
+    from .channel import breaker
+
+    for k, v in config['channel']['affinity'].items():
+        setattr(affinity.AffinityRouter, k, v)
+
+    for k, v in config['channel']['breaker'].items():
+        setattr(breaker.CircuitBreaker, k, v)
+
+    from .channel import stats as chanstats
+    from ..common import ratelimit
+
+    for k, v in config['channel']['rate_limit'].items():
+        setattr(ratelimit.RateLimitInfo, k, v)
+
+    for k, v in config['channel']['stats'].items():
+        setattr(chanstats.ChannelStatsTable, k, v)
+
+    from .channel import snapshot
+
+    for k, v in config['channel']['snapshot'].items():
+        setattr(snapshot.StatsSnapshot, k, v)
+
+    from .channel import continuation
+
+    for k, v in config['channel']['continuation'].items():
+        setattr(continuation.ContinuationStore, k, v)
+
+    # apply forward config
+    from .forward import mgr as forwardmgr
+
+    forwardmgr.ForwardManager.trim_reserve_tokens = config['forward']['trim_reserve_tokens']
+    forwardmgr.ForwardManager.fanout_concurrency = config['forward']['fanout_concurrency']
+    forwardmgr.ForwardManager.fanout_per_channel = config['forward']['fanout_per_channel']
+
+    from .forward import shadow
+
+    for k, v in config['forward']['shadow'].items():
+        setattr(shadow.ShadowMirror, k, v)
+
+    from .forward import resume
+
+    for k, v in config['forward']['resume'].items():
+        setattr(resume.StreamRegistry, k, v)
+
+    from .forward import batcher
+
+    for k, v in config['forward']['embeddings'].items():
+        setattr(batcher.EmbeddingBatcher, k, v)
+
+    from .router import forward as forwardgroup
+
+    forwardgroup.ForwardAPIGroup.trim_prompt_keys = config['forward']['trim_prompt_keys']
+    forwardgroup.ForwardAPIGroup.max_choices = config['forward']['max_choices']
+
+    # apply conversation config
+    from .conversation import mgr as conversationmgr
+
+    for k, v in config['conversation'].items():
+        setattr(conversationmgr.ConversationManager, k, v)
+
+
+class HotReload:
+    """Applies changes of config file and channel table without restart.
+
+    Both are read and adapters of new or changed channels are started
+    first, then config is applied and channels are swapped without
+    awaiting in between, so no request sees half of a reload.
+    """
+
+    config_path: str
+
+    config: dict
+    """Config applied last."""
+
+    dbmgr: db.DatabaseInterface
+
+    chanmgr: chanmgr.AbsChannelManager
+
+    def __init__(
+        self,
+        config_path: str,
+        config: dict,
+        dbmgr: db.DatabaseInterface,
+        chanmgr: chanmgr.AbsChannelManager,
+    ):
+        self.config_path = config_path
+        self.config = config
+        self.dbmgr = dbmgr
+        self.chanmgr = chanmgr
+        self.lock = asyncio.Lock()
+
+    async def reload(self) -> dict:
+        """Re-read config file and channel table, apply what changed.
+
+        Running state is kept as is if either can't be read.
+
+        Returns:
+            dict: changed config keys, keys which need a restart, swapped
+            channels, in-flight requests on swapped channels and duration.
+        """
+        async with self.lock:
+            before = time.time()
+
+            config = load_config(self.config_path)
+            channels = await self.dbmgr.list_channels()
+
+            changed = cfgutil.diff_config(self.config, config)
+            restart_required = [k for k in changed if k.split(".")[0] in restart_required_sections]
+
+            for adapter_name in adapter_config_mapping:
+                old_section = self.config['adapters'].get(adapter_name, {})
+                new_section = config['adapters'][adapter_name]
+                # class settings can't be unset, the last value stays until restart
+                restart_required += [f"adapters.{adapter_name}.{k}" for k in old_section if k not in new_section]
+
+            await self.chanmgr.prepare_channels(channels)
+            apply_config(config)
+            report = self.chanmgr.swap_channels(channels)
+            self.config = config
+
+            return {
+                "seconds": round(time.time() - before, 4),
+                "config_changed": changed,
+                "restart_required": restart_required,
+                "channels": report,
+                "in_flight_affected": report["in_flight_affected"],
+            }
+
+
 async def make_application(config_path: str) -> Application:
     """Make application."""
     if not os.path.exists(config_path):
@@ -110,26 +393,13 @@ async def make_application(config_path: str) -> Application:
             print("Config file created at", config_path)
             # print("Please edit it and run again.")
             # sys.exit(0)
-    config = {}
-    with open(config_path, "r") as f:
-        config = yaml.load(f, Loader=yaml.FullLoader)
-
-    # complete config
-    config = cfgutil.complete_config(config, default_config)
+    config = load_config(config_path)
 
     # dump config
     with open(config_path, "w") as f:
         yaml.dump(config, f)
 
-    # save ad to runtime
-    if 'random_ad' in config and config['random_ad']['enabled']:
-        from ..common import randomad
-
-        randomad.enabled = config['random_ad']['enabled']
-        randomad.rate = config['random_ad']['rate']
-        randomad.ads = config['random_ad']['ad_list']
-
-    from ..common import randomad
+    apply_config(config)
 
     # make database manager
     from .database import mysql as mysqldb
@@ -141,26 +411,6 @@ async def make_application(config_path: str) -> Application:
     dbmgr = dbmgr_cls_mapping[config['database']['type']](config['database'])
     await dbmgr.initialize()
 
-    # set default values
-    # apply adapters config
-    if 'misc' in config and 'chatgpt_api_base' in config['misc']:  # backward compatibility
-        config['adapters']['acheong08_ChatGPT']['reverse_proxy'] = config['misc']['chatgpt_api_base']
-
-    adapter_config_mapping = {
-        "xtekky_gpt4free": gpt4free.GPT4FreeAdapter,
-        "GPT": gpt.GPTAdapter,
-        "NextChat": nextchat.NextChatAdapter,
-        "ChatGPTWeb": chatgpt_web.ChatGPTWebAdapter,
-        "HugChat": hugchat.HuggingChatAdapter
-    }
-
-    for adapter_name in adapter_config_mapping:
-        if adapter_name not in config['adapters']:
-            config['adapters'][adapter_name] = {}
-
-        for k, v in config["adapters"][adapter_name].items():
-            setattr(adapter_config_mapping[adapter_name], k, v)
-
     # make channel manager
     from .channel import mgr as chanmgr
 
@@ -173,10 +423,48 @@ async def make_application(config_path: str) -> Application:
     apikeymgr = keymgr.APIKeyManager(dbmgr)
     await apikeymgr.list_keys()
 
+    # make conversation manager
+    from .conversation import mgr as conversationmgr
+
+    convmgr = conversationmgr.ConversationManager(dbmgr)
+
     # make forward manager
     from .forward import mgr as forwardmgr
 
-    fwdmgr = forwardmgr.ForwardManager(channelmgr, apikeymgr)
+    fwdmgr = forwardmgr.ForwardManager(channelmgr, apikeymgr, convmgr)
+
+    # watchdog and tasks
+    from .watchdog import wd as watchdog
+
+    wdmgr = watchdog.WatchDog()
+
+    # tasks
+    from .watchdog.tasks import heartbeat, recovery
+
+    hbtask = heartbeat.HeartBeatTask(
+        channelmgr,
+        config['watchdog']['heartbeat'],
+    )
+
+    wdmgr.add_task(hbtask)
+
+    rctask = recovery.ChannelRecoveryTask(
+        channelmgr,
+        config['watchdog']['recovery'],
+    )
+
+    wdmgr.add_task(rctask)
+
+    if channelmgr.snapshot.enabled:
+        from .watchdog.tasks import snapshot as snapshottask
+
+        wdmgr.add_task(snapshottask.StatsSnapshotTask(channelmgr, channelmgr.snapshot))
+
+    from .watchdog.tasks import conversation as conversationtask
+
+    wdmgr.add_task(conversationtask.ConversationCleanupTask(convmgr))
+
+    hotreload = HotReload(config_path, config, dbmgr, channelmgr)
 
     # make router manager
     from .router import mgr as routermgr
@@ -187,8 +475,8 @@ async def make_application(config_path: str) -> Application:
     from .router import web as webgroup
 
     # ========= API Groups =========
-    group_forward = forwardgroup.ForwardAPIGroup(dbmgr, channelmgr, apikeymgr, fwdmgr)
-    group_api = apigroup.WebAPIGroup(dbmgr, channelmgr, apikeymgr)
+    group_forward = forwardgroup.ForwardAPIGroup(dbmgr, channelmgr, apikeymgr, fwdmgr, convmgr)
+    group_api = apigroup.WebAPIGroup(dbmgr, channelmgr, apikeymgr, wdmgr, fwdmgr, hotreload.reload)
     group_api.tokens = [crypto.md5_digest(config['router']['token'])]
     group_web = webgroup.WebPageGroup(config['web'], config['router'])
 
@@ -203,29 +491,17 @@ async def make_application(config_path: str) -> Application:
     routermgr = routermgr.RouterManager(
         routes=paths,
         config=config['router'],
+        forward_group=group_forward,
     )
 
-    # watchdog and tasks
-    from .watchdog import wd as watchdog
-
-    wdmgr = watchdog.WatchDog()
-
-    # tasks
-    from .watchdog.tasks import heartbeat
-
-    hbtask = heartbeat.HeartBeatTask(
-        channelmgr,
-        config['watchdog']['heartbeat'],
-    )
-
-    wdmgr.add_task(hbtask)
-
     app = Application(
         dbmgr=dbmgr,
         router=routermgr,
         channel=channelmgr,
         key=apikeymgr,
+        conversation=convmgr,
         watchdog=wdmgr,
+        hotreload=hotreload,
     )
 
     return app
\ No newline at end of file
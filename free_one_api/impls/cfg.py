@@ -9,4 +9,18 @@ def complete_config(cfg: dict, default: dict):
             cfg[k] = default[k]
         elif isinstance(default[k], dict):
             complete_config(cfg[k], default[k])
-    return cfg
\ No newline at end of file
+    return cfg
+
+def diff_config(old: dict, new: dict, prefix: str="") -> list[str]:
+    """Dotted keys whose values differ, e.g. forward.resume.ttl."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return [] if old == new else [prefix]
+
+    changed = []
+    for k in list(old) + [k for k in new if k not in old]:
+        key = f"{prefix}.{k}" if prefix else str(k)
+        if k not in old or k not in new:
+            changed.append(key)
+        else:
+            changed += diff_config(old[k], new[k], key)
+    return changed
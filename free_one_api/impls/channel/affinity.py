@@ -0,0 +1,231 @@
+"""Conversation affinity routing."""
+import hashlib
+import math
+
+import numpy as np
+
+from ...entities import channel, request
+from ...models.channel import evaluation
+from . import stats as chanstats
+
+
+def _hash(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _points(channel_ids: list[int], virtual_nodes: int) -> np.ndarray:
+    """Ring points of channels, `virtual_nodes` per channel in order of ids.
+
+    Derived from one hash per channel with splitmix64, vectorized.
+    """
+    seeds = np.array([_hash(str(channel_id)) for channel_id in channel_ids], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        x = seeds[:, None] + np.arange(1, virtual_nodes + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return x.ravel()
+
+
+def conversation_key(req: request.Request) -> str:
+    """Get affinity key of a request.
+
+    Client provided session key if any, otherwise the conversation prefix:
+    system prompts and the first user message.
+    """
+    if req.session_key:
+        return "session:" + req.session_key
+
+    prefix = []
+    for msg in req.messages:
+        prefix.append(f"{msg.get('role')}:{msg.get('content')}")
+        if msg.get("role") == "user":
+            break
+
+    if not prefix:
+        return None
+
+    return "prefix:" + "\n".join(prefix)
+
+
+class AffinityRouter:
+    """Sticky routing of conversations onto channels.
+
+    Keys are mapped onto a consistent hash ring of channels. A channel is
+    skipped if its in-flight requests exceed `load_factor` times the average
+    of candidates (bounded-load consistent hashing), so that hot conversations
+    spill onto the next channels of the ring instead of overloading one.
+    """
+
+    enabled: bool = False
+    """Whether affinity routing is enabled."""
+
+    load_factor: float = 1.25
+    """Maximum load of a channel relative to the average load of candidates."""
+
+    virtual_nodes: int = 64
+    """Amount of points of every channel on the ring."""
+
+    members: set[int]
+    """Ids of channels on the ring."""
+
+    points: np.ndarray
+    """Sorted points of the ring, uint64."""
+
+    owners: np.ndarray
+    """Channel id of every point."""
+
+    stranded: set[int]
+    """Ids of removed channels whose points are still on the ring.
+
+    Removal only forgets the id, its points are skipped by `pick` since the
+    channel is no candidate any more. They are dropped in one pass once
+    there are more stranded channels than members.
+    """
+
+    hits: int
+    """Requests routed to the owner channel of their key."""
+
+    spills: int
+    """Requests routed to a later channel on the ring since the owner is saturated."""
+
+    fallbacks: int
+    """Requests selected by normal scoring since no channel on the ring is available."""
+
+    def __init__(self):
+        self.members = set()
+        self.points = np.empty(0, dtype=np.uint64)
+        self.owners = np.empty(0, dtype=np.int64)
+        self.stranded = set()
+        self.hits = 0
+        self.spills = 0
+        self.fallbacks = 0
+
+        # [count, sum of ttft]
+        self.sticky_ttft = [0, 0.0]
+        self.non_sticky_ttft = [0, 0.0]
+
+    def add(self, channel_id: int):
+        """Add channel to the ring."""
+        self.add_many([channel_id])
+
+    def add_many(self, channel_ids: list[int]):
+        """Add channels to the ring, their points are merged in one pass."""
+        fresh = []
+        for channel_id in channel_ids:
+            if channel_id in self.members:
+                continue
+            self.members.add(channel_id)
+            if channel_id in self.stranded:
+                self.stranded.discard(channel_id)  # its points are still there
+            else:
+                fresh.append(channel_id)
+
+        if not fresh:
+            return
+
+        points = _points(fresh, self.virtual_nodes)
+        owners = np.repeat(np.array(fresh, dtype=np.int64), self.virtual_nodes)
+        order = np.argsort(points, kind="stable")
+        points, owners = points[order], owners[order]
+
+        positions = np.searchsorted(self.points, points, side="right")
+        self.points = np.insert(self.points, positions, points)
+        self.owners = np.insert(self.owners, positions, owners)
+
+    def remove(self, channel_id: int):
+        """Remove channel from the ring."""
+        if channel_id not in self.members:
+            return
+
+        self.members.discard(channel_id)
+        self.stranded.add(channel_id)
+        if len(self.stranded) > len(self.members):
+            keep = ~np.isin(self.owners, np.fromiter(self.stranded, dtype=np.int64, count=len(self.stranded)))
+            self.points = self.points[keep]
+            self.owners = self.owners[keep]
+            self.stranded.clear()
+
+    def pick(
+        self,
+        req: request.Request,
+        candidates: list[channel.Channel],
+        stats: chanstats.ChannelStatsTable,
+    ) -> channel.Channel:
+        """Pick the sticky channel of request from candidates.
+
+        Returns:
+            The channel, None if request has no key or no candidate can take it.
+        """
+        key = conversation_key(req)
+
+        if key is None or len(self.points) == 0:
+            return None
+
+        by_id = {chan.id: chan for chan in candidates}
+        in_flight = {
+            chan.id: int(stats.in_flight[stats.slot(chan.id)])
+            for chan in candidates
+        }
+
+        total = sum(in_flight.values()) + 1
+        bound = math.ceil(self.load_factor * total / len(candidates))
+
+        start = int(np.searchsorted(self.points, np.uint64(_hash(key)), side="left"))
+        visited = set()
+        owner = True
+
+        size = len(self.owners)
+        for i in range(size):
+            channel_id = int(self.owners[(start + i) % size])
+
+            if channel_id in visited or channel_id not in by_id:
+                continue
+            visited.add(channel_id)
+
+            slot = stats.slot(channel_id)
+            if in_flight[channel_id] < bound and stats.in_flight[slot] < stats.capacity[slot]:
+                if owner:
+                    self.hits += 1
+                else:
+                    self.spills += 1
+                return by_id[channel_id]
+
+            owner = False
+
+            if len(visited) == len(by_id):
+                break
+
+        self.fallbacks += 1
+        return None
+
+    def observe(self, record: evaluation.Record):
+        """Account time to first response of a committed record."""
+        if not record.success or record.latency < 0:
+            return
+
+        bucket = self.sticky_ttft if record.sticky else self.non_sticky_ttft
+        bucket[0] += 1
+        bucket[1] += record.latency
+
+    def get_stats(self) -> dict:
+        """Get hit rate and TTFT of sticky and non-sticky requests."""
+        total = self.hits + self.spills + self.fallbacks
+
+        def avg(bucket):
+            return bucket[1] / bucket[0] if bucket[0] else None
+
+        sticky_ttft = avg(self.sticky_ttft)
+        non_sticky_ttft = avg(self.non_sticky_ttft)
+
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "spills": self.spills,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.hits / total if total else None,
+            "sticky_ttft": sticky_ttft,
+            "non_sticky_ttft": non_sticky_ttft,
+            "ttft_diff": sticky_ttft - non_sticky_ttft
+                if sticky_ttft is not None and non_sticky_ttft is not None else None,
+        }
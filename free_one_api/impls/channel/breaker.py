@@ -0,0 +1,179 @@
+"""Circuit breaker of channels."""
+import enum
+import collections
+
+from ...common import clock
+
+
+class BreakerState(enum.Enum):
+    """State of circuit breaker."""
+
+    CLOSED = "closed"
+    """Requests pass."""
+
+    OPEN = "open"
+    """Requests are rejected until cooldown elapsed."""
+
+    HALF_OPEN = "half_open"
+    """A few trial requests pass to decide whether to close or reopen."""
+
+
+class CircuitBreaker:
+    """Circuit breaker fed by outcomes of real requests.
+
+    Independent from the `enabled` flag of channel, which is set by admin or watchdog.
+    """
+
+    window: int = 60
+    """Seconds of the sliding window for error rate."""
+
+    min_requests: int = 10
+    """Minimum requests in window before error rate is considered."""
+
+    error_rate_threshold: float = 0.5
+    """Open if error rate in window reaches this."""
+
+    consecutive_failures: int = 5
+    """Open if this amount of requests fail in a row."""
+
+    cooldown: int = 30
+    """Seconds to stay open before half-open."""
+
+    half_open_trials: int = 2
+    """Successful trial requests needed to close."""
+
+    max_transitions: int = 20
+    """Amount of recent transitions kept."""
+
+    state: BreakerState
+
+    outcomes: collections.deque
+    """(time, success) of requests in window."""
+
+    consecutive: int
+    """Amount of failures in a row."""
+
+    opened_at: float
+
+    trials_in_flight: int
+
+    trial_successes: int
+
+    transitions: collections.deque
+    """Recent transitions, dicts of time, from, to and reason."""
+
+    def __init__(self):
+        self.state = BreakerState.CLOSED
+        self.outcomes = collections.deque()
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.trials_in_flight = 0
+        self.trial_successes = 0
+        self.transitions = collections.deque(maxlen=self.max_transitions)
+
+    def _transit(self, state: BreakerState, reason: str):
+        self.transitions.append({
+            "time": clock.now(),
+            "from": self.state.value,
+            "to": state.value,
+            "reason": reason,
+        })
+        self.state = state
+
+        if state == BreakerState.OPEN:
+            self.opened_at = clock.now()
+        elif state == BreakerState.HALF_OPEN:
+            self.trials_in_flight = 0
+            self.trial_successes = 0
+        elif state == BreakerState.CLOSED:
+            self.outcomes.clear()
+            self.consecutive = 0
+
+    def _prune(self, now: float):
+        while self.outcomes and self.outcomes[0][0] < now - self.window:
+            self.outcomes.popleft()
+
+    def allow(self) -> bool:
+        """Whether a request can be sent to channel now."""
+        if self.state == BreakerState.CLOSED:
+            return True
+
+        if self.state == BreakerState.OPEN:
+            if clock.now() - self.opened_at < self.cooldown:
+                return False
+            self._transit(BreakerState.HALF_OPEN, "cooldown elapsed")
+
+        return self.trials_in_flight < self.half_open_trials
+
+    def on_start(self):
+        """A request is sent to channel."""
+        if self.state == BreakerState.HALF_OPEN:
+            self.trials_in_flight += 1
+
+    def on_cancelled(self):
+        """A request sent to channel was cancelled by its client, no outcome."""
+        if self.state == BreakerState.HALF_OPEN:
+            self.trials_in_flight = max(0, self.trials_in_flight - 1)
+
+    def on_result(self, success: bool):
+        """A request sent to channel finished."""
+        now = clock.now()
+
+        if self.state == BreakerState.OPEN:  # stragglers
+            return
+
+        if self.state == BreakerState.HALF_OPEN:
+            self.trials_in_flight = max(0, self.trials_in_flight - 1)
+            if not success:
+                self._transit(BreakerState.OPEN, "trial request failed")
+                return
+            self.trial_successes += 1
+            if self.trial_successes >= self.half_open_trials:
+                self._transit(BreakerState.CLOSED, "trial requests succeeded")
+            return
+
+        self.outcomes.append((now, success))
+        self._prune(now)
+        self.consecutive = 0 if success else self.consecutive + 1
+
+        if self.consecutive >= self.consecutive_failures:
+            self._transit(BreakerState.OPEN, f"{self.consecutive} consecutive failures")
+            return
+
+        if len(self.outcomes) >= self.min_requests:
+            error_rate = self.error_rate()
+            if error_rate >= self.error_rate_threshold:
+                self._transit(BreakerState.OPEN, f"error rate {error_rate:.2f} in {self.window}s")
+
+    def error_rate(self) -> float:
+        """Error rate of requests in window."""
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, success in self.outcomes if not success) / len(self.outcomes)
+
+    def export(self) -> dict:
+        """State to be saved in snapshots."""
+        return {
+            "state": self.state.value,
+            "opened_at": self.opened_at,
+            "consecutive": self.consecutive,
+        }
+
+    def restore(self, data: dict):
+        """Restore saved state, only an open breaker is worth restoring.
+
+        A half-open breaker is restored as open, its trials are lost.
+        """
+        if data.get("state") in (BreakerState.OPEN.value, BreakerState.HALF_OPEN.value):
+            self._transit(BreakerState.OPEN, "restored from snapshot")
+            self.opened_at = data.get("opened_at", self.opened_at)
+        self.consecutive = data.get("consecutive", 0)
+
+    def dump(self) -> dict:
+        """Dump state and recent transitions."""
+        return {
+            "state": self.state.value,
+            "error_rate": self.error_rate(),
+            "consecutive_failures": self.consecutive,
+            "transitions": list(self.transitions),
+        }
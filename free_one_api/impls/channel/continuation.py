@@ -0,0 +1,157 @@
+"""Upstream-native conversation continuation."""
+import json
+import time
+import hashlib
+import collections
+
+from ...entities import channel, request
+
+
+def _extend(digest: bytes, message: dict) -> bytes:
+    """Hash of a history extended by one message.
+
+    Only role and content count, clients often echo replies back with
+    extra fields.
+    """
+    content = message.get("content")
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True)
+    h = hashlib.blake2b(digest, digest_size=16)
+    h.update(str(message.get("role")).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(content.encode("utf-8"))
+    return h.digest()
+
+
+class Handle:
+    """Upstream handle of a conversation."""
+
+    channel_id: int
+
+    data: dict
+    """Adapter specific, e.g. conversation id and parent message id."""
+
+    length: int
+    """Amount of messages upstream already has."""
+
+    stored_at: float
+
+    def __init__(self, channel_id: int, data: dict, length: int, stored_at: float):
+        self.channel_id = channel_id
+        self.data = data
+        self.length = length
+        self.stored_at = stored_at
+
+
+class ContinuationStore:
+    """Maps histories to upstream conversation handles.
+
+    After a reply, the handle returned by the adapter is stored under the
+    hash of the history including the reply. When the client sends that
+    history again with a new turn, the request goes to the channel holding
+    the handle and only the new turn is sent upstream. A handle is used
+    once; on miss, eviction or an unavailable channel the whole history
+    is sent as usual.
+    """
+
+    enabled: bool = True
+
+    capacity: int = 10000
+    """Maximum amount of handles kept, least recently stored are evicted."""
+
+    ttl: int = 3600
+    """Seconds a handle is kept, upstreams forget conversations too."""
+
+    handles: collections.OrderedDict[bytes, Handle]
+
+    def __init__(self):
+        self.handles = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.fallbacks = 0
+        """Handles found but their channel can't take the request."""
+
+        self.stored = 0
+        self.saved_messages = 0
+        """Messages not sent upstream thanks to continuation."""
+
+    def pick(self, req: request.Request, candidates: list[channel.Channel]) -> channel.Channel:
+        """Pick the channel holding handle of request history, prepares request to continue.
+
+        Sets `req.history_hash` if any candidate supports continuation, so
+        the reply can be stored.
+
+        Returns:
+            The channel, None if request should be sent with whole history.
+        """
+        req.continuation = None
+        req.continued_messages = 0
+        req.next_continuation = None
+
+        # hashing long histories is not free, skip it if nobody can continue
+        if not any(chan.adapter.continuation_supported() for chan in candidates):
+            return None
+
+        digest = b""
+        prefix_digest = None
+        prefix_length = 0
+        for i, message in enumerate(req.messages):
+            digest = _extend(digest, message)
+            if message.get("role") == "assistant":
+                prefix_digest = digest
+                prefix_length = i + 1
+        req.history_hash = digest
+
+        # only the latest reply continues, nothing to save without a new turn
+        if prefix_digest is None or prefix_length == len(req.messages):
+            return None
+
+        handle = self.handles.pop(prefix_digest, None)
+        if handle is None or time.time() - handle.stored_at > self.ttl or handle.length != prefix_length:
+            self.misses += 1
+            return None
+
+        for chan in candidates:
+            if chan.id == handle.channel_id and chan.adapter.continuation_supported():
+                req.continuation = handle.data
+                req.continued_messages = prefix_length
+                req.sticky = True
+                self.hits += 1
+                self.saved_messages += prefix_length
+                return chan
+
+        self.fallbacks += 1
+        return None
+
+    def store(self, chan: channel.Channel, req: request.Request, reply: str):
+        """Store the handle adapter returned for the history including reply."""
+        if req.next_continuation is None or req.history_hash is None:
+            return
+
+        digest = _extend(req.history_hash, {"role": "assistant", "content": reply})
+        length = len(req.messages) + req.trimmed_messages + 1
+        self.handles[digest] = Handle(chan.id, req.next_continuation, length, time.time())
+        self.handles.move_to_end(digest)
+        while len(self.handles) > self.capacity:
+            self.handles.popitem(last=False)
+        self.stored += 1
+
+    def remove(self, channel_id: int):
+        """Forget handles of a channel."""
+        for digest in [d for d, h in self.handles.items() if h.channel_id == channel_id]:
+            del self.handles[digest]
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses + self.fallbacks
+        return {
+            "enabled": self.enabled,
+            "handles": len(self.handles),
+            "stored": self.stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+            "hit_rate": self.hits / total if total else None,
+            "saved_messages": self.saved_messages,
+        }
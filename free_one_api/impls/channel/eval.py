@@ -1,8 +1,8 @@
 import random
 import math
-import time
 
 from ...models.channel import evaluation
+from ...common import clock
 
 
 class ChannelEvaluation(evaluation.AbsChannelEvaluation):
@@ -10,7 +10,7 @@ class ChannelEvaluation(evaluation.AbsChannelEvaluation):
     init_time: int
     
     def __init__(self):
-        self.init_time = time.time()
+        self.init_time = clock.now()
         self.records = []
     
     async def evaluate(self) -> float:
@@ -23,7 +23,7 @@ class ChannelEvaluation(evaluation.AbsChannelEvaluation):
         """
         records_reverse = self.records[::-1]
         
-        now_time = time.time()
+        now_time = clock.now()
         
         lastUseTime = -1
         
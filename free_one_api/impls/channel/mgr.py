@@ -5,9 +5,17 @@ import random
 import json
 import os
 
+import numpy as np
+
 from ...entities import channel, request, exceptions
+from ...common import ratelimit, tokens, clock
 from ...models.database import db
-from ...models.channel import mgr
+from ...models.channel import mgr, evaluation
+from . import stats as chanstats
+from . import affinity
+from . import snapshot
+from . import continuation
+from ..forward import shadow
 
 
 class ChannelManager(mgr.AbsChannelManager):
@@ -25,6 +33,11 @@ class ChannelManager(mgr.AbsChannelManager):
     ):
         self.dbmgr = dbmgr
         self.channels = []
+        self.stats = chanstats.ChannelStatsTable()
+        self.model_stats = chanstats.ChannelStatsTable()
+        self.affinity = affinity.AffinityRouter()
+        self.snapshot = snapshot.StatsSnapshot()
+        self.continuations = continuation.ContinuationStore()
         self.dump_score_records = os.getenv("DUMP_SCORE_RECORDS", "false").lower() == "true"
 
     async def has_channel(self, channel_id: int) -> bool:
@@ -53,14 +66,28 @@ class ChannelManager(mgr.AbsChannelManager):
         return self.channels
 
     async def load_channels(self) -> None:
-        """Load all channels from database."""
-        self.channels = await self.dbmgr.list_channels()
+        """Load all channels from database, restore their statistics from last snapshot."""
+        channels = await self.dbmgr.list_channels()
+        await self._start_adapters(channels)
+        self.channels = channels
+
+        for chan in self.channels:
+            self.stats.allocate(chan.id)
+        self.affinity.add_many([chan.id for chan in self.channels])
+
+        if self.snapshot.enabled:
+            restored = self.snapshot.restore(self)
+            if restored > 0:
+                print(f"Restored statistics of {restored} channels from snapshot.")
 
     async def create_channel(self, chan: channel.Channel) -> None:
         """Create a channel."""
         assert not await self.has_channel(chan.id)
 
         await self.dbmgr.insert_channel(chan)
+        await self._start_adapters([chan])
+        self.stats.allocate(chan.id)
+        self.affinity.add(chan.id)
         self.channels.append(chan)
 
     async def delete_channel(self, channel_id: int) -> None:
@@ -68,21 +95,133 @@ class ChannelManager(mgr.AbsChannelManager):
         assert await self.has_channel(channel_id)
 
         await self.dbmgr.delete_channel(channel_id)
+        old = None
         for i in range(len(self.channels)):
             if self.channels[i].id == channel_id:
-                del self.channels[i]
+                old = self.channels.pop(i)
                 break
 
+        self._forget(channel_id)
+        await self._close_adapters([old])
+
+    async def _start_adapters(self, channels: list[channel.Channel]):
+        """Start adapters of channels before they are selectable, errors are only printed."""
+        async def start(chan: channel.Channel):
+            try:
+                await chan.adapter.start()
+            except Exception as e:
+                print(f"Error starting adapter of channel {chan.id}: {str(e)}")
+
+        await asyncio.gather(*[start(chan) for chan in channels])
+
+    async def _close_adapters(self, channels: list[channel.Channel]):
+        """Close adapters of replaced or removed channels, errors are only printed."""
+        async def close(chan: channel.Channel):
+            try:
+                await chan.adapter.close()
+            except Exception as e:
+                print(f"Error closing adapter of channel {chan.id}: {str(e)}")
+
+        await asyncio.gather(*[close(chan) for chan in channels])
+
+    def _forget(self, channel_id: int):
+        """Drop runtime state of a removed channel."""
+        self.stats.release(channel_id)
+        for key in self.model_stats.keys_of(channel_id):
+            self.model_stats.release(key)
+        self.affinity.remove(channel_id)
+        self.continuations.remove(channel_id)
+
     async def update_channel(self, chan: channel.Channel) -> None:
         """Update a channel."""
         assert await self.has_channel(chan.id)
 
         await self.dbmgr.update_channel(chan)
+        old = await self.get_channel(chan.id)
+        if old.adapter is not chan.adapter:
+            await self._start_adapters([chan])
         for i in range(len(self.channels)):
             if self.channels[i].id == chan.id:
                 chan.preserve_runtime_vars(self.channels[i])
                 self.channels[i] = chan
                 break
+        if old.adapter is not chan.adapter:
+            await self._close_adapters([old])
+
+    def _changed(self, channels: list[channel.Channel]) -> list[channel.Channel]:
+        """Loaded channels which are new or whose stored fields changed."""
+        def stored(chan: channel.Channel) -> dict:
+            data = channel.Channel.dump_channel(chan)
+            del data["latency"]  # measured at runtime
+            return data
+
+        current = {chan.id: chan for chan in self.channels}
+        return [
+            chan for chan in channels
+            if chan.id not in current or stored(current[chan.id]) != stored(chan)
+        ]
+
+    async def prepare_channels(self, channels: list[channel.Channel]) -> None:
+        """Start adapters of loaded channels which `swap_channels` would add or replace."""
+        await self._start_adapters(self._changed(channels))
+
+    def swap_channels(self, channels: list[channel.Channel]) -> dict:
+        """Replace runtime channels by channels loaded from database.
+
+        Channels whose stored fields are unchanged keep their runtime
+        objects, adapter settings reach them as class attributes. Changed
+        channels are replaced by the loaded objects carrying runtime
+        variables of the old ones, like `update_channel`. Statistics are
+        keyed by id and carry over. In-flight requests keep the channel
+        objects they selected. Nothing is awaited, the swap is atomic for
+        the event loop. Adapters of replaced and removed channels are
+        closed in background afterwards.
+        """
+        current = {chan.id: chan for chan in self.channels}
+        loaded_ids = {chan.id for chan in channels}
+        changed = {chan.id for chan in self._changed(channels)}
+
+        swapped = []
+        added = []
+        updated = []
+        closing = []
+        for chan in channels:
+            old = current.get(chan.id)
+            if old is None:
+                added.append(chan.id)
+            elif chan.id in changed:
+                chan.preserve_runtime_vars(old)
+                chan.latency = old.latency
+                updated.append(chan.id)
+                closing.append(old)
+            else:
+                chan = old
+            swapped.append(chan)
+        removed = [chan_id for chan_id in current if chan_id not in loaded_ids]
+        closing += [current[chan_id] for chan_id in removed]
+
+        in_flight = 0
+        for chan_id in updated + removed:
+            if chan_id in self.stats.slots:
+                in_flight += int(self.stats.in_flight[self.stats.slots[chan_id]])
+
+        self.channels = swapped
+        for chan_id in added:
+            self.stats.allocate(chan_id)
+        self.affinity.add_many(added)
+        for chan_id in removed:
+            self._forget(chan_id)
+
+        if closing:
+            asyncio.get_running_loop().create_task(self._close_adapters(closing))
+
+        return {
+            "added": added,
+            "updated": updated,
+            "removed": removed,
+            "unchanged": len(swapped) - len(added) - len(updated),
+            "in_flight_affected": in_flight,
+        }
 
     async def enable_channel(self, channel_id: int) -> None:
         """Enable a channel."""
@@ -90,14 +229,20 @@ class ChannelManager(mgr.AbsChannelManager):
 
         chan = await self.get_channel(channel_id)
         chan.enabled = True
+        chan.disabled_reason = channel.DisabledReason.NONE
         await self.update_channel(chan)
 
-    async def disable_channel(self, channel_id: int) -> None:
+    async def disable_channel(
+        self,
+        channel_id: int,
+        reason: channel.DisabledReason=channel.DisabledReason.ADMIN,
+    ) -> None:
         """Disable a channel."""
         assert await self.has_channel(channel_id)
 
         chan = await self.get_channel(channel_id)
         chan.enabled = False
+        chan.disabled_reason = reason
         await self.update_channel(chan)
 
     async def test_channel(self, channel_id: int) -> int:
@@ -114,6 +259,7 @@ class ChannelManager(mgr.AbsChannelManager):
             latency = int((time.time() - now)*100)/100
             if not chan.enabled:
                 chan.enabled = True
+                chan.disabled_reason = channel.DisabledReason.NONE
         except Exception as e:
             raise ValueError(error)
         finally:
@@ -133,15 +279,36 @@ class ChannelManager(mgr.AbsChannelManager):
         
         Hard filters, which channel not match these conditions will be excluded:
         1. disabled channels.
-        2. path the client request.
-        3. model name the client request.
+        2. shadow channels, see `ShadowMirror.channel_ids`.
+        3. channels whose circuit breaker is open.
+        4. path the client request.
+        5. model name the client request.
+        6. channels whose context window can't fit the prompt and `max_tokens`,
+           400 `context_length_exceeded` if none can. If `req.trim`, only the
+           untrimmable part of prompt (system and last messages) has to fit.
+        7. channels cooling down after upstream rate limits, 429 if all are.
         
         Soft filters, these filter give score to each channel,
         the channel with the highest score will be selected:
-        1. support for stream mode matching the client request.
-        2. support for multi-round matching the client request.
-        3. support for function calling.
-        4. usage times in lifetime.
+        1. idle time since last use.
+        2. amount of in-flight requests.
+        3. error rate of recent requests.
+        4. latency of recent requests.
+        5. remaining upstream rate limit quota.
+
+        Scores come from `self.stats`, see `ChannelStatsTable.score`. Latency
+        and error rate of the requested (upstream) model in `self.model_stats`
+        are used instead of the channel-wide ones once the model has samples.
+
+        Channels ramping up after automatic recovery only take their
+        `traffic_share()` of requests, unless no other channel is available.
+
+        A channel holding the upstream handle of the conversation is selected
+        before anything else, so that only the new turn is sent, see
+        `ContinuationStore`.
+
+        If affinity routing is enabled, the sticky channel of the conversation
+        is selected before scoring, unless it is saturated, see `AffinityRouter`.
         
         Args:
             path: path of this request.
@@ -160,6 +327,14 @@ class ChannelManager(mgr.AbsChannelManager):
         # delete disabled channels
         channel_copy = list(filter(lambda chan: chan.enabled, channel_copy))
 
+        # delete shadow channels, they only get mirrored requests
+        shadow_ids = shadow.ShadowMirror.channel_ids()
+        if shadow_ids:
+            channel_copy = [chan for chan in channel_copy if chan.id not in shadow_ids]
+
+        # delete channels whose circuit breaker is open
+        channel_copy = list(filter(lambda chan: chan.breaker.allow(), channel_copy))
+
         # delete not matched path
         channel_copy = list(filter(lambda chan: chan.adapter.supported_path() == path, channel_copy))
 
@@ -184,38 +359,184 @@ class ChannelManager(mgr.AbsChannelManager):
                 "No suitable channel found. You may need to contact your admin.",
             )
 
-        # get scores of each option
-        evaluated_objects = await asyncio.gather(*[obj.eval.evaluate() for obj in channel_copy])
-        evaluated_objects = [int(v*100)/100 for v in evaluated_objects]
+        # delete channels whose context window is too small
+        if req.prompt_tokens is None:
+            req.message_tokens, req.prompt_tokens = tokens.count_messages(req.messages)
+
+        prompt_tokens = req.prompt_tokens
+        if req.trim:
+            prompt_tokens = tokens.min_prompt_tokens(req.messages, req.message_tokens)
+
+        fitting = []
+        largest = 0
+        for chan in channel_copy:
+            window = chan.adapter.context_window(chan.model_mapping.get(model_name, model_name))
+            if window is None:
+                fitting.append(chan)
+                continue
+            context, max_output = window
+            largest = max(largest, context)
+            if req.max_tokens is not None and req.max_tokens > max_output:
+                continue
+            if prompt_tokens + (req.max_tokens or 0) <= context:
+                fitting.append(chan)
+
+        if len(fitting) == 0:
+            raise exceptions.QueryHandlingError(
+                400,
+                "context_length_exceeded",
+                f"This model's maximum context length is {largest} tokens. However, you requested {prompt_tokens + (req.max_tokens or 0)} tokens ({prompt_tokens} in the messages, {req.max_tokens or 0} in the completion). Please reduce the length of the messages or completion.",
+                "invalid_request_error",
+                "messages",
+            )
+        channel_copy = fitting
+
+        # delete channels cooling down after rate limits
+        now = clock.now()
+        cooled = [chan for chan in channel_copy if chan.cooldown_until <= now]
+        if len(cooled) == 0:
+            raise exceptions.QueryHandlingError(
+                429,
+                "rate_limit_exceeded",
+                f"All channels are rate limited, retry after {min(chan.cooldown_until for chan in channel_copy) - now:.0f}s.",
+                "requests",
+            )
+        channel_copy = cooled
+
+        # spread choices of one request over channels, unless none would be left
+        if req.excluded_channels:
+            spread = [chan for chan in channel_copy if chan.id not in req.excluded_channels]
+            if len(spread) > 0:
+                channel_copy = spread
+
+        # channels ramping up after recovery only take a share of traffic
+        ramped = [chan for chan in channel_copy if random.random() < chan.traffic_share()]
+        if len(ramped) > 0:
+            channel_copy = ramped
+
+        req.sticky = False
 
-        combined = zip(channel_copy, evaluated_objects)
+        # continue upstream conversation on the channel holding its handle
+        if self.continuations.enabled:
+            chan = self.continuations.pick(req, channel_copy)
+            if chan is not None:
+                return chan
+
+        # stick conversations to channels if affinity routing enabled
+        if self.affinity.enabled:
+            chan = self.affinity.pick(req, channel_copy, self.stats)
+            if chan is not None:
+                req.sticky = True
+                return chan
 
-        scores = sorted(
-            combined,
-            key=lambda x: x[1],
-            reverse=True,
+        # score all candidates at once, channels with the same
+        # highest score are randomly selected
+        slots = np.fromiter(
+            (self.stats.slot(chan.id) for chan in channel_copy),
+            dtype=np.int64,
+            count=len(channel_copy),
+        )
+        model_slots = np.fromiter(
+            (self.model_stats.slot((chan.id, chan.model_mapping.get(model_name, model_name))) for chan in channel_copy),
+            dtype=np.int64,
+            count=len(channel_copy),
         )
 
-        score_dump = []
+        known = self.model_stats.samples[model_slots] > 0
+        latency = np.where(known, self.model_stats.ewma_latency[model_slots], self.stats.ewma_latency[slots])
+        error_rate = np.where(known, self.model_stats.error_rate[model_slots], self.stats.error_rate[slots])
 
-        for chan, score in scores:
-            score_dump.append({
-                "name": chan.name,
-                "id": chan.id,
-                "score": score,
-            })
+        return channel_copy[self.stats.select(slots, latency=latency, error_rate=error_rate)]
 
-        # check if there are channels with the same score in the head
-        # if so, randomly select one of them
-        max_score = scores[0][1]
+    async def select_embedding_channel(self, model: str) -> channel.Channel:
+        """Select a channel serving embedding model.
 
-        max_score_channels = []
+        Same hard filters as `select_channel` except context windows, and
+        the highest score wins, without affinity or continuation.
+        """
+        shadow_ids = shadow.ShadowMirror.channel_ids()
+        channel_copy = []
+        for chan in self.channels:
+            if not chan.enabled or chan.id in shadow_ids or not chan.adapter.embedding_supported():
+                continue
+            if not chan.breaker.allow():
+                continue
+            models = chan.adapter.embedding_models()
+            if chan.model_mapping.get(model, model) in models:
+                channel_copy.append(chan)
 
-        for chan in scores:
-            if chan[1] == max_score:
-                max_score_channels.append(chan[0])
-            else:
-                break
+        if len(channel_copy) == 0:
+            raise exceptions.QueryHandlingError(
+                404,
+                "channel_not_found",
+                "No suitable channel found. You may need to contact your admin.",
+            )
 
-        random.seed(time.time())
-        return random.choice(max_score_channels)
\ No newline at end of file
+        now = clock.now()
+        cooled = [chan for chan in channel_copy if chan.cooldown_until <= now]
+        if len(cooled) == 0:
+            raise exceptions.QueryHandlingError(
+                429,
+                "rate_limit_exceeded",
+                f"All channels are rate limited, retry after {min(chan.cooldown_until for chan in channel_copy) - now:.0f}s.",
+                "requests",
+            )
+        channel_copy = cooled
+
+        ramped = [chan for chan in channel_copy if random.random() < chan.traffic_share()]
+        if len(ramped) > 0:
+            channel_copy = ramped
+
+        slots = np.fromiter(
+            (self.stats.slot(chan.id) for chan in channel_copy),
+            dtype=np.int64,
+            count=len(channel_copy),
+        )
+        return channel_copy[self.stats.select(slots)]
+
+    def apply_rate_limit(self, chan: channel.Channel, info: ratelimit.RateLimitInfo) -> None:
+        """Cool channel down or lower its quota according to upstream rate limit signals."""
+        cooldown = info.cooldown()
+        if cooldown > 0:
+            chan.cooldown_until = max(chan.cooldown_until, clock.now() + cooldown)
+            for current in self.channels:
+                # chan may be the object a reload replaced, cool the loaded one down
+                if current.id == chan.id and current is not chan:
+                    current.cooldown_until = max(current.cooldown_until, chan.cooldown_until)
+                    break
+
+        quota = info.quota()
+        if quota is not None:
+            self.stats.update_quota(self.stats.slot(chan.id), quota, info.quota_reset())
+
+    def add_record(self, chan: channel.Channel, record: evaluation.Record) -> None:
+        """Add a record of request started on channel."""
+        chan.eval.add_record(record)
+        chan.breaker.on_start()
+        if chan.id not in self.stats.slots:
+            return  # removed since selected, don't allocate its statistics again
+        self.stats.request_started(self.stats.slot(chan.id))
+        if record.model is not None:
+            self.model_stats.request_started(self.model_stats.slot((chan.id, record.model)))
+
+    def commit_record(self, chan: channel.Channel, record: evaluation.Record) -> None:
+        """Commit a record of request finished on channel."""
+        record.commit()
+        if record.cancelled:
+            chan.breaker.on_cancelled()
+        else:
+            chan.breaker.on_result(record.success)
+        if chan.id not in self.stats.slots:
+            return  # removed while in flight, its statistics are gone
+        self.stats.request_finished(self.stats.slot(chan.id), record)
+        if record.model is not None:
+            self.model_stats.request_finished(self.model_stats.slot((chan.id, record.model)), record)
+
+        info = record.rate_limit
+        if isinstance(record.error, exceptions.RateLimitedError):
+            info = record.error.info
+        if info is not None:
+            self.apply_rate_limit(chan, info)
+
+        if self.affinity.enabled:
+            self.affinity.observe(record)
\ No newline at end of file
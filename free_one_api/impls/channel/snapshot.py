@@ -0,0 +1,93 @@
+"""Snapshots of channel runtime statistics, survive restarts."""
+import os
+import json
+import time
+
+from ...models.channel import mgr as chanmgr
+
+
+class StatsSnapshot:
+    """Saves and restores runtime statistics of all channels in a local file.
+
+    Restored statistics are decayed by the age of snapshot, with `half_life`.
+    """
+
+    enabled: bool = True
+
+    path: str = "./data/stats_snapshot.json"
+
+    interval: int = 60
+    """Seconds between two snapshots."""
+
+    half_life: float = 600
+    """Seconds after which restored statistics weigh a half."""
+
+    max_age: float = 86400
+    """Snapshots older than this are ignored."""
+
+    def capture(self, mgr: chanmgr.AbsChannelManager) -> dict:
+        """Capture statistics of all channels, must be called in event loop thread."""
+        channels = {}
+        for chan in mgr.channels:
+            channels[str(chan.id)] = {
+                "stats": mgr.stats.export(chan.id),
+                "models": {
+                    key[1]: mgr.model_stats.export(key)
+                    for key in mgr.model_stats.keys_of(chan.id)
+                },
+                "fail_count": chan.fail_count,
+                "breaker": chan.breaker.export(),
+            }
+        return {
+            "time": time.time(),
+            "channels": channels,
+        }
+
+    def write(self, data: dict):
+        """Write a captured snapshot, blocking, call it in executor."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def read(self) -> dict:
+        """Read last snapshot, None if missing or broken."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading stats snapshot: {str(e)}")
+            return None
+
+    def restore(self, mgr: chanmgr.AbsChannelManager) -> int:
+        """Restore statistics of loaded channels, returns amount of restored channels."""
+        data = self.read()
+        if data is None:
+            return 0
+
+        age = max(0.0, time.time() - data.get("time", 0))
+        if age > self.max_age:
+            return 0
+        weight = 0.5 ** (age / self.half_life)
+
+        restored = 0
+        for chan in mgr.channels:
+            saved = data.get("channels", {}).get(str(chan.id))
+            if saved is None:
+                continue
+
+            mgr.stats.restore(chan.id, saved.get("stats", {}), weight)
+            for model, row in saved.get("models", {}).items():
+                mgr.model_stats.restore((chan.id, model), row, weight)
+
+            chan.fail_count = int(round(saved.get("fail_count", 0) * weight))
+            chan.breaker.restore(saved.get("breaker", {}))
+            restored += 1
+
+        return restored
@@ -0,0 +1,286 @@
+"""Runtime statistics of channels, stored as a struct of arrays."""
+import random
+
+import numpy as np
+
+from ...models.channel import evaluation
+from ...common import clock
+
+
+class ChannelStatsTable:
+    """Runtime statistics table of channels.
+
+    Every channel owns a slot (row index) of this table, each statistic
+    is a contiguous numpy array indexed by slot. Scoring the candidates
+    of a request is one vectorized expression over their slots.
+
+    Keys are usually channel ids, but any hashable works, e.g.
+    (channel id, model name) for per-model statistics.
+    """
+
+    ewma_alpha: float = 0.2
+    """Smoothing factor of EWMA columns."""
+
+    error_penalty: float = 60.0
+    """Score penalty of a channel whose error rate is 1."""
+
+    idle_step: float = 5.0
+    """Idle time is rounded to this step, so that channels idle for about
+    the same time get the same score and are randomly selected."""
+
+    quota_threshold: float = 0.2
+    """Remaining quota fraction below which channels are penalized."""
+
+    quota_penalty: float = 60.0
+    """Score penalty of a channel whose remaining quota is 0."""
+
+    quota_ttl: float = 60.0
+    """Seconds a reported quota is trusted if upstream gave no reset time."""
+
+    chars_per_token: float = 4.0
+    """Chars of a token on average, to estimate output tokens."""
+
+    initial_size: int = 64
+    """Initial row amount of the table, doubled when exhausted."""
+
+    columns: dict[str, tuple[np.dtype, float]] = {
+        "in_flight": (np.int32, 0),
+        "ewma_latency": (np.float64, 0.0),
+        "ewma_tps": (np.float64, 0.0),
+        "error_rate": (np.float64, 0.0),
+        "last_use": (np.float64, 0.0),
+        "last_success": (np.float64, 0.0),
+        "capacity": (np.float64, np.inf),
+        "quota": (np.float64, 1.0),
+        "quota_reset_at": (np.float64, 0.0),
+        "samples": (np.int64, 0),
+    }
+    """Column name to (dtype, default value)."""
+
+    persisted: tuple[str, ...] = ("ewma_latency", "ewma_tps", "error_rate", "samples")
+    """Columns saved in snapshots, the others only make sense in this process."""
+
+    slots: dict[int, int]
+    """Channel id to slot."""
+
+    free_slots: list[int]
+    """Released slots, reused before growing the table."""
+
+    size: int
+    """Amount of rows ever allocated."""
+
+    in_flight: np.ndarray
+    """Amount of requests being processed."""
+
+    ewma_latency: np.ndarray
+    """EWMA of latency (time to first response) of successful requests."""
+
+    ewma_tps: np.ndarray
+    """EWMA of output tokens per second after first response, estimated from chars."""
+
+    error_rate: np.ndarray
+    """EWMA of request failures, 0 is always success, 1 is always failure."""
+
+    last_use: np.ndarray
+    """Time of last request started or finished."""
+
+    last_success: np.ndarray
+    """Time of last successful request finished, 0 if never."""
+
+    capacity: np.ndarray
+    """Maximum amount of concurrent requests, inf if unlimited."""
+
+    quota: np.ndarray
+    """Remaining fraction of upstream rate limit quota, 1 if unknown."""
+
+    quota_reset_at: np.ndarray
+    """Time quota is considered full again."""
+
+    samples: np.ndarray
+    """Amount of finished requests."""
+
+    def __init__(self):
+        self.slots = {}
+        self.free_slots = []
+        self.size = 0
+
+        for name, (dtype, default) in self.columns.items():
+            setattr(self, name, np.full(self.initial_size, default, dtype=dtype))
+
+    def _grow(self):
+        """Double the row amount of every column."""
+        old_size = len(self.in_flight)
+
+        for name, (dtype, default) in self.columns.items():
+            column = np.full(old_size * 2, default, dtype=dtype)
+            column[:old_size] = getattr(self, name)
+            setattr(self, name, column)
+
+    def allocate(self, channel_id: int) -> int:
+        """Allocate a slot for channel, returns existing slot if allocated."""
+        if channel_id in self.slots:
+            return self.slots[channel_id]
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.size >= len(self.in_flight):
+                self._grow()
+            slot = self.size
+            self.size += 1
+
+        for name, (dtype, default) in self.columns.items():
+            getattr(self, name)[slot] = default
+        self.last_use[slot] = clock.now()
+
+        self.slots[channel_id] = slot
+        return slot
+
+    def release(self, channel_id: int):
+        """Release the slot of channel."""
+        slot = self.slots.pop(channel_id, None)
+        if slot is not None:
+            self.free_slots.append(slot)
+
+    def slot(self, channel_id: int) -> int:
+        """Get slot of channel, allocate one if not allocated."""
+        slot = self.slots.get(channel_id)
+        if slot is None:
+            slot = self.allocate(channel_id)
+        return slot
+
+    def request_started(self, slot: int):
+        """Account a request started on slot."""
+        self.in_flight[slot] += 1
+        self.last_use[slot] = clock.now()
+
+    def request_finished(self, slot: int, record: evaluation.Record):
+        """Account a committed request record on slot."""
+        a = self.ewma_alpha
+
+        if self.in_flight[slot] > 0:
+            self.in_flight[slot] -= 1
+        self.last_use[slot] = clock.now()
+
+        if record.cancelled:
+            return  # tells nothing about the channel
+
+        if record.success:
+            self.last_success[slot] = self.last_use[slot]
+
+        if record.success and record.latency >= 0:
+            if self.samples[slot] == 0:
+                self.ewma_latency[slot] = record.latency
+            else:
+                self.ewma_latency[slot] += a * (record.latency - self.ewma_latency[slot])
+
+            generating = record.end_time - record.start_time - record.latency
+            if generating > 0 and record.resp_message_length > 0:
+                tps = record.resp_message_length / self.chars_per_token / generating
+                if self.ewma_tps[slot] == 0:
+                    self.ewma_tps[slot] = tps
+                else:
+                    self.ewma_tps[slot] += a * (tps - self.ewma_tps[slot])
+
+        self.error_rate[slot] += a * ((0.0 if record.success else 1.0) - self.error_rate[slot])
+        self.samples[slot] += 1
+
+    def update_quota(self, slot: int, quota: float, reset: float=None):
+        """Account remaining quota reported by upstream, reset is in seconds."""
+        self.quota[slot] = quota
+        self.quota_reset_at[slot] = clock.now() + (reset if reset is not None else self.quota_ttl)
+
+    def score(
+        self,
+        slots: np.ndarray,
+        now: float=None,
+        latency: np.ndarray=None,
+        error_rate: np.ndarray=None,
+    ) -> np.ndarray:
+        """Score slots, the higher the better.
+
+        Sum up:
+
+         - idle time rounded to `idle_step`, 0 if using
+         - `0 - in_flight * idle_step`
+         - `0 - error_rate * error_penalty`
+         - `0 - ewma_latency`
+         - `0 - quota_penalty` scaled by how far remaining quota is below `quota_threshold`
+
+        Slots whose in-flight requests reached their capacity get `-inf`.
+
+        `latency` and `error_rate` replace the columns of slots if given,
+        e.g. with statistics of the requested model.
+        """
+        if now is None:
+            now = clock.now()
+
+        in_flight = self.in_flight[slots]
+
+        if latency is None:
+            latency = self.ewma_latency[slots]
+        if error_rate is None:
+            error_rate = self.error_rate[slots]
+
+        idle = np.round((now - self.last_use[slots]) / self.idle_step) * self.idle_step
+        idle = np.where(in_flight > 0, 0.0, idle)
+
+        scores = idle \
+            - in_flight * self.idle_step \
+            - error_rate * self.error_penalty \
+            - latency
+
+        if self.quota_threshold > 0:
+            quota = np.where(now >= self.quota_reset_at[slots], 1.0, self.quota[slots])
+            shortage = np.clip(self.quota_threshold - quota, 0.0, None) / self.quota_threshold
+            scores = scores - shortage * self.quota_penalty
+
+        return np.where(in_flight >= self.capacity[slots], -np.inf, scores)
+
+    def select(self, slots: np.ndarray, now: float=None, **overrides) -> int:
+        """Select the index (in `slots`) of the best slot.
+
+        Ties are broken randomly. `overrides` are passed to `score`.
+        """
+        scores = self.score(slots, now, **overrides)
+        best = np.flatnonzero(scores == scores.max())
+        if len(best) == 0:  # all scores are nan
+            return random.randrange(len(slots))
+        return int(best[random.randrange(len(best))])
+
+    def export(self, key) -> dict:
+        """Persisted columns of key, empty if not allocated."""
+        slot = self.slots.get(key)
+        if slot is None:
+            return {}
+        return {name: getattr(self, name)[slot].item() for name in self.persisted}
+
+    def restore(self, key, row: dict, weight: float):
+        """Restore exported columns of key, decayed by weight in [0, 1].
+
+        Decaying moves statistics toward those of a new channel,
+        samples are scaled too, so fresh records take over quickly.
+        """
+        slot = self.slot(key)
+        for name in self.persisted:
+            if name not in row:
+                continue
+            value = row[name] * weight
+            if name == "samples":
+                value = int(round(value))
+            getattr(self, name)[slot] = value
+
+    def keys_of(self, channel_id: int) -> list:
+        """Keys of per-model rows of channel, i.e. (channel id, model)."""
+        return [key for key in self.slots if isinstance(key, tuple) and key[0] == channel_id]
+
+    def dump(self, channel_id: int) -> dict:
+        """Dump statistics of channel."""
+        slot = self.slots.get(channel_id)
+        if slot is None:
+            return {}
+        return {
+            name: getattr(self, name)[slot].item()
+            for name in self.columns
+        }
+
@@ -0,0 +1,265 @@
+import json
+import time
+import asyncio
+import collections
+
+from ...models.conversation import mgr as conversationmgr
+from ...models.database import db
+from ...entities import conversation, request, exceptions
+from ...common import tokens
+
+
+class ConversationManager(conversationmgr.AbsConversationManager):
+    """Conversations in a memory LRU, written behind to database.
+
+    History of a conversation is serialized and counted once, when it is
+    stored, instead of being uploaded, parsed and counted on every turn.
+    Committed turns are written in background after `write_delay`, a
+    conversation with several turns in that window is written once.
+    """
+
+    cache_size: int = 1024
+    """Maximum amount of conversations kept in memory."""
+
+    ttl: int = 7 * 86400
+    """Seconds a conversation is kept since its last turn."""
+
+    max_messages: int = 200
+    """Oldest non-system messages are dropped above this amount."""
+
+    max_tokens: int = 128000
+    """Oldest non-system messages are dropped above this amount of estimated tokens."""
+
+    purge_interval: int = 3600
+    """Seconds between purges of expired conversations."""
+
+    parse_rate_alpha: float = 0.05
+    """Smoothing factor of the EWMA of body parse time per byte."""
+
+    write_delay: float = 1.0
+    """Seconds committed turns wait before being written to database."""
+
+    def __init__(self, dbmgr: db.DatabaseInterface):
+        self.dbmgr = dbmgr
+
+        self.cache: collections.OrderedDict[str, conversation.Conversation] = collections.OrderedDict()
+        """Conversation id to conversation, least recently used first."""
+
+        self.dirty: dict[str, conversation.Conversation] = {}
+        """Conversations with turns not written to database yet."""
+
+        self.writer: asyncio.Task = None
+        self.write_lock = asyncio.Lock()
+        """Held while writing, so deletes don't race with writes of the same rows."""
+
+        self.writes = 0
+        self.coalesced_writes = 0
+        """Turns written together with a later turn of the same conversation."""
+
+        self.turns = 0
+        self.created = 0
+        self.expired = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.received_bytes = 0
+        """Bytes of request bodies of conversation turns."""
+
+        self.history_bytes = 0
+        """Bytes of history clients did not have to send."""
+
+        self.reused_tokens = 0
+        """Tokens of history which were not counted again."""
+
+        self.parse_seconds_per_byte = 0.0
+        """EWMA of request body parse time per byte."""
+
+    def _remember(self, conv: conversation.Conversation):
+        self.cache[conv.id] = conv
+        self.cache.move_to_end(conv.id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _expired(self, conv: conversation.Conversation, now: float) -> bool:
+        return now - conv.updated_at > self.ttl
+
+    async def _get(self, conversation_id: str) -> conversation.Conversation:
+        conv = self.cache.get(conversation_id)
+        if conv is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(conversation_id)
+            return conv
+
+        self.cache_misses += 1
+        # evicted from cache before written
+        conv = self.dirty.get(conversation_id)
+        if conv is None:
+            conv = await self.dbmgr.get_conversation(conversation_id)
+        if conv is not None:
+            self._remember(conv)
+        return conv
+
+    def _observe_parse(self, body_size: int, parse_seconds: float):
+        if body_size <= 0:
+            return
+        rate = parse_seconds / body_size
+        if self.parse_seconds_per_byte == 0:
+            self.parse_seconds_per_byte = rate
+        else:
+            self.parse_seconds_per_byte += self.parse_rate_alpha * (rate - self.parse_seconds_per_byte)
+
+    async def resume(
+        self,
+        conversation_id: str,
+        owner: int,
+        req: request.Request,
+        raw_data: dict,
+        parse_seconds: float,
+    ) -> conversation.Conversation:
+        now = time.time()
+
+        if conversation_id == "new":
+            conv = conversation.Conversation.make_new(owner)
+            self._remember(conv)
+            self.created += 1
+        else:
+            conv = await self._get(conversation_id)
+            if conv is not None and self._expired(conv, now):
+                await self.delete(conv.id, conv.owner)
+                self.expired += 1
+                conv = None
+            if conv is None or conv.owner != owner:
+                raise exceptions.QueryHandlingError(
+                    404,
+                    "conversation_not_found",
+                    f"Conversation {conversation_id} does not exist or has expired, start a new one with X-Conversation-Id: new.",
+                    "invalid_request_error",
+                    "X-Conversation-Id",
+                )
+
+        turn_tokens, _ = tokens.count_messages(req.messages)
+
+        req.conversation = conv
+        req.turn_messages = req.messages
+        req.turn_tokens = turn_tokens
+
+        req.messages = conv.messages + req.messages
+        req.message_tokens = conv.message_tokens + turn_tokens
+        req.prompt_tokens = sum(req.message_tokens) + tokens.REPLY_PRIMER_TOKENS
+
+        if req.raw_body is not None:
+            body_size = len(req.raw_body)
+            raw_data["messages"] = req.messages
+            req.raw_body = json.dumps(raw_data).encode("utf-8")
+        else:
+            body_size = 0
+
+        self.received_bytes += body_size
+        self.history_bytes += conv.size
+        self.reused_tokens += sum(conv.message_tokens)
+        self._observe_parse(body_size, parse_seconds)
+
+        return conv
+
+    def _enforce_limits(self, conv: conversation.Conversation):
+        """Drop oldest non-system messages until the conversation fits its limits."""
+        messages, message_tokens, dropped, _ = tokens.trim_messages(
+            conv.messages,
+            conv.message_tokens,
+            self.max_tokens,
+        )
+
+        while len(messages) > self.max_messages:
+            for i, message in enumerate(messages[:-1]):
+                if message.get("role") != "system":
+                    del messages[i]
+                    del message_tokens[i]
+                    dropped += 1
+                    break
+            else:
+                break
+
+        if dropped:
+            conv.messages = messages
+            conv.message_tokens = message_tokens
+            conv.size = len(json.dumps(messages))
+
+    async def commit(self, req: request.Request, reply: str) -> None:
+        conv = req.conversation
+        if conv is None:
+            return
+
+        reply_message = {"role": "assistant", "content": reply}
+        turn = req.turn_messages + [reply_message]
+
+        # appended to the shared object, concurrent turns are kept in completion order
+        conv.messages = conv.messages + turn
+        conv.message_tokens = conv.message_tokens + req.turn_tokens + [tokens.count_message(reply_message)]
+        conv.size += sum(len(json.dumps(message)) + 2 for message in turn)
+        conv.updated_at = time.time()
+        self._enforce_limits(conv)
+
+        self.turns += 1
+        self._remember(conv)
+
+        if conv.id in self.dirty:
+            self.coalesced_writes += 1
+        self.dirty[conv.id] = conv
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.get_running_loop().create_task(self._write_later())
+
+    async def _write_later(self):
+        while self.dirty:
+            await asyncio.sleep(self.write_delay)
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self.write_lock:
+            dirty, self.dirty = self.dirty, {}
+            for conv in dirty.values():
+                try:
+                    await self.dbmgr.save_conversation(conv)
+                    self.writes += 1
+                except Exception as e:
+                    print(f"Error saving conversation {conv.id}: {str(e)}")
+
+    async def delete(self, conversation_id: str, owner: int) -> bool:
+        conv = await self._get(conversation_id)
+        if conv is None or conv.owner != owner:
+            return False
+
+        self.cache.pop(conversation_id, None)
+        async with self.write_lock:
+            self.dirty.pop(conversation_id, None)
+            await self.dbmgr.delete_conversation(conversation_id)
+        return True
+
+    async def purge_expired(self) -> int:
+        now = time.time()
+        for conv in [c for c in self.cache.values() if self._expired(c, now)]:
+            del self.cache[conv.id]
+        async with self.write_lock:
+            for conv in [c for c in self.dirty.values() if self._expired(c, now)]:
+                del self.dirty[conv.id]
+            deleted = await self.dbmgr.delete_conversations_before(now - self.ttl)
+        self.expired += deleted
+        return deleted
+
+    def get_stats(self) -> dict:
+        saved_bytes = self.history_bytes
+        return {
+            "cached": len(self.cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "created": self.created,
+            "turns": self.turns,
+            "writes": self.writes,
+            "coalesced_writes": self.coalesced_writes,
+            "pending_writes": len(self.dirty),
+            "expired": self.expired,
+            "received_bytes": self.received_bytes,
+            "saved_upload_bytes": saved_bytes,
+            "saved_upload_ratio": saved_bytes / (saved_bytes + self.received_bytes) if saved_bytes else 0.0,
+            "saved_parse_seconds": round(saved_bytes * self.parse_seconds_per_byte, 6),
+            "reused_tokens": self.reused_tokens,
+        }
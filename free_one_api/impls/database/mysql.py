@@ -4,7 +4,7 @@ import aiomysql
 
 from ...models.database import db as dbmod
 from ...models import adapter
-from ...entities import channel, apikey
+from ...entities import channel, apikey, conversation
 from ..channel import eval as evl
 
 channel_table_sql = """
@@ -14,7 +14,8 @@ CREATE TABLE IF NOT EXISTS channel (
     adapter JSON NOT NULL,
     model_mapping JSON NOT NULL,
     enabled TINYINT(1) NOT NULL,
-    latency INT NOT NULL
+    latency INT NOT NULL,
+    disabled_reason VARCHAR(32) NOT NULL DEFAULT ''
 )
 """
 
@@ -27,6 +28,18 @@ CREATE TABLE IF NOT EXISTS apikey (
 )
 """
 
+conversation_table_sql = """
+CREATE TABLE IF NOT EXISTS conversation (
+    id VARCHAR(64) PRIMARY KEY,
+    owner INT NOT NULL,
+    messages LONGTEXT NOT NULL,
+    message_tokens MEDIUMTEXT NOT NULL,
+    created_at DOUBLE NOT NULL,
+    updated_at DOUBLE NOT NULL,
+    INDEX idx_updated_at (updated_at)
+)
+"""
+
 class MySQLDB(dbmod.DatabaseInterface):
 
     def __init__(self, config: dict):
@@ -52,12 +65,18 @@ class MySQLDB(dbmod.DatabaseInterface):
         async with conn.cursor() as cursor:
             await cursor.execute(channel_table_sql)
             await cursor.execute(key_table_sql)
+            await cursor.execute(conversation_table_sql)
+
+            # migrate channel tables created before disabled_reason
+            await cursor.execute("SHOW COLUMNS FROM channel LIKE 'disabled_reason'")
+            if await cursor.fetchone() is None:
+                await cursor.execute("ALTER TABLE channel ADD COLUMN disabled_reason VARCHAR(32) NOT NULL DEFAULT ''")
         conn.close()
 
     async def list_channels(self) -> list[channel.Channel]:
         conn = await self.get_connection()
         async with conn.cursor() as cursor:
-            await cursor.execute("SELECT * FROM channel")
+            await cursor.execute("SELECT id, name, adapter, model_mapping, enabled, latency, disabled_reason FROM channel")
             rows = await cursor.fetchall()
 
             channels = []
@@ -71,6 +90,7 @@ class MySQLDB(dbmod.DatabaseInterface):
                         enabled=bool(row[4]),
                         latency=row[5],
                         eval=evl.ChannelEvaluation(),
+                        disabled_reason=channel.DisabledReason(row[6] or ""),
                     ))
                 except Exception as e:
                     pass  # Handle the error appropriately
@@ -80,12 +100,13 @@ class MySQLDB(dbmod.DatabaseInterface):
     async def insert_channel(self, chan: channel.Channel) -> None:
         conn = await self.get_connection()
         async with conn.cursor() as cursor:
-            await cursor.execute("INSERT INTO channel (name, adapter, model_mapping, enabled, latency) VALUES (%s, %s, %s, %s, %s)", (
+            await cursor.execute("INSERT INTO channel (name, adapter, model_mapping, enabled, latency, disabled_reason) VALUES (%s, %s, %s, %s, %s, %s)", (
                 chan.name,
                 json.dumps(adapter.dump_adapter(chan.adapter)),
                 json.dumps(chan.model_mapping),
                 int(chan.enabled),
                 chan.latency,
+                chan.disabled_reason.value,
             ))
             await cursor.execute("SELECT LAST_INSERT_ID()")
             row = await cursor.fetchone()
@@ -95,12 +116,13 @@ class MySQLDB(dbmod.DatabaseInterface):
     async def update_channel(self, chan: channel.Channel) -> None:
         conn = await self.get_connection()
         async with conn.cursor() as cursor:
-            await cursor.execute("UPDATE channel SET name = %s, adapter = %s, model_mapping = %s, enabled = %s, latency = %s WHERE id = %s", (
+            await cursor.execute("UPDATE channel SET name = %s, adapter = %s, model_mapping = %s, enabled = %s, latency = %s, disabled_reason = %s WHERE id = %s", (
                 chan.name,
                 json.dumps(adapter.dump_adapter(chan.adapter)),
                 json.dumps(chan.model_mapping),
                 int(chan.enabled),
                 chan.latency,
+                chan.disabled_reason.value,
                 chan.id,
             ))
         conn.close()
@@ -152,4 +174,48 @@ class MySQLDB(dbmod.DatabaseInterface):
         conn = await self.get_connection()
         async with conn.cursor() as cursor:
             await cursor.execute("DELETE FROM apikey WHERE id = %s", (key_id,))
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+    async def get_conversation(self, conversation_id: str) -> conversation.Conversation:
+        conn = await self.get_connection()
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT id, owner, messages, message_tokens, created_at, updated_at FROM conversation WHERE id = %s", (conversation_id,))
+            row = await cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return conversation.Conversation(
+            id=row[0],
+            owner=row[1],
+            messages=json.loads(row[2]),
+            message_tokens=json.loads(row[3]),
+            size=len(row[2]),
+            created_at=row[4],
+            updated_at=row[5],
+        )
+
+    async def save_conversation(self, conv: conversation.Conversation) -> None:
+        conn = await self.get_connection()
+        async with conn.cursor() as cursor:
+            await cursor.execute("REPLACE INTO conversation (id, owner, messages, message_tokens, created_at, updated_at) VALUES (%s, %s, %s, %s, %s, %s)", (
+                conv.id,
+                conv.owner,
+                json.dumps(conv.messages),
+                json.dumps(conv.message_tokens),
+                conv.created_at,
+                conv.updated_at,
+            ))
+        conn.close()
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        conn = await self.get_connection()
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM conversation WHERE id = %s", (conversation_id,))
+        conn.close()
+
+    async def delete_conversations_before(self, updated_at: float) -> int:
+        conn = await self.get_connection()
+        async with conn.cursor() as cursor:
+            deleted = await cursor.execute("DELETE FROM conversation WHERE updated_at < %s", (updated_at,))
+        conn.close()
+        return deleted
@@ -0,0 +1,282 @@
+"""Micro-batching of embedding requests."""
+import json
+import time
+import asyncio
+
+import httpx
+
+from ...models.channel import mgr as channelmgr
+from ...models.channel import evaluation
+from ...entities import exceptions
+
+
+class Batch:
+    """Inputs of concurrent requests, sent upstream in one call."""
+
+    model: str
+
+    options: dict
+    """Embeddings parameters shared by all requests, e.g. dimensions."""
+
+    inputs: list
+
+    waiters: list[tuple[int, int, asyncio.Future]]
+    """(offset, amount of inputs, future) of every request."""
+
+    def __init__(self, model: str, options: dict):
+        self.model = model
+        self.options = options
+        self.inputs = []
+        self.waiters = []
+        self.timer: asyncio.TimerHandle = None
+
+    def add(self, inputs: list, future: asyncio.Future):
+        self.waiters.append((len(self.inputs), len(inputs), future))
+        self.inputs.extend(inputs)
+
+    def resolve(self, embeddings: list, prompt_tokens: int, channel_id: int):
+        """Scatter embeddings back, usage is split by length of inputs."""
+        weights = [
+            sum(len(item) for item in self.inputs[offset:offset + amount])
+            for offset, amount, _ in self.waiters
+        ]
+        total = sum(weights) or 1
+        for (offset, amount, future), weight in zip(self.waiters, weights):
+            if not future.done():
+                future.set_result((
+                    embeddings[offset:offset + amount],
+                    round(prompt_tokens * weight / total),
+                    channel_id,
+                ))
+
+    def fail(self, error: Exception):
+        for _, _, future in self.waiters:
+            if not future.done():
+                future.set_exception(error)
+
+    def cancel(self):
+        for _, _, future in self.waiters:
+            future.cancel()
+
+    def split(self) -> list['Batch']:
+        """Two batches of the first and the second half of requests."""
+        half = len(self.waiters) // 2
+        batches = []
+        for waiters in (self.waiters[:half], self.waiters[half:]):
+            batch = Batch(self.model, self.options)
+            for offset, amount, future in waiters:
+                batch.add(self.inputs[offset:offset + amount], future)
+            batches.append(batch)
+        return batches
+
+
+def client_error(e: Exception) -> exceptions.QueryHandlingError:
+    """Error of an upstream 4xx response for the client, None if e is not one.
+
+    Upstream rejected the inputs, so the channel is not to blame and
+    other channels would reject them too. 429 is raised as
+    `RateLimitedError` by adapters, it is not a client error.
+    """
+    if not isinstance(e, httpx.HTTPStatusError) or not 400 <= e.response.status_code < 500:
+        return None
+
+    error = {}
+    try:
+        error = e.response.json().get("error") or {}
+    except Exception:
+        pass
+    if not isinstance(error, dict):
+        error = {"message": str(error)}
+    return exceptions.QueryHandlingError(
+        e.response.status_code,
+        error.get("code"),
+        error.get("message") or f"Upstream rejected the request with status {e.response.status_code}.",
+        error.get("type") or "invalid_request_error",
+        error.get("param"),
+    )
+
+
+def input_kind(inputs: list) -> str:
+    """`text` or `tokens`, None if a request mixes strings and token arrays."""
+    if all(isinstance(item, str) for item in inputs):
+        return "text"
+    if all(isinstance(item, list) for item in inputs):
+        return "tokens"
+    return None
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests into one upstream call.
+
+    Requests for the same model, parameters and kind of input (strings or
+    token arrays) arriving within `max_wait` seconds of the first one are
+    sent together, as one input array. A batch is sent earlier once it
+    holds `max_batch_size` inputs. Failed calls are retried on other
+    channels as a whole. If upstream rejects a batch with a 4xx, it is
+    split in halves until the rejected requests are alone, and only
+    those fail, without blaming the channel.
+    """
+
+    enabled: bool = True
+
+    max_wait: float = 0.005
+    """Seconds the first request of a batch waits for others."""
+
+    max_batch_size: int = 256
+    """Maximum inputs of an upstream call, larger requests are sent alone."""
+
+    retries: int = 3
+    """Upstream calls of a batch before its requests fail, at least one is made."""
+
+    chanmgr: channelmgr.AbsChannelManager
+
+    pending: dict[str, Batch]
+    """Batches still collecting requests, by model and parameters."""
+
+    def __init__(self, chanmgr: channelmgr.AbsChannelManager):
+        self.chanmgr = chanmgr
+        self.pending = {}
+        self.tasks: set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.inputs = 0
+        self.batches = 0
+        self.upstream_calls = 0
+        self.failed_calls = 0
+        self.rejected_calls = 0
+        """Upstream calls answered with a 4xx, not counted as failures of channels."""
+
+        self.splits = 0
+
+    async def embed(self, model: str, inputs: list, options: dict) -> tuple[list, int, int]:
+        """Embed inputs of a request, together with concurrent requests.
+
+        Returns:
+            list: embeddings, in order of inputs.
+            int: prompt tokens of this request's share of the batch.
+            int: id of the channel which served the batch.
+        """
+        self.requests += 1
+        self.inputs += len(inputs)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        kind = input_kind(inputs)
+        if not self.enabled or kind is None or len(inputs) >= self.max_batch_size:
+            batch = Batch(model, options)
+            batch.add(inputs, future)
+            self._send(batch)
+            return await future
+
+        key = json.dumps([model, kind, options], sort_keys=True)
+        batch = self.pending.get(key)
+        if batch is not None and len(batch.inputs) + len(inputs) > self.max_batch_size:
+            self._flush(key)
+            batch = None
+
+        if batch is None:
+            batch = Batch(model, options)
+            batch.timer = loop.call_later(self.max_wait, self._flush, key)
+            self.pending[key] = batch
+
+        batch.add(inputs, future)
+        if len(batch.inputs) >= self.max_batch_size:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: str):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        self._send(batch)
+
+    def _send(self, batch: Batch):
+        self.batches += 1
+        task = asyncio.get_running_loop().create_task(self._call(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _call(self, batch: Batch):
+        # nobody else resolves the waiters, they would hang forever
+        try:
+            await self._attempt(batch)
+        except asyncio.CancelledError:
+            batch.cancel()
+            raise
+        except Exception as e:
+            print(f"Error in embedding batch: {str(e)}")
+            batch.fail(e)
+
+    async def _attempt(self, batch: Batch):
+        """Call upstream until the batch is resolved, rejected or out of retries."""
+        error: Exception = None
+        for attempt in range(max(self.retries, 1)):
+            try:
+                chan = await self.chanmgr.select_embedding_channel(batch.model)
+            except Exception as e:
+                error = e
+                break
+
+            record = evaluation.Record()
+            record.model = chan.model_mapping.get(batch.model, batch.model)
+            record.req_messages_length = sum(len(item) for item in batch.inputs)
+            self.chanmgr.add_record(chan, record)
+
+            before = time.time()
+            record.start_time = before
+            self.upstream_calls += 1
+            try:
+                embeddings, prompt_tokens, record.rate_limit = await chan.adapter.embed(record.model, batch.inputs, batch.options)
+                if len(embeddings) != len(batch.inputs):
+                    raise ValueError(f"Upstream returned {len(embeddings)} embeddings for {len(batch.inputs)} inputs")
+                record.latency = time.time() - before
+                record.success = True
+            except Exception as e:
+                rejected = client_error(e)
+                if rejected is not None:
+                    # upstream works, the inputs are bad, no latency sample either
+                    record.success = True
+                    self.rejected_calls += 1
+                    self._reject(batch, rejected)
+                    return
+                record.error = e
+                record.success = False
+                self.failed_calls += 1
+                error = e
+                continue
+            finally:
+                self.chanmgr.commit_record(chan, record)
+
+            batch.resolve(embeddings, prompt_tokens, chan.id)
+            return
+
+        batch.fail(error)
+
+    def _reject(self, batch: Batch, error: exceptions.QueryHandlingError):
+        """Fail a lone request, or find the rejected ones among a batch."""
+        if len(batch.waiters) == 1:
+            batch.fail(error)
+            return
+        self.splits += 1
+        for half in batch.split():
+            self._send(half)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_wait": self.max_wait,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "batches": self.batches,
+            "upstream_calls": self.upstream_calls,
+            "failed_calls": self.failed_calls,
+            "rejected_calls": self.rejected_calls,
+            "splits": self.splits,
+            "requests_per_batch": self.requests / self.batches if self.batches else None,
+            "inputs_per_batch": self.inputs / self.batches if self.batches else None,
+            "pending": len(self.pending),
+        }
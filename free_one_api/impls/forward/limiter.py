@@ -0,0 +1,60 @@
+"""Proxy side enforcement of `stop` and `max_tokens`."""
+from ...entities import response
+from ...common import stopseq, tokens
+
+
+class OutputLimiter:
+    """Cuts completion text at stop sequences or `max_tokens`.
+
+    Completion tokens are counted chunk by chunk, only new text is tokenized.
+    """
+
+    matcher: stopseq.StopMatcher
+    """None if no stop sequence."""
+
+    max_tokens: int
+    """None if unlimited."""
+
+    completion_tokens: int
+    """Tokens emitted so far."""
+
+    finish_reason: response.FinishReason
+    """Set once a limit is hit, None before."""
+
+    def __init__(self, stop: list[str], max_tokens: int):
+        self.matcher = stopseq.StopMatcher(stop) if stop else None
+        self.max_tokens = max_tokens
+        self.completion_tokens = 0
+        self.finish_reason = None
+
+    @property
+    def active(self) -> bool:
+        return self.matcher is not None or self.max_tokens is not None
+
+    def feed(self, text: str) -> str:
+        """Feed a chunk, returns text to emit. Check `finish_reason` afterwards."""
+        if self.finish_reason is not None:
+            return ""
+
+        if self.matcher is not None:
+            text, stopped = self.matcher.feed(text)
+            if stopped:
+                self.finish_reason = response.FinishReason.STOP
+
+        return self._count(text)
+
+    def flush(self) -> str:
+        """End of upstream response, returns held back text."""
+        if self.finish_reason is not None or self.matcher is None:
+            return ""
+        return self._count(self.matcher.flush())
+
+    def _count(self, text: str) -> str:
+        if self.max_tokens is None or not text:
+            return text
+
+        text, used = tokens.truncate_text(text, self.max_tokens - self.completion_tokens)
+        self.completion_tokens += used
+        if self.completion_tokens >= self.max_tokens and self.finish_reason is None:
+            self.finish_reason = response.FinishReason.LENGTH
+        return text
@@ -1,22 +1,213 @@
+import copy
 import time
 import json
+import typing
 import string
 import random
 import asyncio
+import collections
 import quart
 
 from ...models.forward import mgr as forwardmgr
 from ...models.channel import mgr as channelmgr
 from ...models.key import mgr as apikeymgr
+from ...models.conversation import mgr as conversationmgr
 from ...entities import channel, apikey, request, response, exceptions
-from ...common import randomad
+from ...common import randomad, stream, tokens
 from ...models.channel import evaluation
+from . import passthrough, limiter, shadow, resume, batcher
+
+
+ERROR_FINISH = '"finish_reason": "error"'
+"""Found in error chunks of `ForwardManager.error_chunk` only, quotes of content are escaped."""
+
 
 class ForwardManager(forwardmgr.AbsForwardManager):
 
-    def __init__(self, chanmgr: channelmgr.AbsChannelManager, keymgr: apikeymgr.AbsAPIKeyManager):
+    trim_reserve_tokens: int = 1024
+    """Completion tokens reserved when trimming prompt of a request without `max_tokens`."""
+
+    completion_length_alpha: float = 0.05
+    """Smoothing factor of the EWMA of natural completion length."""
+
+    fanout_concurrency: int = 4
+    """Maximum upstream generations in flight for one request with n > 1."""
+
+    fanout_per_channel: int = 2
+    """Choices of one request a channel takes before other channels are preferred."""
+
+    def __init__(
+        self,
+        chanmgr: channelmgr.AbsChannelManager,
+        keymgr: apikeymgr.AbsAPIKeyManager,
+        convmgr: conversationmgr.AbsConversationManager,
+    ):
         self.chanmgr = chanmgr
         self.keymgr = keymgr
+        self.convmgr = convmgr
+        self.shadow = shadow.ShadowMirror(chanmgr)
+        self.streams = resume.StreamRegistry()
+        self.embeddings = batcher.EmbeddingBatcher(chanmgr)
+
+        self.cancellations = collections.Counter()
+        """Upstream responses cancelled by limits, by finish reason."""
+
+        self.saved_seconds = 0.0
+        """Estimated upstream seconds saved by cancellations."""
+
+        self.completion_length = 0.0
+        """EWMA of length of completions which were not cancelled, in chars."""
+
+        self.fanout = collections.Counter()
+        """Requests, choices and failed choices of requests with n > 1."""
+
+    def observe_completion(self, record: evaluation.Record):
+        """Account length of a completion which ended naturally."""
+        if record.resp_message_length == 0:
+            return
+        if self.completion_length == 0:
+            self.completion_length = record.resp_message_length
+        else:
+            self.completion_length += self.completion_length_alpha * (record.resp_message_length - self.completion_length)
+
+    def account_cancellation(self, record: evaluation.Record, finish_reason: response.FinishReason):
+        """Account an upstream response cancelled by limits.
+
+        Saved time is estimated from the usual completion length and
+        the output rate of this response.
+        """
+        self.cancellations[finish_reason.value] += 1
+
+        elapsed = time.time() - record.start_time - max(record.latency, 0)
+        if elapsed <= 0 or record.resp_message_length == 0:
+            return
+        rate = record.resp_message_length / elapsed
+        self.saved_seconds += max(0.0, self.completion_length - record.resp_message_length) / rate
+
+    def get_stats(self) -> dict:
+        """Cancellations by limits and their savings."""
+        return {
+            "cancellations": dict(self.cancellations),
+            "saved_upstream_seconds": round(self.saved_seconds, 3),
+            "completion_length_ewma": round(self.completion_length, 1),
+            "conversations": self.convmgr.get_stats(),
+            "streams": self.streams.get_stats(),
+            "fanout": dict(self.fanout),
+            "embeddings": self.embeddings.get_stats(),
+        }
+
+    def stream_response(self, body: typing.AsyncGenerator, headers: dict=None) -> quart.Response:
+        """Server-sent events response."""
+        return quart.Response(
+            body,
+            mimetype="text/event-stream",
+            headers={
+                "Content-Type": "text/event-stream",
+                "Transfer-Encoding": "chunked",
+                "Connection": "keep-alive",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                **(headers or {}),
+            }
+        )
+
+    def resumable(self, body: typing.AsyncGenerator, resp_id: str, req: request.Request) -> typing.AsyncGenerator:
+        """Generate stream in background, so a dropped client can reconnect with Last-Event-ID.
+
+        Only if the request asked for it, or streams are resumable by default,
+        otherwise the body is streamed directly and a disconnect cancels upstream.
+        """
+        wanted = req.resumable if req.resumable is not None else self.streams.always
+        if not self.streams.enabled or not wanted or req.owner is None:
+            return body
+        buf = self.streams.start(f"chatcmpl-{resp_id}", req.owner, body)
+        return self.streams.follow(buf)
+
+    def resume_stream(self, event_id: str, owner: str) -> quart.Response:
+        """Continue a streamed completion after the event a client received last.
+
+        Args:
+            event_id: `Last-Event-ID`, or a completion id to replay from the start.
+            owner: API key of the request.
+
+        Returns:
+            quart.Response: the rest of the stream, None if it is unknown or expired.
+        """
+        buf, after = self.streams.find(event_id, owner)
+        if buf is None:
+            return None
+        return self.stream_response(self.streams.follow(buf, after))
+
+    def error_response(self, e: exceptions.QueryHandlingError) -> quart.Response:
+        """OpenAI style error response of a query handling error."""
+        return quart.Response(
+            json.dumps(self.error_object(e)),
+            status=e.status_code,
+            mimetype="application/json",
+        )
+
+    def error_chunk(self, req: request.Request, resp_id: str, error: dict) -> str:
+        """SSE chunk ending the choice of request with an error object.
+
+        Every error of a stream is sent like this, followed by `[DONE]`.
+        """
+        return f"data: {json.dumps({'id': f'chatcmpl-{resp_id}', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': req.model, 'choices': [{'index': req.choice_index, 'delta': {}, 'finish_reason': 'error', 'error': error}]})}\n\n"
+
+    def error_object(self, e: exceptions.QueryHandlingError) -> dict:
+        return {
+            "error": {
+                "message": e.message,
+                "type": e.type,
+                "param": e.param,
+                "code": e.code,
+            }
+        }
+
+    def trim_prompt(self, chan: channel.Channel, req: request.Request):
+        """Drop oldest messages until prompt fits context window of channel, if requested."""
+        if not req.trim or req.message_tokens is None or req.continuation is not None:
+            return
+
+        window = chan.adapter.context_window(chan.model_mapping.get(req.model, req.model))
+        if window is None:
+            return
+        context, max_output = window
+        budget = context - (req.max_tokens or min(max_output, self.trim_reserve_tokens))
+
+        messages, message_tokens, dropped, dropped_tokens = tokens.trim_messages(
+            req.messages,
+            req.message_tokens,
+            budget,
+        )
+        if dropped == 0:
+            return
+
+        req.messages = messages
+        req.message_tokens = message_tokens
+        req.prompt_tokens -= dropped_tokens
+        req.trimmed_messages += dropped
+        req.trimmed_tokens += dropped_tokens
+
+        if req.raw_body is not None:
+            body = json.loads(req.raw_body)
+            body["messages"] = messages
+            req.raw_body = json.dumps(body).encode("utf-8")
+
+    def trim_headers(self, req: request.Request) -> dict:
+        """Response headers reporting trimmed prompt."""
+        if req.trimmed_messages == 0:
+            return {}
+        return {
+            "X-Prompt-Trimmed": f"messages={req.trimmed_messages}; tokens={req.trimmed_tokens}",
+        }
+
+    def conversation_headers(self, req: request.Request) -> dict:
+        """Response headers of a stored conversation."""
+        if req.conversation is None:
+            return {}
+        return {
+            "X-Conversation-Id": req.conversation.id,
+        }
 
     def is_empty_response(self, message: str) -> bool:
         if not message:
@@ -31,7 +222,10 @@ class ForwardManager(forwardmgr.AbsForwardManager):
     ):
         record: evaluation.Record = evaluation.Record()
         record.stream = True
-        chan.eval.add_record(record)
+        record.sticky = req.sticky
+        record.model = req.model
+        self.chanmgr.add_record(chan, record)
+        req.rate_limit = None
 
         before = time.time()
         record.start_time = before
@@ -41,10 +235,16 @@ class ForwardManager(forwardmgr.AbsForwardManager):
 
         t = int(time.time())
 
+        def chunk(content: str, finish_reason: response.FinishReason) -> str:
+            return f"data: {json.dumps({'provider': chan.id, 'id': f'chatcmpl-{resp_id}', 'object': 'chat.completion.chunk', 'created': t, 'model': req.model, 'choices': [{'index': req.choice_index, 'delta': {'content': content} if content else {}, 'finish_reason': finish_reason.value}]})}\n\n"
+
+        limit = limiter.OutputLimiter(req.stop, req.max_tokens)
+        upstream = chan.adapter.query(req)
+
         generated_content = ""
         yielded_text = False
         try:
-            async for resp in chan.adapter.query(req):
+            async for resp in upstream:
                 if record.latency < 0:
                     record.latency = time.time() - before
 
@@ -54,11 +254,36 @@ class ForwardManager(forwardmgr.AbsForwardManager):
                 if self.is_empty_response(resp.normal_message):
                     continue
 
-                record.resp_message_length += len(resp.normal_message)
-                generated_content += resp.normal_message
-                yielded_text = True
+                text = resp.normal_message
+                if limit.active:
+                    text = limit.feed(text)
+
+                if text:
+                    record.resp_message_length += len(text)
+                    generated_content += text
+                    yielded_text = True
+
+                    yield chunk(text, resp.finish_reason)
+
+                if limit.finish_reason is not None:
+                    break
 
-                yield f"data: {json.dumps({'provider': chan.id, 'id': f'chatcmpl-{resp_id}', 'object': 'chat.completion.chunk', 'created': t, 'model': req.model, 'choices': [{'index': 0, 'delta': {'content': resp.normal_message} if resp.normal_message else {}, 'finish_reason': resp.finish_reason.value}]})}\n\n"
+            if limit.finish_reason is not None:
+                # client wants no more, stop upstream generating
+                await upstream.aclose()
+                self.account_cancellation(record, limit.finish_reason)
+                yielded_text = True
+                yield chunk("", limit.finish_reason)
+            elif limit.active:
+                text = limit.flush()
+                if text:
+                    record.resp_message_length += len(text)
+                    generated_content += text
+                    yielded_text = True
+                    yield chunk(text, response.FinishReason.NULL)
+                self.observe_completion(record)
+            else:
+                self.observe_completion(record)
 
             if not generated_content and not yielded_text:
                 record.error = ValueError("Generated text is empty")
@@ -67,28 +292,181 @@ class ForwardManager(forwardmgr.AbsForwardManager):
 
             if yielded_text:
                 record.success = True
+                # stored before the client sees the end, so its next turn finds this reply
+                await self.convmgr.commit(req, generated_content)
+                self.chanmgr.continuations.store(chan, req, generated_content)
                 yield "data: [DONE]\n\n"
             else:
                 record.error = ValueError("No text content generated, but received DONE")
                 record.success = False
                 raise ValueError("No text content generated, but received DONE")
 
+        except (GeneratorExit, asyncio.CancelledError):
+            # client went away, not the channel's fault
+            record.cancelled = not record.success
+            raise
         except Exception as e:
             record.error = e
             record.success = False
             raise e
 
         finally:
-            record.commit()
+            record.rate_limit = req.rate_limit
+            self.chanmgr.commit_record(chan, record)
+            self.shadow.mirror(chan, req, record)
 
-    async def __stream_query(
+    def __is_passthrough(self, chan: channel.Channel, req: request.Request) -> bool:
+        return req.raw_body is not None and chan.adapter.passthrough_supported()
+
+    async def __passthrough_stream_gen(
         self,
+        chan: channel.Channel,
         req: request.Request,
         resp_id: str
     ):
+        """Forward upstream SSE events as is, only id and provider of data objects are rewritten."""
+        record: evaluation.Record = evaluation.Record()
+        record.stream = True
+        record.sticky = req.sticky
+        record.model = req.model
+        self.chanmgr.add_record(chan, record)
+        req.rate_limit = None
+
+        before = time.time()
+        record.start_time = before
+        record.req_messages_length = len(req.raw_body)
+
+        parser = stream.SSEParser(raw=True)
+        yielded = False
+        contents = []
+        committed = False
+
+        def forward(event: stream.SSEEvent) -> bytes:
+            if event.data is not None and event.data != b"[DONE]":
+                try:
+                    content, _ = stream.chat_chunk_delta(event.data)
+                    if content:
+                        record.resp_message_length += len(content)
+                        if req.conversation is not None:
+                            contents.append(content)
+                except ValueError:  # not our business, forward it anyway
+                    pass
+            return passthrough.rewrite_event(event, resp_id, chan.id)
+
+        try:
+            async for chunk in chan.adapter.passthrough(req, passthrough.patch_model(req.raw_body, req.model)):
+                if record.latency < 0:
+                    record.latency = time.time() - before
+
+                for event in parser.feed(chunk):
+                    yielded = yielded or event.data is not None
+                    if event.data == b"[DONE]" and not committed:
+                        committed = True
+                        await self.convmgr.commit(req, "".join(contents))
+                    yield forward(event)
+
+            for event in parser.close():
+                yielded = yielded or event.data is not None
+                yield forward(event)
+
+            if not yielded:
+                record.error = ValueError("Generated text is empty")
+                record.success = False
+                raise ValueError("Generated text is empty")
+
+            if not committed:
+                await self.convmgr.commit(req, "".join(contents))
+            record.success = True
+        except (GeneratorExit, asyncio.CancelledError):
+            # client went away, not the channel's fault
+            record.cancelled = not record.success
+            raise
+        except Exception as e:
+            record.error = e
+            record.success = False
+            raise e
+        finally:
+            record.rate_limit = req.rate_limit
+            self.chanmgr.commit_record(chan, record)
+            self.shadow.mirror(chan, req, record)
+
+    async def __passthrough_non_stream_query(
+        self,
+        chan: channel.Channel,
+        req: request.Request,
+        resp_id: str
+    ) -> quart.Response:
+        """Forward upstream response body as is, only id and provider are rewritten."""
+        record = evaluation.Record()
+        record.stream = False
+        record.sticky = req.sticky
+        record.model = req.model
+        self.chanmgr.add_record(chan, record)
+        req.rate_limit = None
+
+        before = time.time()
+        record.start_time = before
+        record.req_messages_length = len(req.raw_body)
+
+        body = bytearray()
+
+        try:
+            async for chunk in chan.adapter.passthrough(req, passthrough.patch_model(req.raw_body, req.model)):
+                if record.latency < 0:
+                    record.latency = time.time() - before
+                body += chunk
+
+            if not body:
+                record.error = ValueError("Generated text is empty")
+                record.success = False
+                return quart.jsonify({"error": "Generated text is empty"}), 500
+
+            record.resp_message_length = len(body)
+            record.success = True
+
+            if req.conversation is not None:
+                try:
+                    reply = json.loads(body)["choices"][0]["message"].get("content") or ""
+                except (ValueError, KeyError, IndexError, TypeError):
+                    reply = None  # not a chat completion, nothing to store
+                if reply is not None:
+                    await self.convmgr.commit(req, reply)
+        except asyncio.CancelledError:
+            # client went away, not the channel's fault
+            record.cancelled = not record.success
+            raise
+        except Exception as e:
+            record.error = e
+            record.success = False
+            return quart.jsonify({"error": "Exception occurred"}), 500
+        finally:
+            record.rate_limit = req.rate_limit
+            self.chanmgr.commit_record(chan, record)
+            self.shadow.mirror(chan, req, record)
+
+        return quart.Response(
+            passthrough.rewrite_object(bytes(body).strip(), resp_id, chan.id),
+            mimetype="application/json",
+        )
+
+    async def __stream_query(
+        self,
+        req: request.Request,
+        resp_id: str,
+        chan: channel.Channel,
+    ):
+        """Stream from pre-selected channel, retry on other channels if it failed.
+
+        Once a chunk reached the client, a failure is not retried, since
+        another channel would start the reply over. The stream ends with
+        an error chunk instead.
+        """
         for attempt in range(10):
+            sent = False
             try:
-                chan: channel.Channel = await self.chanmgr.select_channel("/v1/chat/completions", req, resp_id)
+                if attempt > 0:
+                    chan = await self.chanmgr.select_channel("/v1/chat/completions", req, resp_id)
+                    self.trim_prompt(chan, req)
 
                 if req.model in chan.model_mapping:
                     req.model = chan.model_mapping[req.model]
@@ -96,13 +474,175 @@ class ForwardManager(forwardmgr.AbsForwardManager):
                 if chan is None:
                     raise ValueError("Channel not found")
 
-                async for data in self.__stream_query_gen(chan, req, resp_id):
-                    yield data
+                if self.__is_passthrough(chan, req):
+                    gen = self.__passthrough_stream_gen(chan, req, resp_id)
+                else:
+                    gen = self.__stream_query_gen(chan, req, resp_id)
+
+                try:
+                    async for data in gen:
+                        sent = True
+                        yield data
+                finally:
+                    await gen.aclose()  # at once if the client went away, so the record is committed
+                return
+            except exceptions.QueryHandlingError as e:
+                yield self.error_chunk(req, resp_id, self.error_object(e)["error"])
+                yield "data: [DONE]\n\n"
                 return
             except Exception as e:
+                if sent:
+                    yield self.error_chunk(req, resp_id, {
+                        "message": f"Upstream failed while streaming: {str(e)}",
+                        "type": "server_error",
+                        "param": None,
+                        "code": None,
+                    })
+                    yield "data: [DONE]\n\n"
+                    return
                 continue
 
-        yield json.dumps({"error": "Error occurred while handling your request. You can retry or contact your admin."})
+        yield self.error_chunk(req, resp_id, {
+            "message": "Error occurred while handling your request. You can retry or contact your admin.",
+            "type": "server_error",
+            "param": None,
+            "code": None,
+        })
+        yield "data: [DONE]\n\n"
+
+    async def select_fanout(
+        self,
+        path: str,
+        req: request.Request,
+        resp_id: str,
+    ) -> list[tuple[request.Request, channel.Channel]]:
+        """Select a channel for every choice of a request with n > 1.
+
+        A channel takes at most `fanout_per_channel` choices while other
+        channels can serve, so that choices are generated in parallel.
+        """
+        if req.prompt_tokens is None:
+            req.message_tokens, req.prompt_tokens = tokens.count_messages(req.messages)
+
+        assigned = collections.Counter()
+        subs = []
+        for i in range(req.n):
+            sub = copy.copy(req)
+            sub.n = 1
+            sub.choice_index = i
+            sub.raw_body = None  # upstreams generate one choice each
+            if i > 0:
+                sub.conversation = None  # only the first choice continues a stored conversation
+            sub.excluded_channels = {
+                chan_id for chan_id, amount in assigned.items() if amount >= self.fanout_per_channel
+            }
+
+            chan = await self.chanmgr.select_channel(path, sub, resp_id)
+            self.trim_prompt(chan, sub)
+            assigned[chan.id] += 1
+            subs.append((sub, chan))
+
+        self.fanout["requests"] += 1
+        self.fanout["choices"] += req.n
+        return subs
+
+    async def __fanout_stream(
+        self,
+        subs: list[tuple[request.Request, channel.Channel]],
+        resp_id: str,
+    ):
+        """Stream all choices in parallel, chunks are interleaved as they come.
+
+        A choice failing on every channel ends with a chunk of finish reason
+        `error` carrying the error object, other choices keep streaming.
+        """
+        queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        def error_chunk(sub: request.Request, error) -> str:
+            if not isinstance(error, dict):
+                error = {"message": str(error), "type": "server_error", "param": None, "code": None}
+            self.fanout["failed_choices"] += 1
+            return self.error_chunk(sub, resp_id, error)
+
+        async def generate(sub: request.Request, chan: channel.Channel):
+            try:
+                async with semaphore:
+                    async for data in self.__stream_query(sub, resp_id, chan):
+                        if data == "data: [DONE]\n\n":
+                            continue
+                        if ERROR_FINISH in data:
+                            self.fanout["failed_choices"] += 1
+                        await queue.put(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put(error_chunk(sub, f"Error occurred while handling your request: {str(e)}"))
+            finally:
+                await queue.put(None)
+
+        loop = asyncio.get_running_loop()
+        tasks = [loop.create_task(generate(sub, chan)) for sub, chan in subs]
+        try:
+            finished = 0
+            while finished < len(tasks):
+                data = await queue.get()
+                if data is None:
+                    finished += 1
+                    continue
+                yield data
+            yield "data: [DONE]\n\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __fanout_non_stream(
+        self,
+        path: str,
+        subs: list[tuple[request.Request, channel.Channel]],
+        resp_id: str,
+    ) -> quart.Response:
+        """Generate all choices in parallel and merge them into one completion."""
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def generate(sub: request.Request, chan: channel.Channel) -> dict:
+            async with semaphore:
+                for attempt in range(3):
+                    try:
+                        if attempt > 0:
+                            chan = await self.chanmgr.select_channel(path, sub, resp_id)
+                            self.trim_prompt(chan, sub)
+
+                        if sub.model in chan.model_mapping:
+                            sub.model = chan.model_mapping[sub.model]
+
+                        response = await self.__non_stream_query(chan, sub, resp_id)
+                        if isinstance(response, tuple):  # (error response, status)
+                            continue
+                        return await response.get_json()
+                    except exceptions.QueryHandlingError:
+                        break
+                self.fanout["failed_choices"] += 1
+                return None
+
+        results = await asyncio.gather(*(generate(sub, chan) for sub, chan in subs))
+        if any(result is None for result in results):
+            return quart.jsonify({"error": "Exception occurred"}), 500
+
+        choices = []
+        completion_tokens = 0
+        for i, result in enumerate(results):
+            choice = result["choices"][0]
+            choice["index"] = i
+            choice["provider"] = result["provider"]
+            choices.append(choice)
+            completion_tokens += result["usage"]["completion_tokens"]
+
+        merged = results[0]
+        merged["choices"] = choices
+        merged["usage"]["completion_tokens"] = completion_tokens
+        merged["usage"]["total_tokens"] = merged["usage"]["prompt_tokens"] + completion_tokens
+        return quart.jsonify(merged)
 
     async def __non_stream_query(
         self,
@@ -112,7 +652,10 @@ class ForwardManager(forwardmgr.AbsForwardManager):
     ) -> quart.Response:
         record = evaluation.Record()
         record.stream = False
-        chan.eval.add_record(record)
+        record.sticky = req.sticky
+        record.model = req.model
+        self.chanmgr.add_record(chan, record)
+        req.rate_limit = None
 
         before = time.time()
         record.start_time = before
@@ -123,34 +666,62 @@ class ForwardManager(forwardmgr.AbsForwardManager):
         normal_message = ""
         resp_tmp: response.Response = None
 
+        limit = limiter.OutputLimiter(req.stop, req.max_tokens)
+        upstream = chan.adapter.query(req)
+
         try:
-            async for resp in chan.adapter.query(req):
+            async for resp in upstream:
                 if record.latency < 0:
                     record.latency = time.time() - before
 
                 if resp.normal_message is not None and not self.is_empty_response(resp.normal_message):
                     resp_tmp = resp
-                    normal_message += resp.normal_message
-                    record.resp_message_length += len(resp.normal_message)
+                    text = limit.feed(resp.normal_message) if limit.active else resp.normal_message
+                    normal_message += text
+                    record.resp_message_length += len(text)
+
+                if limit.finish_reason is not None:
+                    break
 
-            if not normal_message:
+            if limit.finish_reason is not None:
+                await upstream.aclose()
+                self.account_cancellation(record, limit.finish_reason)
+            else:
+                if limit.active:
+                    text = limit.flush()
+                    normal_message += text
+                    record.resp_message_length += len(text)
+                self.observe_completion(record)
+
+            if not normal_message and limit.finish_reason is None:
                 record.error = ValueError("Generated text is empty")
                 record.success = False
                 return quart.jsonify({"error": "Generated text is empty"}), 500
 
+            await self.convmgr.commit(req, normal_message)
+
             if randomad.enabled:
                 normal_message += ''.join(randomad.generate_ad())
 
+            # keyed by the reply as the client sees it, it is sent back next turn
+            self.chanmgr.continuations.store(chan, req, normal_message)
+
             record.success = True
+        except asyncio.CancelledError:
+            # client went away, not the channel's fault
+            record.cancelled = not record.success
+            raise
         except Exception as e:
             record.error = e
             record.success = False
             return quart.jsonify({"error": "Exception occurred"}), 500
         finally:
-            record.commit()
+            record.rate_limit = req.rate_limit
+            self.chanmgr.commit_record(chan, record)
+            self.shadow.mirror(chan, req, record)
 
         spent_ms = int((time.time() - before) * 1000)
-        prompt_tokens = chan.count_tokens(req.model, req.messages)
+        prompt_tokens = req.prompt_tokens if req.prompt_tokens is not None else chan.count_tokens(req.model, req.messages)
         completion_tokens = chan.count_tokens(
             req.model,
             [{"role": "assistant", "content": normal_message}]
@@ -169,7 +740,7 @@ class ForwardManager(forwardmgr.AbsForwardManager):
                         "role": "assistant",
                         "content": normal_message,
                     },
-                    "finish_reason": resp_tmp.finish_reason.value if resp_tmp else None
+                    "finish_reason": limit.finish_reason.value if limit.finish_reason else (resp_tmp.finish_reason.value if resp_tmp else None)
                 }
             ],
             "usage": {
@@ -197,20 +768,38 @@ class ForwardManager(forwardmgr.AbsForwardManager):
 
         id_suffix = "".join(random.choices(string.ascii_letters + string.digits, k=21))
         try:
+            if path == "/v1/chat/completions" and req.n > 1:
+                # fan choices out to parallel generations
+                subs = await self.select_fanout(path, req, id_suffix)
+
+                if not req.stream:
+                    # choices were retried one by one already, don't generate all again
+                    response = await self.__fanout_non_stream(path, subs, id_suffix)
+                    if isinstance(response, tuple):
+                        return response
+                    response.headers.update(self.trim_headers(subs[0][0]))
+                    response.headers.update(self.conversation_headers(req))
+                    return response
+
+                body = self.resumable(self.__fanout_stream(subs, id_suffix), id_suffix, req)
+                return self.stream_response(body, {
+                    **self.trim_headers(subs[0][0]),
+                    **self.conversation_headers(req),
+                })
+
             if path == "/v1/chat/completions" and req.stream:
-                return quart.Response(
-                    self.__stream_query(req, id_suffix),
-                    mimetype="text/event-stream",
-                    headers={
-                        "Content-Type": "text/event-stream",
-                        "Transfer-Encoding": "chunked",
-                        "Connection": "keep-alive",
-                        "Cache-Control": "no-cache",
-                        "X-Accel-Buffering": "no",
-                    }
-                )
+                # select before responding, so that request errors get their status code
+                chan = await self.chanmgr.select_channel(path, req, id_suffix)
+                self.trim_prompt(chan, req)
+
+                body = self.resumable(self.__stream_query(req, id_suffix, chan), id_suffix, req)
+                return self.stream_response(body, {
+                    **self.trim_headers(req),
+                    **self.conversation_headers(req),
+                })
             
             chan: channel.Channel = await self.chanmgr.select_channel(path, req, id_suffix)
+            self.trim_prompt(chan, req)
 
             if req.model in chan.model_mapping:
                 req.model = chan.model_mapping[req.model]
@@ -218,16 +807,44 @@ class ForwardManager(forwardmgr.AbsForwardManager):
             if chan is None:
                 raise ValueError("Channel not found")
 
-            auth = quart.request.headers.get("Authorization")
-            if auth and auth.startswith("Bearer "):
-                auth = auth[7:]
-
-            response = await self.__non_stream_query(chan, req, id_suffix)
+            if self.__is_passthrough(chan, req):
+                response = await self.__passthrough_non_stream_query(chan, req, id_suffix)
+            else:
+                response = await self.__non_stream_query(chan, req, id_suffix)
 
             if response.status_code == 500:
                 raise Exception("Query failed, retrying...")
 
+            response.headers.update(self.trim_headers(req))
+            response.headers.update(self.conversation_headers(req))
             return response
 
+        except exceptions.QueryHandlingError as e:
+            return self.error_response(e)
         except Exception as e:
-            return await self.query(path, req, raw_data, attempt + 1)
\ No newline at end of file
+            return await self.query(path, req, raw_data, attempt + 1)
+
+    async def embed(
+        self,
+        model: str,
+        inputs: list,
+        options: dict,
+    ) -> quart.Response:
+        embeddings, prompt_tokens, channel_id = await self.embeddings.embed(model, inputs, options)
+        return quart.jsonify({
+            "provider": channel_id,
+            "object": "list",
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": embedding,
+                }
+                for i, embedding in enumerate(embeddings)
+            ],
+            "model": model,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "total_tokens": prompt_tokens,
+            },
+        })
@@ -0,0 +1,60 @@
+"""Raw body rewriting for OpenAI compatible upstreams."""
+import re
+import json
+
+from ...common import stream
+
+
+_MODEL = re.compile(rb'"model"\s*:\s*"(?:[^"\\]|\\.)*"')
+_ID = re.compile(rb'"id"\s*:\s*"(?:[^"\\]|\\.)*"')
+
+
+def patch_model(body: bytes, model: str) -> bytes:
+    """Set model name of a raw request body.
+
+    The body is only decoded if the model field can not be located unambiguously.
+    """
+    value = b'"model":' + json.dumps(model).encode("utf-8")
+
+    matches = list(_MODEL.finditer(body))
+    if len(matches) == 1:
+        match = matches[0]
+        if match.group(0) == value:
+            return body
+        return body[:match.start()] + value + body[match.end():]
+
+    obj = json.loads(body)
+    obj["model"] = model
+    return json.dumps(obj).encode("utf-8")
+
+
+def rewrite_object(data: bytes, resp_id: str, provider: int) -> bytes:
+    """Rewrite id and insert provider into a raw response object.
+
+    Id is only rewritten if it is the first field, so ids of nested
+    objects (e.g. tool calls) are never touched.
+    """
+    if data[:1] != b"{" or data[1:2] == b"}":
+        return data
+
+    match = _ID.match(data, 1)
+    if match is not None:
+        data = b'{"id":"chatcmpl-' + resp_id.encode("utf-8") + b'"' + data[match.end():]
+
+    return b'{"provider":' + str(provider).encode("utf-8") + b"," + data[1:]
+
+
+def rewrite_event(event: stream.SSEEvent, resp_id: str, provider: int) -> bytes:
+    """Encode a raw parsed SSE event, rewriting only the object in its first data line.
+
+    Other fields (`event:`, `id:`, comments) are forwarded as received.
+    """
+    lines = event.lines
+    if event.data is not None and event.data != b"[DONE]":
+        lines = list(lines)
+        for i, line in enumerate(lines):
+            if line.startswith(b"data:"):
+                value = line[6:] if line[5:6] == b" " else line[5:]
+                lines[i] = b"data: " + rewrite_object(value, resp_id, provider)
+                break
+    return b"\n".join(lines) + b"\n\n"
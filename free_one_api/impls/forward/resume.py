@@ -0,0 +1,221 @@
+"""Resumable streaming responses."""
+import time
+import asyncio
+import typing
+import collections
+
+
+class StreamBuffer:
+    """Events of a streamed completion, produced in background.
+
+    Every event gets a sequence number, SSE events carry it in their `id:`
+    field as `<completion id>/<sequence>`.
+    """
+
+    key: str
+    """Completion id, e.g. chatcmpl-xxx."""
+
+    owner: str
+    """API key of the request, only it can resume."""
+
+    items: list[bytes]
+
+    size: int
+    """Bytes of items."""
+
+    done: bool
+
+    finished_at: float
+    """When producer finished, 0 if still running."""
+
+    readers: int
+    """Attached readers."""
+
+    detached_at: float
+    """When the last reader left."""
+
+    resumable: bool
+    """False once the buffer exceeds its limit, then it only serves the live reader."""
+
+    def __init__(self, key: str, owner: str):
+        self.key = key
+        self.owner = owner
+        self.items = []
+        self.size = 0
+        self.done = False
+        self.finished_at = 0.0
+        self.readers = 0
+        self.detached_at = 0.0
+        self.resumable = True
+        self.changed = asyncio.Event()
+        self.task: asyncio.Task = None
+
+    def append(self, item: typing.Union[str, bytes]):
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        if item.startswith(b"data:") or b"\ndata:" in item:
+            if item.startswith(b"id:") or b"\nid:" in item:
+                # clients resume by ids of this buffer, not by upstream ones
+                item = b"\n".join(line for line in item.split(b"\n") if not line.startswith(b"id:"))
+            item = f"id: {self.key}/{len(self.items) + 1}\n".encode("utf-8") + item
+        self.items.append(item)
+        self.size += len(item)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class StreamRegistry:
+    """Keeps streamed completions for a while, so clients can reconnect.
+
+    Upstream generation runs in a background task, detached from the client
+    connection. A client reconnecting with `Last-Event-ID` attaches to the
+    running generation or replays the finished one instead of starting a
+    new one. Generations nobody follows are cancelled after `detach_timeout`,
+    or at once if they are no longer resumable.
+
+    Streams are only resumable if the request asks for it by
+    `X-Resumable: true`, or if `always` is set, since a detached generation
+    keeps the upstream busy after the client left.
+    """
+
+    enabled: bool = True
+
+    always: bool = False
+    """Make every stream resumable, not only those of requests asking for it."""
+
+    ttl: int = 60
+    """Seconds a finished stream is kept."""
+
+    max_streams: int = 1000
+    """Maximum amount of streams kept, oldest are dropped."""
+
+    max_bytes: int = 1024 * 1024
+    """Streams larger than this are not resumable."""
+
+    detach_timeout: int = 30
+    """Seconds a running generation is kept without readers."""
+
+    streams: collections.OrderedDict[str, StreamBuffer]
+
+    def __init__(self):
+        self.streams = collections.OrderedDict()
+
+        self.started = 0
+        self.resumed_live = 0
+        """Reconnects attached to a running generation."""
+
+        self.resumed_replay = 0
+        """Reconnects replayed from a finished generation."""
+
+        self.misses = 0
+        """Reconnects to unknown or expired streams."""
+
+        self.abandoned = 0
+        """Generations cancelled since nobody followed them."""
+
+    def _purge(self):
+        now = time.time()
+        for key in [k for k, buf in self.streams.items() if buf.done and now - buf.finished_at > self.ttl]:
+            del self.streams[key]
+        while len(self.streams) > self.max_streams:
+            self.streams.popitem(last=False)
+
+    def start(self, key: str, owner: str, gen: typing.AsyncGenerator) -> StreamBuffer:
+        """Produce events of gen into a new buffer in background."""
+        self._purge()
+
+        buf = StreamBuffer(key, owner)
+        self.streams[key] = buf
+        self.started += 1
+        buf.task = asyncio.get_running_loop().create_task(self._produce(buf, gen))
+        return buf
+
+    async def _produce(self, buf: StreamBuffer, gen: typing.AsyncGenerator):
+        try:
+            async for item in gen:
+                buf.append(item)
+                if buf.resumable and buf.size > self.max_bytes:
+                    buf.resumable = False
+                    self.streams.pop(buf.key, None)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error producing stream {buf.key}: {str(e)}")
+        finally:
+            await gen.aclose()
+            buf.finish()
+
+    def _abandon(self, buf: StreamBuffer):
+        # a reader may have attached and left again since
+        if buf.readers == 0 and not buf.done and (not buf.resumable or time.time() - buf.detached_at >= self.detach_timeout):
+            self.abandoned += 1
+            buf.task.cancel()
+
+    async def follow(self, buf: StreamBuffer, after: int=0) -> typing.AsyncGenerator[bytes, None]:
+        """Yield events of buffer after sequence `after`, until it finishes."""
+        buf.readers += 1
+        i = after
+        try:
+            while True:
+                while i < len(buf.items):
+                    yield buf.items[i]
+                    i += 1
+                if buf.done:
+                    return
+                await buf.changed.wait()
+        finally:
+            buf.readers -= 1
+            if buf.readers == 0 and not buf.done:
+                buf.detached_at = time.time()
+                if not buf.resumable or self.detach_timeout <= 0:
+                    # nobody can reconnect, stop upstream right away
+                    self._abandon(buf)
+                else:
+                    asyncio.get_running_loop().call_later(self.detach_timeout, self._abandon, buf)
+
+    def find(self, event_id: str, owner: str) -> tuple[StreamBuffer, int]:
+        """Buffer and sequence of a `Last-Event-ID`, or of a bare completion id.
+
+        Returns:
+            StreamBuffer: buffer, None if not found or not owned by owner.
+            int: sequence of the last event received.
+        """
+        key, _, seq = event_id.strip().rpartition("/")
+        if not key:
+            key, seq = seq, "0"
+
+        buf = self.streams.get(key)
+        if buf is None or buf.owner != owner or not seq.isdigit():
+            self.misses += 1
+            return None, 0
+        if buf.done and time.time() - buf.finished_at > self.ttl:
+            self.misses += 1
+            return None, 0
+
+        if buf.done:
+            self.resumed_replay += 1
+        else:
+            self.resumed_live += 1
+        return buf, min(int(seq), len(buf.items))
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "always": self.always,
+            "streams": len(self.streams),
+            "running": sum(1 for buf in self.streams.values() if not buf.done),
+            "started": self.started,
+            "resumed_live": self.resumed_live,
+            "resumed_replay": self.resumed_replay,
+            "saved_generations": self.resumed_live + self.resumed_replay,
+            "misses": self.misses,
+            "abandoned": self.abandoned,
+        }
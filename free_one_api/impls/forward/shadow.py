@@ -0,0 +1,179 @@
+"""Shadow traffic, mirrors requests to channels under evaluation."""
+import copy
+import time
+import random
+import asyncio
+import collections
+
+import numpy as np
+
+from ...models.channel import mgr as channelmgr
+from ...models.channel import evaluation
+from ...entities import channel, request
+
+
+class ShadowMirror:
+    """Mirrors successful requests to shadow channels in background.
+
+    Output of shadow channels is discarded, their records are committed as
+    usual, so they get the same statistics as channels serving users. Mirroring
+    is bounded by `concurrency` and skipped first when proxy is busy.
+    """
+
+    enabled: bool = False
+
+    rules: list[dict] = []
+    """Dicts of `channel` (shadow channel id), `rate` (sample rate) and
+    optional `model` (only mirror requests for this model)."""
+
+    concurrency: int = 4
+    """Maximum amount of shadow requests in flight."""
+
+    shed_load: int = 32
+    """Skip mirroring if this amount of user requests are in flight."""
+
+    history: int = 1000
+    """Amount of recent comparisons kept per shadow channel."""
+
+    def __init__(self, chanmgr: channelmgr.AbsChannelManager):
+        self.chanmgr = chanmgr
+        self.in_flight = 0
+
+        self.mirrored = collections.Counter()
+        """Shadow channel id to amount of mirrored requests."""
+
+        self.shed = collections.Counter()
+        """Shadow channel id to amount of requests not mirrored due to load."""
+
+        self.comparisons: dict[int, collections.deque] = {}
+        """Shadow channel id to (primary channel id, primary latency, shadow latency, shadow success)."""
+
+    @classmethod
+    def channel_ids(cls) -> set[int]:
+        """Ids of shadow channels while mirroring is enabled.
+
+        They only get mirrored requests, channel manager never selects
+        them for clients, even if they are enabled.
+        """
+        if not cls.enabled:
+            return set()
+        return {rule.get("channel") for rule in cls.rules}
+
+    def mirror(self, primary: channel.Channel, req: request.Request, record: evaluation.Record):
+        """Mirror a finished request if a rule samples it."""
+        if not self.enabled or not record.success:
+            return
+
+        for rule in self.rules:
+            shadow_id = rule.get("channel")
+            if shadow_id == primary.id:
+                continue
+            if rule.get("model") is not None and rule["model"] != record.model:
+                continue
+            if random.random() >= rule.get("rate", 0):
+                continue
+
+            if self.in_flight >= self.concurrency or int(np.sum(self.chanmgr.stats.in_flight)) >= self.shed_load:
+                self.shed[shadow_id] += 1
+                continue
+
+            shadow = None
+            for chan in self.chanmgr.channels:
+                if chan.id == shadow_id:
+                    shadow = chan
+                    break
+            if shadow is None:
+                continue
+
+            self.in_flight += 1
+            self.mirrored[shadow_id] += 1
+            asyncio.get_running_loop().create_task(self.run(shadow, primary, req, record))
+
+    async def run(
+        self,
+        shadow: channel.Channel,
+        primary: channel.Channel,
+        req: request.Request,
+        primary_record: evaluation.Record,
+    ):
+        """Send request to shadow channel and discard its output."""
+        req = copy.copy(req)
+        req.stream = True
+        req.rate_limit = None
+        # the continuation handle belongs to the primary's upstream conversation
+        req.continuation = None
+        req.continued_messages = 0
+        req.next_continuation = None
+        req.model = shadow.model_mapping.get(req.model, req.model)
+
+        record = evaluation.Record()
+        record.stream = True
+        record.model = req.model
+        self.chanmgr.add_record(shadow, record)
+
+        before = time.time()
+        record.start_time = before
+        record.req_messages_length = primary_record.req_messages_length
+
+        try:
+            async for resp in shadow.adapter.query(req):
+                if record.latency < 0:
+                    record.latency = time.time() - before
+                if resp.normal_message:
+                    record.resp_message_length += len(resp.normal_message)
+
+            record.success = record.resp_message_length > 0
+            if not record.success:
+                record.error = ValueError("Generated text is empty")
+        except Exception as e:
+            record.error = e
+            record.success = False
+        finally:
+            self.in_flight -= 1
+            record.rate_limit = req.rate_limit
+            self.chanmgr.commit_record(shadow, record)
+
+            if shadow.id not in self.comparisons:
+                self.comparisons[shadow.id] = collections.deque(maxlen=self.history)
+            self.comparisons[shadow.id].append(
+                (primary.id, primary_record.latency, record.latency, record.success)
+            )
+
+    def get_stats(self) -> dict:
+        """Side by side latency of shadow channels and the primaries of the same requests."""
+
+        def percentiles(values: list[float]) -> dict:
+            if not values:
+                return {"p50": None, "p90": None, "mean": None}
+            p50, p90 = np.percentile(values, [50, 90])
+            return {"p50": float(p50), "p90": float(p90), "mean": float(np.mean(values))}
+
+        shadows = {}
+        for shadow_id in set(self.mirrored) | set(self.shed):
+            comparisons = list(self.comparisons.get(shadow_id, ()))
+            succeeded = [c for c in comparisons if c[3]]
+
+            by_primary = {}
+            for primary_id in {c[0] for c in succeeded}:
+                pairs = [c for c in succeeded if c[0] == primary_id]
+                by_primary[primary_id] = {
+                    "requests": len(pairs),
+                    "primary_latency": percentiles([c[1] for c in pairs]),
+                    "shadow_latency": percentiles([c[2] for c in pairs]),
+                }
+
+            shadows[shadow_id] = {
+                "mirrored": self.mirrored[shadow_id],
+                "shed": self.shed[shadow_id],
+                "compared": len(comparisons),
+                "shadow_error_rate": (len(comparisons) - len(succeeded)) / len(comparisons) if comparisons else None,
+                "primary_latency": percentiles([c[1] for c in succeeded]),
+                "shadow_latency": percentiles([c[2] for c in succeeded]),
+                "by_primary": by_primary,
+            }
+
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "shadows": shadows,
+        }
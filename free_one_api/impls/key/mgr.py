@@ -11,6 +11,8 @@ class APIKeyManager(keymgr.AbsAPIKeyManager):
     def __init__(self, dbmgr: db.DatabaseInterface):
         self.dbmgr = dbmgr
         self.keys = []
+        self.by_raw: dict[str, apikey.FreeOneAPIKey] = {}
+        """Raw value to key, for authentication on every request."""
         
     async def has_key(self, key_id: int) -> bool:
         for key in self.keys:
@@ -39,14 +41,19 @@ class APIKeyManager(keymgr.AbsAPIKeyManager):
     async def list_keys(self) -> list[apikey.FreeOneAPIKey]:
         """List all keys."""
         self.keys = await self.dbmgr.list_keys()
+        self.by_raw = {key.raw: key for key in self.keys}
         
         return self.keys
+
+    def find_key(self, raw: str) -> apikey.FreeOneAPIKey:
+        return self.by_raw.get(raw)
     
     async def create_key(self, key: apikey.FreeOneAPIKey) -> None:
         # key already created by upper caller
         # only insert to db and save to memory here
         await self.dbmgr.insert_key(key)
         self.keys.append(key)
+        self.by_raw[key.raw] = key
         
     async def revoke_key(self, key_id: int) -> None:
         assert await self.has_key(key_id)
@@ -54,6 +61,7 @@ class APIKeyManager(keymgr.AbsAPIKeyManager):
         await self.dbmgr.delete_key(key_id)
         for i in range(len(self.keys)):
             if self.keys[i].id == key_id:
+                self.by_raw.pop(self.keys[i].raw, None)
                 del self.keys[i]
                 break
             
@@ -1,4 +1,5 @@
 import json
+import typing
 
 import quart
 
@@ -6,6 +7,8 @@ from ...models.router import group as routergroup
 from ...models.database import db
 from ...models.channel import mgr as channelmgr
 from ...models.key import mgr as apikeymgr
+from ...models.watchdog import wd
+from ...models.forward import mgr as forwardmgr
 from ...entities import channel, apikey
 from ...models import adapter
 
@@ -16,10 +19,20 @@ class WebAPIGroup(routergroup.APIGroup):
 
     keymgr: apikeymgr.AbsAPIKeyManager
 
-    def __init__(self, dbmgr: db.DatabaseInterface, chanmgr: channelmgr.AbsChannelManager, keymgr: apikeymgr.AbsAPIKeyManager):
+    watchdog: wd.AbsWatchDog
+
+    fwdmgr: forwardmgr.AbsForwardManager
+
+    reload: typing.Callable[[], typing.Awaitable[dict]]
+    """Applies config and channel changes without restart, returns report."""
+
+    def __init__(self, dbmgr: db.DatabaseInterface, chanmgr: channelmgr.AbsChannelManager, keymgr: apikeymgr.AbsAPIKeyManager, watchdog: wd.AbsWatchDog, fwdmgr: forwardmgr.AbsForwardManager, reload: typing.Callable[[], typing.Awaitable[dict]]):
         super().__init__(dbmgr)
         self.chanmgr = chanmgr
         self.keymgr = keymgr
+        self.watchdog = watchdog
+        self.fwdmgr = fwdmgr
+        self.reload = reload
         self.group_name = "/api"
 
         @self.api("/channel/list", ["GET"], auth=True)
@@ -27,14 +40,16 @@ class WebAPIGroup(routergroup.APIGroup):
             # load channels from db to memory
             chan_list = await self.chanmgr.list_channels()
 
-            chan_list_json = [channel.Channel.dump_channel(chan) for chan in chan_list]
             chan_list_json = [{
-                "id": chan["id"],
-                "name": chan["name"],
-                "adapter": chan["adapter"]['type'],
-                "enabled": chan["enabled"],
-                "latency": chan["latency"],
-            } for chan in chan_list_json]
+                "id": chan.id,
+                "name": chan.name,
+                "adapter": chan.adapter.name(),
+                "enabled": chan.enabled,
+                "disabled_reason": chan.disabled_reason.value,
+                "traffic_share": chan.traffic_share(),
+                "latency": chan.latency,
+                "breaker": chan.breaker.state.value,
+            } for chan in chan_list]
 
             return quart.jsonify({
                 "code": 0,
@@ -103,10 +118,20 @@ class WebAPIGroup(routergroup.APIGroup):
             try:
                 chan = await self.chanmgr.get_channel(chan_id)
 
+                data = channel.Channel.dump_channel(chan)
+                data["adapter_stats"] = chan.adapter.get_stats()
+                data["breaker"] = chan.breaker.dump()
+                data["cooldown_until"] = chan.cooldown_until
+                data["stats"] = self.chanmgr.stats.dump(chan.id)
+                data["models"] = {
+                    key[1]: self.chanmgr.model_stats.dump(key)
+                    for key in self.chanmgr.model_stats.keys_of(chan.id)
+                }
+
                 return quart.jsonify({
                     "code": 0,
                     "message": "ok",
-                    "data": channel.Channel.dump_channel(chan),
+                    "data": data,
                 })
             except Exception as e:
                 return quart.jsonify({
@@ -161,6 +186,22 @@ class WebAPIGroup(routergroup.APIGroup):
                     "message": str(e),
                 })
 
+        @self.api("/channel/affinity", ["GET"], auth=True)
+        async def channel_affinity():
+            return quart.jsonify({
+                "code": 0,
+                "message": "ok",
+                "data": self.chanmgr.affinity.get_stats(),
+            })
+
+        @self.api("/channel/continuation", ["GET"], auth=True)
+        async def channel_continuation():
+            return quart.jsonify({
+                "code": 0,
+                "message": "ok",
+                "data": self.chanmgr.continuations.get_stats(),
+            })
+
         @self.api("/channel/test/<int:chan_id>", ["POST"], auth=True)
         async def channel_test(chan_id: int):
             try:
@@ -276,6 +317,44 @@ class WebAPIGroup(routergroup.APIGroup):
                     "message": str(e),
                 })
 
+        @self.api("/watchdog/stats", ["GET"], auth=True)
+        async def watchdog_stats():
+            return quart.jsonify({
+                "code": 0,
+                "message": "ok",
+                "data": self.watchdog.get_stats(),
+            })
+
+        @self.api("/forward/stats", ["GET"], auth=True)
+        async def forward_stats():
+            return quart.jsonify({
+                "code": 0,
+                "message": "ok",
+                "data": self.fwdmgr.get_stats(),
+            })
+
+        @self.api("/shadow/stats", ["GET"], auth=True)
+        async def shadow_stats():
+            return quart.jsonify({
+                "code": 0,
+                "message": "ok",
+                "data": self.fwdmgr.shadow.get_stats(),
+            })
+
+        @self.api("/config/reload", ["POST"], auth=True)
+        async def config_reload():
+            try:
+                return quart.jsonify({
+                    "code": 0,
+                    "message": "ok",
+                    "data": await self.reload(),
+                })
+            except Exception as e:
+                return quart.jsonify({
+                    "code": 1,
+                    "message": str(e),
+                })
+
         @self.api("/info/version", ["GET"], auth=False)
         async def info_version():
             try:
@@ -0,0 +1,87 @@
+"""ASGI fast path of the forward endpoint."""
+import asyncio
+
+import quart
+from werkzeug import datastructures
+
+from . import forward
+
+
+class FastPath:
+    """ASGI app serving chat completions directly, everything else goes to Quart.
+
+    Skips Quart routing, the request context and the auth wrapper: the
+    body is read raw, the key is looked up once and response chunks are
+    sent as they come. Requests are handled by `ForwardAPIGroup.complete`,
+    same as on Quart, inside an app context for `jsonify`.
+    """
+
+    paths: set[str] = {"/v1/chat/completions"}
+
+    app: quart.Quart
+
+    group: forward.ForwardAPIGroup
+
+    def __init__(self, app: quart.Quart, group: forward.ForwardAPIGroup):
+        self.app = app
+        self.group = group
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+        handler = asyncio.ensure_future(self.handle(scope, receive, send, body_read))
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive, handler, body_read))
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnect.done():  # server shutting down
+                raise
+        finally:
+            disconnect.cancel()
+
+    async def wait_disconnect(self, receive, handler: asyncio.Future, body_read: asyncio.Event):
+        """Cancel handler once client is gone, like Quart does."""
+        await body_read.wait()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                handler.cancel()
+                return
+
+    async def handle(self, scope: dict, receive, send, body_read: asyncio.Event):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body_read.set()
+
+        headers = datastructures.Headers([
+            (name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]
+        ])
+
+        async with self.app.app_context():
+            auth = headers.get("Authorization")
+            rv = self.group.check_auth(auth)
+            if rv is None:
+                rv = await self.group.complete(headers, b"".join(chunks), self.group.keymgr.find_key(auth[7:]))
+            response = await self.app.make_response(rv)
+
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()
+                ],
+            })
+            async with response.response as body:
+                async for data in body:
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,3 +1,7 @@
+import json
+import time
+import typing
+
 import quart
 
 from ...models.router import group as routergroup
@@ -5,13 +9,25 @@ from ...models.key import mgr as apikeymgr
 from ...models.channel import mgr as channelmgr
 from ...models.database import db
 from ...models.forward import mgr as forwardmgr
+from ...models.conversation import mgr as conversationmgr
 from ...entities import channel, apikey, request, response, exceptions
 
 
 class ForwardAPIGroup(routergroup.APIGroup):
+
+    trim_prompt_keys: list[str] = []
+    """Names of API keys whose requests are always trimmed to fit context window."""
+
+    max_choices: int = 8
+    """Maximum `n` of a request."""
+
+    embedding_options: list[str] = ["encoding_format", "dimensions"]
+    """Embeddings parameters forwarded upstream, besides model and input."""
+
     chanmgr: channelmgr.AbsChannelManager
     keymgr: apikeymgr.AbsAPIKeyManager
     fwdmgr: forwardmgr.AbsForwardManager
+    convmgr: conversationmgr.AbsConversationManager
 
     def __init__(
         self,
@@ -19,6 +35,7 @@ class ForwardAPIGroup(routergroup.APIGroup):
         chanmgr: channelmgr.AbsChannelManager,
         keymgr: apikeymgr.AbsAPIKeyManager,
         fwdmgr: forwardmgr.AbsForwardManager,
+        convmgr: conversationmgr.AbsConversationManager,
     ):
         super().__init__(dbmgr)
         self.forwardmgr = forwardmgr
@@ -26,26 +43,47 @@ class ForwardAPIGroup(routergroup.APIGroup):
         self.chanmgr = chanmgr
         self.keymgr = keymgr
         self.fwdmgr = fwdmgr
+        self.convmgr = convmgr
 
         @self.api("/v1/chat/completions", ["POST"], auth=True)
         async def chat_completion():
+            return await self.complete(
+                quart.request.headers,
+                await quart.request.get_data(),
+                self.current_key(),
+            )
+
+        @self.api("/v1/embeddings", ["POST"], auth=True)
+        async def embeddings():
             try:
-                raw_data = await quart.request.get_json()
+                raw_data = await quart.request.get_json(force=True)
 
-                req = request.Request(
-                    raw_data["model"],
-                    raw_data["messages"],
-                    raw_data.get("functions"),
-                    raw_data.get("stream", False),
-                )
+                inputs = raw_data.get("input")
+                if isinstance(inputs, str) or (
+                    isinstance(inputs, list) and len(inputs) > 0 and all(isinstance(item, int) for item in inputs)
+                ):
+                    inputs = [inputs]  # one string or one token array
+                if not isinstance(inputs, list) or len(inputs) == 0 or not all(
+                    isinstance(item, str) or (isinstance(item, list) and all(isinstance(t, int) for t in item))
+                    for item in inputs
+                ):
+                    raise exceptions.QueryHandlingError(
+                        400,
+                        "invalid_value",
+                        "Invalid 'input': must be a string, an array of strings or an array of token arrays.",
+                        "invalid_request_error",
+                        "input",
+                    )
 
-                result = await self.fwdmgr.query(
-                    "/v1/chat/completions",
-                    req,
-                    raw_data,
-                )
-                return result
+                # requests batched together must agree on these
+                options = {
+                    k: raw_data[k] for k in self.embedding_options if raw_data.get(k) is not None
+                }
 
+                return await self.fwdmgr.embed(raw_data["model"], inputs, options)
+
+            except exceptions.QueryHandlingError as e:
+                return self.fwdmgr.error_response(e)
             except:
                 return quart.jsonify(
                     {
@@ -58,6 +96,146 @@ class ForwardAPIGroup(routergroup.APIGroup):
                     }
                 ), 500
 
+        @self.api("/v1/chat/completions/<completion_id>/stream", ["GET"], auth=True)
+        async def resume_completion(completion_id: str):
+            last_event_id = quart.request.headers.get("Last-Event-ID") or completion_id
+            resumed = None
+            if last_event_id.startswith(completion_id):
+                resumed = self.fwdmgr.resume_stream(last_event_id, self.current_key().raw)
+            if resumed is None:
+                return self.fwdmgr.error_response(exceptions.QueryHandlingError(
+                    404,
+                    "stream_not_found",
+                    f"Stream of {completion_id} does not exist or has expired.",
+                    "invalid_request_error",
+                ))
+            return resumed
+
+        @self.api("/v1/conversations/<conversation_id>", ["DELETE"], auth=True)
+        async def delete_conversation(conversation_id: str):
+            if not await self.convmgr.delete(conversation_id, self.current_key().id):
+                return self.fwdmgr.error_response(exceptions.QueryHandlingError(
+                    404,
+                    "conversation_not_found",
+                    f"Conversation {conversation_id} does not exist.",
+                    "invalid_request_error",
+                ))
+            return quart.jsonify({
+                "id": conversation_id,
+                "object": "conversation.deleted",
+                "deleted": True,
+            })
+
+    async def complete(
+        self,
+        headers: typing.Mapping[str, str],
+        raw_body: bytes,
+        key_obj: apikey.FreeOneAPIKey,
+    ) -> quart.Response:
+        """Handle a chat completion request, already authenticated.
+
+        Needs no request context, the ASGI fast path calls it directly.
+        """
+        try:
+            # reconnect of a dropped stream, don't generate again
+            last_event_id = headers.get("Last-Event-ID")
+            if last_event_id:
+                resumed = self.fwdmgr.resume_stream(last_event_id, key_obj.raw)
+                if resumed is not None:
+                    return resumed
+
+            before = time.perf_counter()
+            raw_data = json.loads(raw_body)
+            parse_seconds = time.perf_counter() - before
+
+            stop = raw_data.get("stop")
+            if isinstance(stop, str):
+                stop = [stop]
+
+            n = raw_data.get("n") or 1
+            if not isinstance(n, int) or n < 1 or n > self.max_choices:
+                raise exceptions.QueryHandlingError(
+                    400,
+                    "invalid_value",
+                    f"Invalid 'n': must be an integer between 1 and {self.max_choices}.",
+                    "invalid_request_error",
+                    "n",
+                )
+
+            req = request.Request(
+                raw_data["model"],
+                raw_data["messages"],
+                raw_data.get("functions"),
+                raw_data.get("stream", False),
+                headers.get("X-Session-Id") or raw_data.get("user"),
+                raw_body,
+                raw_data.get("max_tokens") or raw_data.get("max_completion_tokens"),
+                self.should_trim(headers, key_obj),
+                stop,
+                n,
+                key_obj.raw,
+                self.resume_requested(headers),
+            )
+
+            conversation_id = headers.get("X-Conversation-Id")
+            if conversation_id:
+                await self.convmgr.resume(
+                    conversation_id,
+                    key_obj.id,
+                    req,
+                    raw_data,
+                    parse_seconds,
+                )
+
+            result = await self.fwdmgr.query(
+                "/v1/chat/completions",
+                req,
+                raw_data,
+            )
+            return result
+
+        except exceptions.QueryHandlingError as e:
+            return self.fwdmgr.error_response(e)
+        except:
+            return quart.jsonify(
+                {
+                    "error": {
+                        "message": "Error occurred while handling your request. You can retry or contact your admin.",
+                        "type": "requests",
+                        "param": None,
+                        "code": None
+                    }
+                }
+            ), 500
+
+    def current_key(self) -> apikey.FreeOneAPIKey:
+        """API key of current request, already checked by auth."""
+        return self.keymgr.find_key(quart.request.headers.get("Authorization", "")[7:])
+
+    def should_trim(self, headers: typing.Mapping[str, str], key_obj: apikey.FreeOneAPIKey) -> bool:
+        """Whether prompt of a request may be trimmed.
+
+        Opt in by `X-Trim-Prompt: true` header, or by key name in `trim_prompt_keys`.
+        """
+        header = headers.get("X-Trim-Prompt")
+        if header is not None:
+            return header.lower() in ("1", "true", "yes")
+
+        if not self.trim_prompt_keys:
+            return False
+
+        return key_obj is not None and key_obj.name in self.trim_prompt_keys
+
+    def resume_requested(self, headers: typing.Mapping[str, str]) -> bool:
+        """Whether a streamed response should be resumable after a disconnect.
+
+        Opt in by `X-Resumable: true` header, None without the header.
+        """
+        header = headers.get("X-Resumable")
+        if header is None:
+            return None
+        return header.lower() in ("1", "true", "yes")
+
     def get_tokens(self) -> list[str]:
         key_obj_list: apikey.FreeOneAPIKey = self.keymgr.get_key_list()
         key_list = [key_obj.raw for key_obj in key_obj_list]
@@ -77,7 +255,7 @@ class ForwardAPIGroup(routergroup.APIGroup):
             ), 401
         token = auth[7:]
 
-        if token not in self.get_tokens():
+        if self.keymgr.find_key(token) is None:
             prefix = token[:8]
             suffix = token[-4:]
             mid = "*" * ((51 - len(prefix) - len(suffix)) if (len(prefix) + len(suffix) < 51) else 0)
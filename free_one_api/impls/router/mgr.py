@@ -1,6 +1,10 @@
 import os
 
 import quart
+from hypercorn import config as hyperconfig
+from hypercorn import asyncio as hyperasyncio
+
+from . import fast, forward
 
 
 class RouterManager:
@@ -13,7 +17,15 @@ class RouterManager:
     frontend_dir: str
     _app: quart.Quart
 
-    def __init__(self, routes: list[tuple[str, list[str], callable, dict]], config: dict):
+    _fast: fast.FastPath
+    """ASGI fast path mounted ahead of Quart, None if disabled."""
+
+    def __init__(
+        self,
+        routes: list[tuple[str, list[str], callable, dict]],
+        config: dict,
+        forward_group: forward.ForwardAPIGroup=None,
+    ):
         self.port = config["port"] if "port" in config else 3001
         self._app = quart.Quart(__name__)
 
@@ -21,9 +33,22 @@ class RouterManager:
             for method in methods:
                 self._app.route(route, methods=[method], **kwargs)(handler)
 
+        self._fast = None
+        if config.get("fast_path", False) and forward_group is not None:
+            self._fast = fast.FastPath(self._app, forward_group)
+
     async def serve(self, loop):
         """Serve API."""
-        return await self._app.run_task(host="0.0.0.0", port=self.port)
+        if self._fast is None:
+            return await self._app.run_task(host="0.0.0.0", port=self.port)
+
+        # same server settings as Quart.run_task
+        config = hyperconfig.Config()
+        config.access_log_format = "%(h)s %(r)s %(s)s %(b)s %(D)s"
+        config.accesslog = self._app.logger
+        config.errorlog = self._app.logger
+        config.bind = [f"0.0.0.0:{self.port}"]
+        return await hyperasyncio.serve(self._fast, config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+import asyncio
+
+from ....models.watchdog import task
+from ...conversation import mgr as conversationmgr
+
+
+class ConversationCleanupTask(task.AbsTask):
+    """Periodically delete expired conversations."""
+
+    def __init__(self, convmgr: conversationmgr.ConversationManager):
+        self.convmgr = convmgr
+        self.delay = convmgr.purge_interval
+        self.interval = convmgr.purge_interval
+
+        self.purged = 0
+
+    async def trigger(self):
+        """Trigger this task."""
+        self.purged += await self.convmgr.purge_expired()
+
+    def get_stats(self) -> dict:
+        return {
+            "purged": self.purged,
+        }
+
+    async def loop(self):
+        """Main loop for periodic execution."""
+        await asyncio.sleep(self.delay)
+        while True:
+            try:
+                await self.trigger()
+            except Exception as e:
+                print(f"Error purging conversations: {str(e)}")
+            await asyncio.sleep(self.interval)
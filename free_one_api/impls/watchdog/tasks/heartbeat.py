@@ -1,5 +1,7 @@
+import time
 import asyncio
 import random
+import collections
 
 from ....models.watchdog import task
 from ....models.channel import mgr as chanmgr
@@ -7,42 +9,131 @@ from ....entities import channel
 
 
 class HeartBeatTask(task.AbsTask):
-    """HeartBeat task."""
+    """HeartBeat task.
+
+    Schedules a probe of every enabled channel at its own next probe time,
+    probes are bounded by `concurrency`. Channels which served a successful
+    request within `interval` are not probed, channels which failed recently
+    are probed every `retry_interval`.
+    """
 
     def __init__(self, chan: chanmgr.AbsChannelManager, cfg: dict):
         self.channel = chan
         self.cfg = cfg
         self.delay = 5
-        self.interval = cfg['interval']
+        self.interval = cfg.get("tick", 5)
+
+        self.probe_interval = cfg["interval"]
+        self.retry_interval = cfg.get("retry_interval", 60)
+        self.jitter = cfg.get("jitter", 0.1)
+        self.semaphore = asyncio.Semaphore(cfg.get("concurrency", 8))
+
+        self.next_probe: dict[int, float] = {}
+        """Channel id to next probe time."""
+
+        self.probing: set[int] = set()
+        """Channel ids being probed."""
+
+        self.probes = collections.deque()
+        """(time, adapter name) of probes in last hour."""
+
+        self.skipped = 0
+        """Probes skipped since live traffic proved health."""
+
+    def schedule(self, ch: channel.Channel, now: float):
+        """Set next probe time of channel."""
+        interval = self.probe_interval
+
+        # failed or breaker transited recently
+        transitions = ch.breaker.transitions
+        if ch.fail_count > 0 or (transitions and now - transitions[-1]["time"] < self.probe_interval):
+            interval = min(self.retry_interval, self.probe_interval)
+
+        self.next_probe[ch.id] = now + interval * (1 + random.uniform(-self.jitter, self.jitter))
 
     async def process_channel(self, ch: channel.Channel):
         """Process single channel heartbeat."""
         try:
-            random_delay = random.randint(0, 30)
-            await asyncio.sleep(random_delay)
+            async with self.semaphore:
+                latency = ch.latency
+                fail_count = await ch.heartbeat(timeout=self.cfg["timeout"])
+                self.probes.append((time.time(), ch.adapter.name()))
 
-            fail_count = await ch.heartbeat(timeout=self.cfg["timeout"])
             if fail_count >= self.cfg["fail_limit"]:
                 try:
-                    await self.channel.disable_channel(ch.id)
+                    await self.channel.disable_channel(ch.id, channel.DisabledReason.HEARTBEAT)
                     ch.fail_count = 0
                 except Exception as e:
                     print(f"Error disabling channel {ch.id}: {str(e)}")
-            await self.channel.update_channel(ch)
+            elif fail_count == 0 and self.latency_changed(latency, ch.latency):
+                await self.channel.update_channel(ch)
         except Exception as e:
             print(f"Error processing channel {ch.id}: {str(e)}")
+        finally:
+            self.probing.discard(ch.id)
+            self.schedule(ch, time.time())
+
+    def latency_changed(self, old: float, new: float) -> bool:
+        """Whether latency changed enough to be written to database."""
+        if old is None or old <= 0:
+            return True
+        return abs(new - old) / old > 0.2
 
     async def trigger(self):
         """Trigger this task."""
+        now = time.time()
+        loop = asyncio.get_running_loop()
+        stats = self.channel.stats
+
         enabled_channels = [chan for chan in self.channel.channels if chan.enabled]
-        tasks = [self.process_channel(chan) for chan in enabled_channels]
-        await asyncio.gather(*tasks)
+
+        for chan in enabled_channels:
+            if chan.id in self.probing:
+                continue
+
+            if chan.id not in self.next_probe:
+                # spread first probes
+                self.next_probe[chan.id] = now + random.uniform(0, min(self.probe_interval, 60))
+                continue
+
+            if now < self.next_probe[chan.id]:
+                continue
+
+            last_success = stats.last_success[stats.slot(chan.id)]
+            if chan.fail_count == 0 and now - last_success < self.probe_interval:
+                self.skipped += 1
+                self.schedule(chan, now)
+                continue
+
+            self.probing.add(chan.id)
+            loop.create_task(self.process_channel(chan))
+
+        # forget deleted or disabled channels
+        enabled_ids = {chan.id for chan in enabled_channels}
+        for channel_id in list(self.next_probe):
+            if channel_id not in enabled_ids:
+                del self.next_probe[channel_id]
+
+        while self.probes and self.probes[0][0] < now - 3600:
+            self.probes.popleft()
+
+    def get_stats(self) -> dict:
+        """Probe cost of last hour."""
+        per_adapter = collections.Counter(name for _, name in self.probes)
+        return {
+            "probes_last_hour": len(self.probes),
+            "probes_last_hour_by_adapter": dict(per_adapter),
+            "skipped_by_live_traffic": self.skipped,
+            "probing": len(self.probing),
+            "scheduled": len(self.next_probe),
+        }
 
     async def loop(self):
         """Main loop for periodic execution."""
+        await asyncio.sleep(self.delay)
         while True:
             try:
                 await self.trigger()
             except Exception as e:
                 print(f"Error in heartbeat loop: {str(e)}")
-            await asyncio.sleep(self.interval)
\ No newline at end of file
+            await asyncio.sleep(self.interval)
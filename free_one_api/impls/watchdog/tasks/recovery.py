@@ -1,4 +1,7 @@
+import time
 import asyncio
+import random
+import collections
 
 from ....models.watchdog import task
 from ....models.channel import mgr as chanmgr
@@ -6,4 +9,154 @@ from ....entities import channel
 
 
 class ChannelRecoveryTask(task.AbsTask):
-    """Automatically recover disabled channels."""
\ No newline at end of file
+    """Automatically recover disabled channels.
+
+    Only channels disabled by heartbeat are probed, channels disabled by admin
+    stay disabled. A channel is probed with exponential backoff (with jitter),
+    after `successes` consecutive successful probes it's enabled and ramps its
+    traffic share up from `initial_share` to 1 in `ramp_duration` seconds.
+    """
+
+    def __init__(self, chan: chanmgr.AbsChannelManager, cfg: dict):
+        self.channel = chan
+        self.cfg = cfg
+        self.delay = 30
+        self.interval = cfg.get("tick", 10)
+
+        self.base_delay = cfg.get("base_delay", 60)
+        self.max_delay = cfg.get("max_delay", 3600)
+        self.jitter = cfg.get("jitter", 0.2)
+        self.confirm_interval = cfg.get("confirm_interval", 30)
+        self.successes = cfg.get("successes", 3)
+        self.timeout = cfg.get("timeout", 120)
+        self.ramp_duration = cfg.get("ramp_duration", 600)
+        self.initial_share = cfg.get("initial_share", 0.1)
+        self.semaphore = asyncio.Semaphore(cfg.get("concurrency", 4))
+
+        self.states: dict[int, dict] = {}
+        """Channel id to dict of attempts, successes and next probe time."""
+
+        self.probing: set[int] = set()
+        """Channel ids being probed."""
+
+        self.recoveries = collections.deque()
+        """(time, channel id) of recoveries in last day."""
+
+        self.probe_count = 0
+        """Amount of recovery probes sent."""
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before next probe after `attempts` failed probes."""
+        delay = min(self.max_delay, self.base_delay * 2 ** min(attempts, 32))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def process_channel(self, ch: channel.Channel):
+        """Probe an auto-disabled channel."""
+        state = self.states[ch.id]
+        try:
+            async with self.semaphore:
+                self.probe_count += 1
+                try:
+                    succ, _ = await asyncio.wait_for(ch.adapter.probe(), timeout=self.timeout)
+                except Exception:
+                    succ = False
+
+            now = time.time()
+
+            if not succ:
+                state["successes"] = 0
+                state["attempts"] += 1
+                state["next_probe"] = now + self.backoff(state["attempts"])
+                return
+
+            state["successes"] += 1
+            if state["successes"] < self.successes:
+                state["next_probe"] = now + self.confirm_interval
+                return
+
+            ch.fail_count = 0
+            ch.start_ramp(self.ramp_duration, self.initial_share)
+            await self.channel.enable_channel(ch.id)
+            self.recoveries.append((now, ch.id))
+            del self.states[ch.id]
+        except Exception as e:
+            print(f"Error recovering channel {ch.id}: {str(e)}")
+            state["next_probe"] = time.time() + self.backoff(state["attempts"])
+        finally:
+            self.probing.discard(ch.id)
+
+    async def trigger(self):
+        """Trigger this task."""
+        now = time.time()
+        loop = asyncio.get_running_loop()
+
+        auto_disabled = [
+            chan for chan in self.channel.channels
+            if not chan.enabled and chan.disabled_reason == channel.DisabledReason.HEARTBEAT
+        ]
+
+        for chan in auto_disabled:
+            if chan.id in self.probing:
+                continue
+
+            if chan.id not in self.states:
+                self.states[chan.id] = {
+                    "attempts": 0,
+                    "successes": 0,
+                    "next_probe": now + self.backoff(0),
+                }
+                continue
+
+            if now < self.states[chan.id]["next_probe"]:
+                continue
+
+            self.probing.add(chan.id)
+            loop.create_task(self.process_channel(chan))
+
+        # forget deleted, enabled or admin disabled channels
+        auto_disabled_ids = {chan.id for chan in auto_disabled}
+        for channel_id in list(self.states):
+            if channel_id not in auto_disabled_ids and channel_id not in self.probing:
+                del self.states[channel_id]
+
+        while self.recoveries and self.recoveries[0][0] < now - 86400:
+            self.recoveries.popleft()
+
+    def get_stats(self) -> dict:
+        """Recovered capacity of last day."""
+        now = time.time()
+
+        # recoveries per hour, the last one is the current hour
+        per_hour = [0] * 24
+        for recovered_at, _ in self.recoveries:
+            per_hour[23 - min(23, int((now - recovered_at) // 3600))] += 1
+
+        ramping = {
+            chan.id: round(chan.traffic_share(), 3)
+            for chan in self.channel.channels
+            if chan.enabled and chan.traffic_share() < 1
+        }
+
+        return {
+            "auto_disabled": len(self.states),
+            "probing": len(self.probing),
+            "probes": self.probe_count,
+            "recovered_last_day": len(self.recoveries),
+            "recovered_per_hour": per_hour,
+            "ramping": ramping,
+            "ramping_capacity": sum(ramping.values()),
+            "next_probes": {
+                channel_id: state["next_probe"]
+                for channel_id, state in self.states.items()
+            },
+        }
+
+    async def loop(self):
+        """Main loop for periodic execution."""
+        await asyncio.sleep(self.delay)
+        while True:
+            try:
+                await self.trigger()
+            except Exception as e:
+                print(f"Error in recovery loop: {str(e)}")
+            await asyncio.sleep(self.interval)
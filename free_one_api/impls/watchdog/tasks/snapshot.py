@@ -0,0 +1,46 @@
+import asyncio
+
+from ....models.watchdog import task
+from ....models.channel import mgr as chanmgr
+from ...channel import snapshot
+
+
+class StatsSnapshotTask(task.AbsTask):
+    """Periodically snapshot runtime statistics of all channels.
+
+    Statistics of all channels are captured at once and written in one
+    batch by an executor thread, so the event loop never waits for disk.
+    """
+
+    def __init__(self, chan: chanmgr.AbsChannelManager, snap: snapshot.StatsSnapshot):
+        self.channel = chan
+        self.snapshot = snap
+        self.delay = snap.interval
+        self.interval = snap.interval
+
+        self.writes = 0
+        self.last_write = 0.0
+
+    async def trigger(self):
+        """Trigger this task."""
+        data = self.snapshot.capture(self.channel)
+        await asyncio.get_running_loop().run_in_executor(None, self.snapshot.write, data)
+        self.writes += 1
+        self.last_write = data["time"]
+
+    def get_stats(self) -> dict:
+        return {
+            "writes": self.writes,
+            "last_write": self.last_write,
+            "path": self.snapshot.path,
+        }
+
+    async def loop(self):
+        """Main loop for periodic execution."""
+        await asyncio.sleep(self.delay)
+        while True:
+            try:
+                await self.trigger()
+            except Exception as e:
+                print(f"Error writing stats snapshot: {str(e)}")
+            await asyncio.sleep(self.interval)
@@ -4,6 +4,7 @@ import typing
 from ...entities import response
 from ...entities import request
 from ...models.channel import evaluation
+from ...common import ratelimit, tokens
 
 
 class LLMLibAdapter(metaclass=abc.ABCMeta):
@@ -81,6 +82,94 @@ class LLMLibAdapter(metaclass=abc.ABCMeta):
         """
         return self.config
 
+    def passthrough_supported(self) -> bool:
+        """True if upstream speaks OpenAI API and requests can be passed through raw.
+
+        Adapters returning True implement `passthrough`, it is never called on others.
+        """
+        return False
+
+    async def passthrough(self, req: request.Request, body: bytes) -> typing.AsyncGenerator[bytes, None]:
+        """Send raw OpenAI API request body to upstream, yield raw response body.
+
+        Raise if upstream responds error status. Rate limit signals of the
+        response are set to `req.rate_limit`.
+        """
+        raise NotImplementedError(f"{self.name()} does not support passthrough")
+        yield
+
+    def continuation_supported(self) -> bool:
+        """True if upstream keeps conversations and can continue them from a handle.
+
+        Adapters returning True send only `req.messages[req.continued_messages:]`
+        when `req.continuation` is set, and set `req.next_continuation` after
+        answering.
+        """
+        return False
+
+    def embedding_supported(self) -> bool:
+        """True if upstream serves /v1/embeddings.
+
+        Adapters returning True implement `embedding_models` and `embed`,
+        they are never called on others.
+        """
+        return False
+
+    def embedding_models(self) -> list[str]:
+        """Embedding models served by upstream."""
+        return []
+
+    async def embed(self, model: str, inputs: list, options: dict) -> tuple[list, int, ratelimit.RateLimitInfo]:
+        """Embed all inputs in one upstream call.
+
+        Args:
+            model: upstream model name.
+            inputs: strings or token arrays.
+            options: OpenAI embeddings parameters besides model and input, e.g. dimensions.
+
+        Returns:
+            list: embeddings, in order of inputs.
+            int: prompt tokens of all inputs, as counted by upstream.
+            ratelimit.RateLimitInfo: rate limit signals of the response, None if none.
+        """
+        raise NotImplementedError(f"{self.name()} does not support embeddings")
+
+    def context_window(self, model: str) -> tuple[int, int]:
+        """(context window, max output tokens) of model, None if unknown.
+
+        Overridden by `context_windows` of adapter config, which maps model name
+        to context window or [context window, max output tokens].
+        """
+        override = self.config.get("context_windows", {}).get(model) if isinstance(self.config, dict) else None
+        if isinstance(override, int):
+            return override, override
+        if isinstance(override, (list, tuple)) and len(override) == 2:
+            return int(override[0]), int(override[1])
+        return tokens.context_window(model)
+
+    async def start(self):
+        """Prepare upstream state once the channel is loaded, e.g. fetch model list.
+
+        Awaited by channel manager before the channel is selectable.
+        Defaults to nothing.
+        """
+        pass
+
+    async def close(self):
+        """Release upstream state once the channel is replaced or removed.
+
+        In-flight requests may still finish on this adapter. Defaults to nothing.
+        """
+        pass
+
+    def get_stats(self) -> dict:
+        """Get runtime statistics of this adapter.
+
+        Returns:
+            dict: statistics, empty if adapter has none.
+        """
+        return {}
+
     @abc.abstractmethod
     async def test(self) -> typing.Union[bool, str]:
         """Test the adapter.
@@ -91,10 +180,22 @@ class LLMLibAdapter(metaclass=abc.ABCMeta):
         """
         return False, "not implemented"
 
+    async def probe(self) -> typing.Union[bool, str]:
+        """Cheap health check for heartbeat, e.g. listing models or a 1-token completion.
+
+        Defaults to `test`.
+
+        Returns:
+            bool: True if adapter can be used.
+            str: error message, empty if no error
+        """
+        return await self.test()
+
     @abc.abstractmethod
     async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:
         """Query reply from LLM lib.
         
         Always in streaming mode. If upstream lib doesn't support streaming, just yield one time.
+        Rate limit signals of the upstream response are set to `req.rate_limit`.
         """
         yield None
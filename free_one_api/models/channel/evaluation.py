@@ -1,8 +1,9 @@
 import abc
 import asyncio
-import time
 import enum
 
+from ...common import clock
+
 class Record:
 
     start_time: float = 0.0
@@ -26,9 +27,21 @@ class Record:
     success: bool = False
     """Whether the request is successful."""
 
+    cancelled: bool = False
+    """Whether the client went away before the request finished, neither success nor failure of channel."""
+
+    sticky: bool = False
+    """Whether the channel is selected by affinity routing."""
+
+    model: str = None
+    """Upstream model name, after model mapping."""
+
     error: Exception = None
     """Error of request."""
 
+    rate_limit: 'ratelimit.RateLimitInfo' = None
+    """Rate limit signals of the upstream response, applied to the channel on commit."""
+
     def __init__(
         self,
         start_time: float=0.0,
@@ -48,7 +61,7 @@ class Record:
         self.error = error
 
     def commit(self):
-        self.end_time = time.time()
+        self.end_time = clock.now()
 
     def __str__(self) -> str:
         return f"""Record(start_time={self.start_time}, 
@@ -57,7 +70,10 @@ latency={self.latency},
 req_messages_length={self.req_messages_length}, 
 resp_message_length={self.resp_message_length}, 
 stream={self.stream}, 
+sticky={self.sticky}, 
+model={self.model}, 
 success={self.success}, 
+cancelled={self.cancelled}, 
 error={self.error}
 )""".replace("\n", "")
 
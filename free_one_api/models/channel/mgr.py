@@ -5,6 +5,7 @@ import tiktoken
 from ...entities import channel
 from ..database import db
 from ...entities import request, response
+from ..channel import evaluation
 
 
 class AbsChannelManager(metaclass=abc.ABCMeta):
@@ -16,6 +17,18 @@ class AbsChannelManager(metaclass=abc.ABCMeta):
     channels: list[channel.Channel]
     """Channel list in runtime."""
 
+    stats: 'chanstats.ChannelStatsTable'
+    """Runtime statistics of channels."""
+
+    model_stats: 'chanstats.ChannelStatsTable'
+    """Runtime statistics keyed by (channel id, upstream model name)."""
+
+    affinity: 'affinity.AffinityRouter'
+    """Conversation affinity router."""
+
+    continuations: 'continuation.ContinuationStore'
+    """Upstream conversation handles."""
+
     @abc.abstractmethod
     async def list_channels(self) -> list[channel.Channel]:
         """List all channels."""
@@ -41,14 +54,35 @@ class AbsChannelManager(metaclass=abc.ABCMeta):
         """Update a channel."""
         pass
 
+    @abc.abstractmethod
+    async def prepare_channels(self, channels: list[channel.Channel]) -> None:
+        """Start adapters of loaded channels before `swap_channels` makes them selectable."""
+        pass
+
+    @abc.abstractmethod
+    def swap_channels(self, channels: list[channel.Channel]) -> dict:
+        """Replace runtime channels by channels loaded from database, keeping unchanged ones.
+
+        Args:
+            channels: channels loaded from database.
+
+        Returns:
+            dict: report of added, updated and removed channels.
+        """
+        pass
+
     @abc.abstractmethod
     async def enable_channel(self, channel_id: int) -> None:
         """Enable a channel."""
         pass
 
     @abc.abstractmethod
-    async def disable_channel(self, channel_id: int) -> None:
-        """Disable a channel."""
+    async def disable_channel(
+        self,
+        channel_id: int,
+        reason: channel.DisabledReason=channel.DisabledReason.ADMIN,
+    ) -> None:
+        """Disable a channel, reason is persisted."""
         pass
 
     @abc.abstractmethod
@@ -76,3 +110,22 @@ class AbsChannelManager(metaclass=abc.ABCMeta):
             id_suffix: suffix of channel id.
         """
         pass
+
+    @abc.abstractmethod
+    async def select_embedding_channel(self, model: str) -> channel.Channel:
+        """Select a channel serving embedding model.
+
+        Args:
+            model: embedding model name requested by client.
+        """
+        pass
+
+    @abc.abstractmethod
+    def add_record(self, chan: channel.Channel, record: evaluation.Record) -> None:
+        """Add a record of request started on channel."""
+        pass
+
+    @abc.abstractmethod
+    def commit_record(self, chan: channel.Channel, record: evaluation.Record) -> None:
+        """Commit a record of request finished on channel."""
+        pass
@@ -0,0 +1,60 @@
+import abc
+
+from ...entities import conversation, request
+from ..database import db
+
+
+class AbsConversationManager(metaclass=abc.ABCMeta):
+    """Conversations stored by the proxy, so clients send only the new turn."""
+
+    dbmgr: db.DatabaseInterface
+    """Database manager."""
+
+    @abc.abstractmethod
+    async def resume(
+        self,
+        conversation_id: str,
+        owner: int,
+        req: request.Request,
+        raw_data: dict,
+        parse_seconds: float,
+    ) -> conversation.Conversation:
+        """Prepend stored history to messages of request.
+
+        Args:
+            conversation_id: id of conversation, `new` to start one.
+            owner: id of API key of request.
+            req: request carrying only the new turn.
+            raw_data: parsed request body, its messages are replaced too.
+            parse_seconds: time spent parsing request body, for statistics.
+
+        Raises:
+            QueryHandlingError: conversation not found or expired.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def commit(self, req: request.Request, reply: str) -> None:
+        """Append turn of a successful request and its reply to the conversation.
+
+        The next turn sees it at once, writing to database may happen later.
+        """
+        pass
+
+    async def flush(self) -> None:
+        """Write conversations not written to database yet."""
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, conversation_id: str, owner: int) -> bool:
+        """Delete a conversation, returns False if not found."""
+        pass
+
+    @abc.abstractmethod
+    async def purge_expired(self) -> int:
+        """Delete expired conversations, returns amount deleted from database."""
+        pass
+
+    def get_stats(self) -> dict:
+        """Get runtime statistics of conversations."""
+        return {}
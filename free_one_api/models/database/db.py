@@ -1,6 +1,6 @@
 import abc
 
-from ...entities import channel, apikey
+from ...entities import channel, apikey, conversation
 
 
 class DatabaseInterface(metaclass=abc.ABCMeta):
@@ -44,4 +44,24 @@ class DatabaseInterface(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     async def delete_key(self, key_id: int) -> None:
         """Delete a key."""
-        return
\ No newline at end of file
+        return
+
+    @abc.abstractmethod
+    async def get_conversation(self, conversation_id: str) -> conversation.Conversation:
+        """Get a conversation, None if not found."""
+        return
+
+    @abc.abstractmethod
+    async def save_conversation(self, conv: conversation.Conversation) -> None:
+        """Insert or update a conversation."""
+        return
+
+    @abc.abstractmethod
+    async def delete_conversation(self, conversation_id: str) -> None:
+        """Delete a conversation."""
+        return
+
+    @abc.abstractmethod
+    async def delete_conversations_before(self, updated_at: float) -> int:
+        """Delete conversations not updated since `updated_at`, returns amount deleted."""
+        return
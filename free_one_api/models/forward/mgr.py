@@ -4,6 +4,7 @@ import quart
 
 from ...models.channel import mgr as channelmgr
 from ...models.key import mgr as apikeymgr
+from ...models.conversation import mgr as conversationmgr
 from ...entities import channel, apikey
 from ...models import adapter
 from ...entities import request, response
@@ -11,6 +12,7 @@ from ...entities import request, response
 
 supported_paths = [
     "/v1/chat/completions",
+    "/v1/embeddings",
 ]
 
 
@@ -27,6 +29,18 @@ class AbsForwardManager(metaclass=abc.ABCMeta):
     
     keymgr: apikeymgr.AbsAPIKeyManager
     """API key manager."""
+
+    convmgr: conversationmgr.AbsConversationManager
+    """Stored conversations."""
+
+    shadow: 'shadow.ShadowMirror'
+    """Mirrors requests to shadow channels."""
+
+    streams: 'resume.StreamRegistry'
+    """Streamed completions clients can reconnect to."""
+
+    embeddings: 'batcher.EmbeddingBatcher'
+    """Micro-batcher of embedding requests."""
     
     @abc.abstractmethod
     async def query(
@@ -44,3 +58,23 @@ class AbsForwardManager(metaclass=abc.ABCMeta):
             stream_mode: stream mode.
         """
         pass
+
+    @abc.abstractmethod
+    async def embed(
+        self,
+        model: str,
+        inputs: list,
+        options: dict,
+    ) -> quart.Response:
+        """Embeddings of inputs, in OpenAI format.
+
+        Args:
+            model: embedding model name.
+            inputs: strings or token arrays.
+            options: other OpenAI embeddings parameters, e.g. dimensions.
+        """
+        pass
+
+    def get_stats(self) -> dict:
+        """Get runtime statistics of forwarding."""
+        return {}
@@ -14,6 +14,13 @@ class AbsAPIKeyManager(metaclass=abc.ABCMeta):
     def get_key_list(self) -> list[apikey.FreeOneAPIKey]:
         """Get key list."""
         return self.keys
+
+    def find_key(self, raw: str) -> apikey.FreeOneAPIKey:
+        """Get key by its raw value, None if no such key."""
+        for key in self.keys:
+            if key.raw == raw:
+                return key
+        return None
     
     @abc.abstractmethod
     async def has_key(self, key_id: int) -> bool:
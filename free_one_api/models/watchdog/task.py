@@ -19,6 +19,10 @@ class AbsTask(metaclass=abc.ABCMeta):
         """Trigger this task."""
         raise NotImplementedError
 
+    def get_stats(self) -> dict:
+        """Get runtime statistics of this task."""
+        return {}
+
     async def loop(self):
         """Loop this task."""
         await asyncio.sleep(self.delay)
@@ -12,3 +12,9 @@ class AbsWatchDog(metaclass=abc.ABCMeta):
     async def run(self):
         """Run WatchDog system."""
         raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        """Get runtime statistics of tasks."""
+        return {
+            t.__class__.__name__: t.get_stats() for t in self.tasks
+        }
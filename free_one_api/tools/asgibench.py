@@ -0,0 +1,170 @@
+"""Benchmark of the ASGI fast path against Quart.
+
+Drives the real router, `ForwardAPIGroup` and `ForwardManager` in process
+through ASGI, without sockets, against simulated upstreams which answer
+instantly, so the time measured is spent in the proxy:
+
+    python -m free_one_api.tools.asgibench --requests 2000 --chunks 200
+
+Reports requests per second of non-streamed completions and time per
+streamed chunk, for Quart and for the fast path.
+"""
+import sys
+import json
+import time
+import typing
+import asyncio
+import argparse
+
+from ..entities import channel, apikey, request, response
+from ..impls.channel import mgr as chanmgr
+from ..impls.channel import eval as evl
+from ..impls.key import mgr as keymgr
+from ..impls.conversation import mgr as conversationmgr
+from ..impls.forward import mgr as forwardmgr
+from ..impls.router import mgr as routermgr
+from ..impls.router import forward as forwardgroup
+from . import routesim
+
+
+class InstantAdapter(routesim.SimulatedAdapter):
+    """Upstream yielding `chunks` tokens without waiting."""
+
+    async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:
+        for i in range(self.config["chunks"]):
+            yield response.Response(
+                id=0,
+                finish_reason=response.FinishReason.NULL,
+                normal_message=" token",
+                function_call=None,
+            )
+        yield response.Response(
+            id=0,
+            finish_reason=response.FinishReason.STOP,
+            normal_message="",
+            function_call=None,
+        )
+
+
+async def make_router(chunks: int) -> routermgr.RouterManager:
+    eval = evl.ChannelEvaluation()
+    adapter = InstantAdapter({"models": ["gpt-3.5-turbo"], "chunks": chunks}, eval)
+    db = routesim.MemoryDB([channel.Channel(1, "instant", adapter, {}, True, 0, eval)])
+    db.keys = [apikey.FreeOneAPIKey(1, "bench", 0, "sk-bench")]
+
+    chans = chanmgr.ChannelManager(db)
+    chans.snapshot.enabled = False
+    await chans.load_channels()
+    keys = keymgr.APIKeyManager(db)
+    await keys.list_keys()
+    convs = conversationmgr.ConversationManager(db)
+    fwd = forwardmgr.ForwardManager(chans, keys, convs)
+
+    group = forwardgroup.ForwardAPIGroup(db, chans, keys, fwd, convs)
+    return routermgr.RouterManager(group.get_routers(), {"port": 0, "fast_path": True}, group)
+
+
+async def call(app, body: bytes) -> int:
+    """Send a completion request to ASGI app, returns amount of body messages received."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"authorization", b"Bearer sk-bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 3000),
+        "extensions": {},
+    }
+    sent = False
+    done = asyncio.Event()
+    messages = 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict):
+        nonlocal messages
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"status {message['status']}")
+        if message["type"] == "http.response.body":
+            messages += 1
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return messages
+
+
+async def measure(app, body: bytes, amount: int) -> float:
+    """Seconds per request, sequentially after a warm up."""
+    for _ in range(min(50, amount)):
+        await call(app, body)
+    before = time.perf_counter()
+    for _ in range(amount):
+        await call(app, body)
+    return (time.perf_counter() - before) / amount
+
+
+async def run(args: argparse.Namespace) -> dict:
+    completion = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hi"}]}
+    plain = json.dumps(completion).encode()
+    streamed = json.dumps({**completion, "stream": True}).encode()
+
+    report = {}
+    for name in ("quart", "fast_path"):
+        small = await make_router(1)
+        large = await make_router(args.chunks)
+        small_app = small._app if name == "quart" else small._fast
+        large_app = large._app if name == "quart" else large._fast
+
+        seconds = await measure(small_app, plain, args.requests)
+        one_chunk = await measure(small_app, streamed, args.requests)
+        many_chunks = await measure(large_app, streamed, max(1, args.requests // 10))
+        report[name] = {
+            "requests_per_second": 1 / seconds,
+            "stream_requests_per_second": 1 / one_chunk,
+            "seconds_per_chunk": (many_chunks - one_chunk) / (args.chunks - 1),
+        }
+    return report
+
+
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ASGI fast path against Quart.")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per measurement")
+    parser.add_argument("--chunks", type=int, default=200, help="chunks of the long streamed completion")
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'server':<12}{'req/s':>10}{'stream req/s':>14}{'per chunk':>12}")
+    for name, result in report.items():
+        print(
+            f"{name:<12}{result['requests_per_second']:>10.0f}{result['stream_requests_per_second']:>14.0f}"
+            f"{result['seconds_per_chunk'] * 1e6:>10.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
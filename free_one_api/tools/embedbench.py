@@ -0,0 +1,145 @@
+"""Benchmark of embedding micro-batching.
+
+Sends Poisson arrivals of embedding requests through the real
+`EmbeddingBatcher` and `ChannelManager` to simulated upstreams, and
+compares upstream calls per second with client requests per second for
+several batching windows:
+
+    python -m free_one_api.tools.embedbench --rate 2000 --duration 5 --waits off,0,0.002,0.005,0.01
+
+A simulated upstream call takes `--latency` seconds plus `--per-input`
+seconds per input, at most `--concurrency` calls run at once on a channel.
+`off` disables batching, every request is an upstream call.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import numpy as np
+
+from ..entities import channel
+from ..impls.channel import mgr as chanmgr
+from ..impls.channel import eval as evl
+from ..impls.forward import batcher
+from . import routesim
+
+
+class SimulatedEmbeddingAdapter(routesim.SimulatedAdapter):
+    """Embedding upstream answering after a delay, with limited concurrency."""
+
+    def __init__(self, config: dict, eval):
+        super().__init__(config, eval)
+        self.slots = asyncio.Semaphore(config["concurrency"])
+
+    def supported_models(self) -> list[str]:
+        return []
+
+    def embedding_supported(self) -> bool:
+        return True
+
+    def embedding_models(self) -> list[str]:
+        return self.config["models"]
+
+    async def embed(self, model: str, inputs: list, options: dict) -> tuple[list, int, None]:
+        async with self.slots:
+            await asyncio.sleep(self.config["latency"] + self.config["per_input"] * len(inputs))
+        return [[float(len(item))] for item in inputs], sum(len(item.split()) for item in inputs), None
+
+
+async def run(args: argparse.Namespace, wait: str) -> dict:
+    channels = []
+    for i in range(args.channels):
+        eval = evl.ChannelEvaluation()
+        adapter = SimulatedEmbeddingAdapter({
+            "models": ["text-embedding-3-small"],
+            "latency": args.latency,
+            "per_input": args.per_input,
+            "concurrency": args.concurrency,
+        }, eval)
+        channels.append(channel.Channel(i + 1, f"sim-{i + 1}", adapter, {}, True, 0, eval))
+
+    mgr = chanmgr.ChannelManager(routesim.MemoryDB(channels))
+    mgr.snapshot.enabled = False
+    await mgr.load_channels()
+
+    emb = batcher.EmbeddingBatcher(mgr)
+    emb.enabled = wait != "off"
+    emb.max_wait = 0.0 if wait == "off" else float(wait)
+    emb.max_batch_size = args.max_batch_size
+
+    rng = random.Random(args.seed)
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        inputs = [f"document {rng.randrange(10 ** 6)} about things" for _ in range(args.inputs)]
+        before = time.perf_counter()
+        try:
+            await emb.embed("text-embedding-3-small", inputs, {})
+            latencies.append(time.perf_counter() - before)
+        except Exception:
+            errors += 1
+
+    tasks = []
+    start = time.perf_counter()
+    at = 0.0
+    while at < args.duration:
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(client()))
+        at += rng.expovariate(args.rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    stats = emb.get_stats()
+    values = np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        "client_rps": stats["requests"] / elapsed,
+        "upstream_cps": stats["upstream_calls"] / elapsed,
+        "requests_per_call": stats["requests"] / max(1, stats["upstream_calls"]),
+        "latency_p50": float(np.percentile(values, 50)),
+        "latency_p99": float(np.percentile(values, 99)),
+        "errors": errors,
+        "batcher": stats,
+    }
+
+
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description="Benchmark embedding micro-batching against simulated upstreams.")
+    parser.add_argument("--rate", type=float, default=1000.0, help="client requests per second")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of arrivals")
+    parser.add_argument("--inputs", type=int, default=1, help="inputs per client request")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upstream call")
+    parser.add_argument("--per-input", type=float, default=0.0002, help="seconds per input of an upstream call")
+    parser.add_argument("--concurrency", type=int, default=16, help="upstream calls in flight per channel")
+    parser.add_argument("--waits", default="off,0,0.002,0.005,0.01", help="comma separated max_wait settings")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for wait in args.waits.split(","):
+        report[wait] = asyncio.run(run(args, wait))
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'max_wait':<10}{'client rps':>12}{'upstream cps':>14}{'req/call':>10}{'p50':>9}{'p99':>9}{'errors':>8}")
+    for wait, result in report.items():
+        print(
+            f"{wait:<10}{result['client_rps']:>12.1f}{result['upstream_cps']:>14.1f}{result['requests_per_call']:>10.1f}"
+            f"{result['latency_p50'] * 1000:>7.1f}ms{result['latency_p99'] * 1000:>7.1f}ms{result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""Fault-injecting mock upstream.
+
+Serves the wire formats of the bundled adapters, so the proxy can be run
+against misbehaving upstreams without a live service:
+
+    /v1/chat/completions, /v1/models       OpenAI SSE (GPTAdapter, url ending with /v1/chat/completions)
+    /v1/embeddings                         OpenAI embeddings
+    /api/openai/v1/chat/completions        NextChat
+    /backend-api/v2/conversation           gpt4free NDJSON
+    /api/chat-process                      ChatGPT-Web NDJSON
+
+    python -m free_one_api.tools.mockupstream --port 3100 --script faults.json
+
+Script file is a JSON object of `steps` and optional `loop` (default false):
+
+    {"loop": true, "steps": [
+        {"fault": "ok", "count": 50},
+        {"fault": "error", "status": 503, "duration": 10},
+        {"fault": "rate_limit", "retry_after": 5, "count": 3},
+        {"fault": "drip", "interval": 0.5, "count": 5},
+        {"fault": "disconnect", "after": 3, "count": 5},
+        {"fault": "malformed", "after": 2, "count": 2},
+        {"fault": "latency", "delay": 8, "count": 5}
+    ]}
+
+Every request takes the current step, a step ends after `count` requests
+or `duration` seconds, whichever comes first. After the last step
+requests are served normally, unless the script loops. Any step may set
+`delay` (seconds before response headers), `interval` (seconds between
+tokens), `tokens` (completion length, default 20), `embed_delay` (seconds
+per embeddings call, default 0.05) and `embed_input_delay` (seconds per
+embedded input, default 0.001).
+
+Faults:
+    ok          normal completion.
+    latency     normal completion after `delay` seconds, default 5.
+    drip        tokens every `interval` seconds, default 1.
+    disconnect  connection is dropped after `after` tokens.
+    rate_limit  429 with Retry-After `retry_after` seconds and x-ratelimit headers.
+    error       `status` (default 500) with an OpenAI error body.
+    malformed   undecodable chunk after `after` tokens.
+
+`GET /_mock/stats` reports served faults and recovery times: seconds
+between a faulty stretch ending and the next request reaching this
+upstream, i.e. how long the proxy kept avoiding a recovered upstream.
+Use `duration` for faulty steps to measure it, a `count` step only ends
+when a request arrives.
+`POST /_mock/script` replaces the script at runtime.
+"""
+import json
+import time
+import hashlib
+import uuid
+import asyncio
+import argparse
+import collections
+
+import quart
+
+
+FAULTS = ("ok", "latency", "drip", "disconnect", "rate_limit", "error", "malformed")
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+class MockDisconnect(Exception):
+    """Raised inside a streaming body to drop the connection."""
+
+
+class FaultScript:
+    """Sequence of fault steps consumed by incoming requests."""
+
+    def __init__(self, steps: list[dict], loop: bool=False):
+        for step in steps:
+            if step.get("fault", "ok") not in FAULTS:
+                raise ValueError(f"Unknown fault: {step.get('fault')}")
+        self.steps = steps
+        self.loop = loop
+
+        self.index = 0
+        self.served = 0
+        """Requests served by current step."""
+
+        self.started_at = time.time()
+        """When current step became current."""
+
+        self.healthy_since = None
+        """When requests started to be served normally after a faulty step, None if not waiting."""
+
+        self.recoveries: list[float] = []
+
+        self.counts = collections.Counter()
+        """Fault to amount of requests served with it."""
+
+        self.log = collections.deque(maxlen=1000)
+        """Recent (time, path, fault)."""
+
+    def _ended_at(self, step: dict, now: float) -> float:
+        """When step ended, None if it has not."""
+        if "duration" in step and now - self.started_at >= step["duration"]:
+            return self.started_at + step["duration"]
+        if "count" in step and self.served >= step["count"]:
+            return now
+        return None
+
+    def _advance(self, ended_at: float):
+        was_faulty = self.current().get("fault", "ok") != "ok"
+        self.index += 1
+        if self.index >= len(self.steps) and self.loop and self.steps:
+            self.index = 0
+        self.served = 0
+        self.started_at = ended_at
+
+        if was_faulty and self.current().get("fault", "ok") == "ok":
+            self.healthy_since = ended_at
+
+    def current(self) -> dict:
+        if self.index < len(self.steps):
+            return self.steps[self.index]
+        return {"fault": "ok"}
+
+    def next(self, path: str) -> dict:
+        """Step for an incoming request."""
+        now = time.time()
+        # bounded, a script of zero-length steps must not spin forever
+        for _ in range(len(self.steps) + 1):
+            if self.index >= len(self.steps):
+                break
+            ended_at = self._ended_at(self.current(), now)
+            if ended_at is None:
+                break
+            self._advance(ended_at)
+
+        step = self.current()
+        fault = step.get("fault", "ok")
+        self.served += 1
+        self.counts[fault] += 1
+        self.log.append((now, path, fault))
+
+        if fault == "ok" and self.healthy_since is not None:
+            self.recoveries.append(now - self.healthy_since)
+            self.healthy_since = None
+
+        return step
+
+    def get_stats(self) -> dict:
+        return {
+            "step": self.index,
+            "current": self.current(),
+            "counts": dict(self.counts),
+            "recoveries": self.recoveries,
+            "recent": [
+                {"time": t, "path": path, "fault": fault} for t, path, fault in list(self.log)[-50:]
+            ],
+        }
+
+
+class MockUpstream:
+    """Quart app serving all supported wire formats with scripted faults."""
+
+    def __init__(self, script: FaultScript):
+        self.script = script
+        self.app = quart.Quart(__name__)
+
+        self.embedding_calls = 0
+        self.embedded_inputs = 0
+
+        self.app.route("/v1/chat/completions", methods=["POST"])(self.openai)
+        self.app.route("/api/openai/v1/chat/completions", methods=["POST"])(self.openai)
+        self.app.route("/v1/models", methods=["GET"])(self.models)
+        self.app.route("/v1/embeddings", methods=["POST"])(self.embeddings)
+        self.app.route("/backend-api/v2/conversation", methods=["POST"])(self.gpt4free)
+        self.app.route("/api/chat-process", methods=["POST"])(self.chatgpt_web)
+        self.app.route("/_mock/stats", methods=["GET"])(self.stats)
+        self.app.route("/_mock/script", methods=["POST"])(self.replace_script)
+
+    async def begin(self) -> tuple[dict, dict, list[str]]:
+        """Take a step for current request, apply pre-response faults.
+
+        Returns:
+            dict: step.
+            dict: request body.
+            list[str]: tokens to send.
+        """
+        body = await quart.request.get_json(force=True, silent=True) or {}
+        step = self.script.next(quart.request.path)
+        fault = step.get("fault", "ok")
+
+        delay = step.get("delay", 5 if fault == "latency" else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        amount = step.get("tokens", 20)
+        if body.get("max_tokens"):
+            amount = min(amount, body["max_tokens"])
+        tokens = [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(amount)]
+        return step, body, tokens
+
+    def failure(self, step: dict):
+        """Error response of a failing step, None if step does not fail before body."""
+        fault = step.get("fault", "ok")
+        if fault == "rate_limit":
+            retry_after = step.get("retry_after", 5)
+            return quart.jsonify({
+                "error": {"message": "Rate limit reached", "type": "requests", "param": None, "code": "rate_limit_exceeded"}
+            }), 429, {
+                "Retry-After": str(retry_after),
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-limit-requests": "60",
+                "x-ratelimit-reset-requests": f"{retry_after}s",
+            }
+        if fault == "error":
+            status = step.get("status", 500)
+            return quart.jsonify({
+                "error": {"message": f"Mock upstream error {status}", "type": "server_error", "param": None, "code": None}
+            }), status
+        return None
+
+    async def drip(self, step: dict, tokens: list[str], render: callable, malformed: bytes):
+        """Yield rendered tokens, applying in-stream faults."""
+        fault = step.get("fault", "ok")
+        interval = step.get("interval", 1 if fault == "drip" else 0)
+        after = step.get("after", 3)
+
+        for i, token in enumerate(tokens):
+            if fault == "disconnect" and i == after:
+                raise MockDisconnect()
+            if fault == "malformed" and i == after:
+                yield malformed
+                return
+            if interval and i:
+                await asyncio.sleep(interval)
+            yield render(i, token)
+
+    async def openai(self):
+        step, body, tokens = await self.begin()
+        failure = self.failure(step)
+        if failure is not None:
+            return failure
+
+        resp_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "gpt-3.5-turbo")
+        finish_reason = "length" if body.get("max_tokens") and len(tokens) >= body["max_tokens"] else "stop"
+
+        def chunk(delta: dict, finish: str=None) -> bytes:
+            data = {
+                "id": resp_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return b"data: " + json.dumps(data, separators=(",", ":")).encode() + b"\n\n"
+
+        if not body.get("stream", False):
+            text = b"".join([part async for part in self.drip(step, tokens, lambda i, t: t.encode(), b'{"choices": [')])
+            if step.get("fault") == "malformed":
+                return quart.Response(text, content_type="application/json")
+            return quart.jsonify({
+                "id": resp_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text.decode()}, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+
+        async def generate():
+            yield chunk({"role": "assistant", "content": ""})
+            async for part in self.drip(step, tokens, lambda i, t: chunk({"content": t}), b'data: {"id": "' + resp_id.encode() + b'", "choices": [{\n\n'):
+                yield part
+            if step.get("fault") != "malformed":
+                yield chunk({}, finish_reason)
+                yield b"data: [DONE]\n\n"
+
+        return quart.Response(generate(), content_type="text/event-stream")
+
+    async def models(self):
+        step = self.script.next(quart.request.path)
+        failure = self.failure(step)
+        if failure is not None:
+            return failure
+        return quart.jsonify({
+            "object": "list",
+            "data": [{"id": "gpt-3.5-turbo", "object": "model", "owned_by": "mock"}],
+        })
+
+    async def embeddings(self):
+        step, body, _ = await self.begin()
+        failure = self.failure(step)
+        if failure is not None:
+            return failure
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        await asyncio.sleep(step.get("embed_delay", 0.05) + step.get("embed_input_delay", 0.001) * len(inputs))
+
+        dimensions = body.get("dimensions") or 8
+        data = []
+        for i, item in enumerate(inputs):
+            digest = hashlib.sha256(json.dumps(item).encode()).digest()
+            data.append({
+                "object": "embedding",
+                "index": i,
+                "embedding": [digest[j % len(digest)] / 255 for j in range(dimensions)],
+            })
+        self.embedding_calls += 1
+        self.embedded_inputs += len(inputs)
+
+        prompt_tokens = sum(len(item.split()) if isinstance(item, str) else len(item) for item in inputs)
+        return quart.jsonify({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    async def gpt4free(self):
+        step, body, tokens = await self.begin()
+        failure = self.failure(step)
+        if failure is not None:
+            return failure
+
+        def line(i: int, token: str) -> bytes:
+            return json.dumps({"type": "content", "content": token}).encode() + b"\n"
+
+        async def generate():
+            yield json.dumps({"type": "provider", "provider": {"name": "Mock", "model": body.get("model")}}).encode() + b"\n"
+            async for part in self.drip(step, tokens, line, b'{"type": "content", "content": "brok\n'):
+                yield part
+            if step.get("fault") != "malformed":
+                yield json.dumps({"type": "finish", "finish": {"reason": "stop"}}).encode() + b"\n"
+
+        return quart.Response(generate(), content_type="text/event-stream")
+
+    async def chatgpt_web(self):
+        step, body, tokens = await self.begin()
+        failure = self.failure(step)
+        if failure is not None:
+            return failure
+
+        resp_id = f"chatcmpl-{uuid.uuid4().hex}"
+        conversation_id = str(uuid.uuid4())
+        model = body.get("model", "gpt-3.5-turbo")
+        text = []
+
+        def line(i: int, token: str) -> bytes:
+            text.append(token)
+            data = {
+                "role": "assistant",
+                "id": resp_id,
+                "parentMessageId": str(uuid.uuid4()),
+                "conversationId": conversation_id,
+                "text": "".join(text),
+                "detail": {
+                    "id": resp_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                },
+            }
+            # chatgpt-web separates objects by newline, no trailing newline
+            return (b"\n" if i else b"") + json.dumps(data, separators=(",", ":")).encode()
+
+        async def generate():
+            async for part in self.drip(step, tokens, line, b'\n{"role":"assistant","detail":{"choices":['):
+                yield part
+
+        return quart.Response(generate(), content_type="application/octet-stream")
+
+    async def stats(self):
+        return quart.jsonify({
+            **self.script.get_stats(),
+            "embedding_calls": self.embedding_calls,
+            "embedded_inputs": self.embedded_inputs,
+        })
+
+    async def replace_script(self):
+        data = await quart.request.get_json(force=True)
+        try:
+            self.script = FaultScript(data.get("steps", []), data.get("loop", False))
+        except ValueError as e:
+            return quart.jsonify({"code": 1, "message": str(e)}), 400
+        return quart.jsonify({"code": 0, "message": "ok"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fault-injecting mock upstream.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--script", help="fault script JSON file, serves normally if not set")
+    args = parser.parse_args()
+
+    steps, loop = [], False
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        steps, loop = data.get("steps", []), data.get("loop", False)
+
+    mock = MockUpstream(FaultScript(steps, loop))
+    asyncio.run(mock.app.run_task(host=args.host, port=args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark of raw passthrough against the parse and re-encode path.
+
+Runs the mock upstream (`tools.mockupstream`) in a subprocess and sends
+streamed completions to it three ways: directly, through the proxy with
+a GPT channel re-encoding every chunk, and through the proxy with the
+same channel in passthrough mode:
+
+    python -m free_one_api.tools.passbench --requests 300 --tokens 200
+
+The proxy runs in this process and is driven through ASGI, like
+`tools.asgibench`. Reported are medians of latency of a whole stream
+and CPU time of this process per request, and what the proxy adds to
+the direct call. The direct call spends the same CPU on the upstream
+HTTP client as the proxy does, so the difference is the proxy's own work.
+"""
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+import numpy as np
+
+from ..entities import channel, apikey
+from ..impls.adapter import gpt
+from ..impls.channel import mgr as chanmgr
+from ..impls.channel import eval as evl
+from ..impls.key import mgr as keymgr
+from ..impls.conversation import mgr as conversationmgr
+from ..impls.forward import mgr as forwardmgr
+from ..impls.router import mgr as routermgr
+from ..impls.router import forward as forwardgroup
+from . import routesim, asgibench
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_upstream(port: int, tokens: int) -> subprocess.Popen:
+    """Start mock upstream answering every request with `tokens` tokens."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "free_one_api.tools.mockupstream", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.post(f"http://127.0.0.1:{port}/_mock/script", json={
+                    "steps": [{"fault": "ok", "tokens": tokens, "count": 10 ** 9}],
+                })
+                return proc
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock upstream did not start")
+
+
+async def make_router(url: str, passthrough: bool) -> routermgr.RouterManager:
+    eval = evl.ChannelEvaluation()
+    adapter = gpt.GPTAdapter({"url": url, "key": "sk-upstream", "passthrough": passthrough}, eval)
+    db = routesim.MemoryDB([channel.Channel(1, "mock", adapter, {}, True, 0, eval)])
+    db.keys = [apikey.FreeOneAPIKey(1, "bench", 0, "sk-bench")]
+
+    chans = chanmgr.ChannelManager(db)
+    chans.snapshot.enabled = False
+    await chans.load_channels()
+    keys = keymgr.APIKeyManager(db)
+    await keys.list_keys()
+    convs = conversationmgr.ConversationManager(db)
+    fwd = forwardmgr.ForwardManager(chans, keys, convs)
+    fwd.streams.enabled = False
+
+    group = forwardgroup.ForwardAPIGroup(db, chans, keys, fwd, convs)
+    return routermgr.RouterManager(group.get_routers(), {"port": 0}, group)
+
+
+async def direct(url: str, body: bytes) -> int:
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream("POST", url, content=body, headers={"Content-Type": "application/json"}) as resp:
+            return len([chunk async for chunk in resp.aiter_bytes()])
+
+
+async def sample(call) -> tuple[float, float]:
+    """(seconds, CPU seconds) of one request."""
+    before, cpu_before = time.perf_counter(), time.process_time()
+    await call()
+    return time.perf_counter() - before, time.process_time() - cpu_before
+
+
+async def run(args: argparse.Namespace) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+    body = json.dumps({
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "user", "content": "Hi"}],
+        "stream": True,
+    }).encode()
+
+    upstream = await start_upstream(port, args.tokens)
+    try:
+        reencode = await make_router(url, False)
+        passthrough = await make_router(url, True)
+        calls = {
+            "direct": lambda: direct(url, body),
+            "reencode": lambda: asgibench.call(reencode._app, body),
+            "passthrough": lambda: asgibench.call(passthrough._app, body),
+        }
+
+        for call in calls.values():
+            for _ in range(10):
+                await call()
+
+        # paths take turns, so that load of the machine affects all alike
+        samples = {name: [] for name in calls}
+        for _ in range(args.requests):
+            for name, call in calls.items():
+                samples[name].append(await sample(call))
+    finally:
+        upstream.kill()
+        upstream.wait()
+
+    report = {
+        name: {
+            "latency": float(np.median([latency for latency, _ in values])),
+            "cpu": float(np.median([cpu for _, cpu in values])),
+        }
+        for name, values in samples.items()
+    }
+    for result in report.values():
+        result["added_latency"] = result["latency"] - report["direct"]["latency"]
+        result["added_cpu"] = result["cpu"] - report["direct"]["cpu"]
+    return report
+
+
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description="Benchmark raw passthrough against the re-encoding path.")
+    parser.add_argument("--requests", type=int, default=300, help="streamed completions per path")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens of every completion")
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'path':<13}{'latency':>11}{'cpu':>11}{'added latency':>15}{'added cpu':>11}")
+    for name, result in report.items():
+        print(
+            f"{name:<13}{result['latency'] * 1000:>9.2f}ms{result['cpu'] * 1000:>9.2f}ms"
+            f"{result['added_latency'] * 1000:>13.2f}ms{result['added_cpu'] * 1000:>9.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
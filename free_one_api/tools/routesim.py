@@ -0,0 +1,403 @@
+"""Offline routing simulator.
+
+Replays a request trace against simulated channels with the real
+`ChannelManager`, statistics and circuit breakers, on a virtual clock.
+Compares selection strategies deterministically in seconds:
+
+    python -m free_one_api.tools.routesim --channels channels.json --trace trace.jsonl
+
+Channels file is a JSON list of:
+
+    {"id": 1, "models": ["gpt-3.5-turbo"], "ttft_median": 0.8, "ttft_sigma": 0.5,
+     "tps": 40, "failure_rate": 0.02, "concurrency": 8}
+
+Trace file has a JSON object per line:
+
+    {"t": 0.12, "model": "gpt-3.5-turbo", "prompt_tokens": 900, "output_tokens": 300, "session": "optional"}
+
+Without files, a built-in channel set and a synthetic Poisson trace are used.
+"""
+import sys
+import json
+import time
+import heapq
+import asyncio
+import random
+import typing
+import argparse
+import collections
+
+import numpy as np
+
+from ..common import clock
+from ..models.database import db
+from ..models.adapter import llm
+from ..entities import channel, request, response, apikey, exceptions
+from ..models.channel import evaluation
+from ..impls.channel import mgr as chanmgr
+from ..impls.channel import eval as evl
+
+
+class VirtualClock:
+    """Clock which only moves when told to."""
+
+    def __init__(self, start: float=1_000_000.0):
+        self.time = start
+
+    def now(self) -> float:
+        return self.time
+
+
+class MemoryDB(db.DatabaseInterface):
+    """Database in memory."""
+
+    def __init__(self, channels: list[channel.Channel]):
+        self.channels = list(channels)
+        self.keys = []
+
+    async def list_channels(self) -> list[channel.Channel]:
+        return list(self.channels)
+
+    async def insert_channel(self, chan: channel.Channel) -> None:
+        chan.id = max([c.id for c in self.channels], default=0) + 1
+        self.channels.append(chan)
+
+    async def update_channel(self, chan: channel.Channel) -> None:
+        self.channels = [chan if c.id == chan.id else c for c in self.channels]
+
+    async def delete_channel(self, channel_id: int) -> None:
+        self.channels = [c for c in self.channels if c.id != channel_id]
+
+    async def list_keys(self) -> list[apikey.FreeOneAPIKey]:
+        return list(self.keys)
+
+    async def insert_key(self, key: apikey.FreeOneAPIKey) -> None:
+        key.id = len(self.keys) + 1
+        self.keys.append(key)
+
+    async def update_key(self, key: apikey.FreeOneAPIKey) -> None:
+        self.keys = [key if k.id == key.id else k for k in self.keys]
+
+    async def delete_key(self, key_id: int) -> None:
+        self.keys = [k for k in self.keys if k.id != key_id]
+
+    async def get_conversation(self, conversation_id: str):
+        return None
+
+    async def save_conversation(self, conv) -> None:
+        pass
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        pass
+
+    async def delete_conversations_before(self, updated_at: float) -> int:
+        return 0
+
+
+class SimulatedAdapter(llm.LLMLibAdapter):
+    """Adapter of a simulated upstream.
+
+    The simulator plays its latency and failures without querying it, a
+    real query streams `reply` of config a word at a time. Not registered,
+    so it never shows up in the admin page.
+    """
+
+    @classmethod
+    def name(cls) -> str:
+        return "Simulated"
+
+    @classmethod
+    def description(cls) -> str:
+        return "Simulated upstream for routesim."
+
+    def supported_models(self) -> list[str]:
+        return self.config["models"]
+
+    def function_call_supported(self) -> bool:
+        return False
+
+    def stream_mode_supported(self) -> bool:
+        return True
+
+    def multi_round_supported(self) -> bool:
+        return True
+
+    @classmethod
+    def config_comment(cls) -> str:
+        return ""
+
+    @classmethod
+    def supported_path(cls) -> str:
+        return "/v1/chat/completions"
+
+    async def test(self) -> typing.Union[bool, str]:
+        return True, ""
+
+    async def query(self, req: request.Request) -> typing.AsyncGenerator[response.Response, None]:
+        words = self.config.get("reply", "Hello from a simulated upstream.").split(" ")
+        for i, word in enumerate(words):
+            yield response.Response(
+                id=0,
+                finish_reason=response.FinishReason.NULL,
+                normal_message=word if i == 0 else " " + word,
+                function_call=None,
+            )
+        yield response.Response(
+            id=0,
+            finish_reason=response.FinishReason.STOP,
+            normal_message="",
+            function_call=None,
+        )
+
+
+def run_sync(coro):
+    """Run a coroutine which never really waits, e.g. `select_channel`."""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    coro.close()
+    raise RuntimeError("coroutine awaited something, it can't be simulated")
+
+
+DEFAULT_CHANNELS = [
+    {"id": 1, "models": ["gpt-3.5-turbo", "gpt-4"], "ttft_median": 0.6, "ttft_sigma": 0.4, "tps": 60, "failure_rate": 0.01, "concurrency": 8},
+    {"id": 2, "models": ["gpt-3.5-turbo"], "ttft_median": 1.5, "ttft_sigma": 0.6, "tps": 30, "failure_rate": 0.02, "concurrency": 16},
+    {"id": 3, "models": ["gpt-3.5-turbo", "gpt-4"], "ttft_median": 0.9, "ttft_sigma": 0.8, "tps": 45, "failure_rate": 0.15, "concurrency": 4},
+    {"id": 4, "models": ["gpt-4"], "ttft_median": 3.0, "ttft_sigma": 0.5, "tps": 20, "failure_rate": 0.0, "concurrency": 32},
+]
+
+
+def synthetic_trace(amount: int, rate: float, seed: int) -> list[dict]:
+    """Poisson arrivals, mostly gpt-3.5-turbo, some multi-turn sessions."""
+    rng = np.random.default_rng(seed)
+    t = 0.0
+    trace = []
+    for i in range(amount):
+        t += rng.exponential(1 / rate)
+        trace.append({
+            "t": t,
+            "model": "gpt-4" if rng.random() < 0.3 else "gpt-3.5-turbo",
+            "prompt_tokens": int(rng.lognormal(6.5, 1.0)),
+            "output_tokens": int(rng.lognormal(5.5, 0.8)),
+            "session": f"s{rng.integers(0, amount // 5 + 1)}",
+        })
+    return trace
+
+
+def select_score(mgr: chanmgr.ChannelManager, req: request.Request) -> channel.Channel:
+    return run_sync(mgr.select_channel("/v1/chat/completions", req))
+
+
+def select_random(mgr: chanmgr.ChannelManager, req: request.Request) -> channel.Channel:
+    candidates = [c for c in mgr.channels if c.enabled and req.model in c.adapter.supported_models()]
+    if not candidates:
+        raise exceptions.QueryHandlingError(404, "channel_not_found", "No suitable channel found.")
+    return random.choice(candidates)
+
+
+def select_least_loaded(mgr: chanmgr.ChannelManager, req: request.Request) -> channel.Channel:
+    candidates = [c for c in mgr.channels if c.enabled and req.model in c.adapter.supported_models()]
+    if not candidates:
+        raise exceptions.QueryHandlingError(404, "channel_not_found", "No suitable channel found.")
+    loads = [mgr.stats.in_flight[mgr.stats.slot(c.id)] for c in candidates]
+    least = min(loads)
+    return random.choice([c for c, load in zip(candidates, loads) if load == least])
+
+
+STRATEGIES: dict[str, tuple[callable, dict]] = {
+    "score": (select_score, {}),
+    "affinity": (select_score, {"affinity": True}),
+    "random": (select_random, {}),
+    "least_loaded": (select_least_loaded, {}),
+}
+"""Strategy name to (selector, options)."""
+
+
+class Simulation:
+    """One replay of a trace with one strategy."""
+
+    def __init__(self, channel_specs: list[dict], trace: list[dict], strategy: str, seed: int, retries: int):
+        self.specs = {spec["id"]: spec for spec in channel_specs}
+        self.trace = trace
+        self.selector, options = STRATEGIES[strategy]
+        self.seed = seed
+        self.retries = retries
+
+        self.clock = VirtualClock()
+        self.rng = np.random.default_rng(seed)
+        self.events = []
+        self.seq = 0
+
+        channels = []
+        for spec in channel_specs:
+            eval = evl.ChannelEvaluation()
+            adapter = SimulatedAdapter({"models": spec["models"]}, eval)
+            channels.append(channel.Channel(spec["id"], f"sim-{spec['id']}", adapter, {}, True, 0, eval))
+
+        self.mgr = chanmgr.ChannelManager(MemoryDB(channels))
+        self.mgr.snapshot.enabled = False
+        if options.get("affinity"):
+            self.mgr.affinity.enabled = True
+
+        self.active = {spec["id"]: 0 for spec in channel_specs}
+        self.served = {spec["id"]: 0 for spec in channel_specs}
+        self.failed = {spec["id"]: 0 for spec in channel_specs}
+        self.peak = {spec["id"]: 0 for spec in channel_specs}
+
+        self.ttfts = []
+        self.rejections = collections.Counter()
+        self.errors = 0
+        self.attempts = 0
+
+    def schedule(self, at: float, fn: callable, *args):
+        heapq.heappush(self.events, (at, self.seq, fn, args))
+        self.seq += 1
+
+    def arrive(self, item: dict, arrival: float, attempt: int):
+        req = request.Request(item["model"], [{"role": "user", "content": ""}], None, True, item.get("session"))
+        req.message_tokens = [item["prompt_tokens"]]
+        req.prompt_tokens = item["prompt_tokens"]
+
+        try:
+            chan = self.selector(self.mgr, req)
+        except exceptions.QueryHandlingError as e:
+            self.rejections[e.code] += 1
+            self.errors += 1
+            return
+
+        spec = self.specs[chan.id]
+        now = self.clock.now()
+        self.attempts += 1
+
+        record = evaluation.Record(start_time=now)
+        record.stream = True
+        record.model = req.model
+        record.sticky = req.sticky
+        self.mgr.add_record(chan, record)
+
+        if self.active[chan.id] >= spec.get("concurrency", 1 << 30):
+            # upstream refuses at once
+            self.schedule(now + 0.05, self.finish, item, arrival, attempt, chan, record, None, 0)
+            return
+
+        self.active[chan.id] += 1
+        self.peak[chan.id] = max(self.peak[chan.id], self.active[chan.id])
+
+        ttft = float(self.rng.lognormal(np.log(spec.get("ttft_median", 1.0)), spec.get("ttft_sigma", 0.5)))
+        if self.rng.random() < spec.get("failure_rate", 0.0):
+            self.schedule(now + ttft, self.finish, item, arrival, attempt, chan, record, None, 1)
+            return
+
+        duration = ttft + item["output_tokens"] / spec.get("tps", 30)
+        self.schedule(now + duration, self.finish, item, arrival, attempt, chan, record, ttft, 1)
+
+    def finish(self, item: dict, arrival: float, attempt: int, chan: channel.Channel, record: evaluation.Record, ttft: float, occupied: int):
+        self.active[chan.id] -= occupied
+
+        if ttft is not None:
+            record.latency = ttft
+            record.resp_message_length = item["output_tokens"] * 4
+            record.success = True
+            self.served[chan.id] += 1
+            # time to first token as seen by client, including failed attempts
+            self.ttfts.append(record.start_time + ttft - arrival)
+        else:
+            record.success = False
+            record.error = ValueError("simulated failure")
+            self.failed[chan.id] += 1
+
+        self.mgr.commit_record(chan, record)
+
+        if ttft is None:
+            if attempt < self.retries:
+                self.arrive(item, arrival, attempt + 1)
+            else:
+                self.errors += 1
+
+    def run(self) -> dict:
+        random.seed(self.seed)
+        clock.use(self.clock.now)
+        try:
+            # loading starts adapters concurrently, it needs an event loop
+            asyncio.run(self.mgr.load_channels())
+            start = self.clock.now()
+
+            for item in self.trace:
+                arrival = start + item["t"]
+                self.schedule(arrival, self.arrive, item, arrival, 0)
+
+            while self.events:
+                at, _, fn, args = heapq.heappop(self.events)
+                self.clock.time = at
+                fn(*args)
+        finally:
+            clock.use(time.time)
+
+        total = len(self.trace)
+        ttfts = np.array(self.ttfts) if self.ttfts else np.array([np.nan])
+        return {
+            "requests": total,
+            "ttft_p50": float(np.percentile(ttfts, 50)),
+            "ttft_p99": float(np.percentile(ttfts, 99)),
+            "error_rate": self.errors / total if total else 0.0,
+            "attempts": self.attempts,
+            "rejections": dict(self.rejections),
+            "channels": {
+                chan_id: {
+                    "served": self.served[chan_id],
+                    "share": self.served[chan_id] / max(1, sum(self.served.values())),
+                    "failed": self.failed[chan_id],
+                    "peak_in_flight": self.peak[chan_id],
+                }
+                for chan_id in self.specs
+            },
+        }
+
+
+def load_jsonl(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description="Replay a request trace against simulated channels.")
+    parser.add_argument("--channels", help="JSON file of simulated channels")
+    parser.add_argument("--trace", help="JSONL file of requests")
+    parser.add_argument("--synthetic", type=int, default=5000, help="amount of synthetic requests if no trace")
+    parser.add_argument("--rate", type=float, default=10.0, help="synthetic arrivals per second")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="comma separated strategies")
+    parser.add_argument("--retries", type=int, default=0, help="retries of failed attempts, like ForwardManager")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    if args.channels:
+        with open(args.channels) as f:
+            specs = json.load(f)
+    else:
+        specs = DEFAULT_CHANNELS
+
+    trace = load_jsonl(args.trace) if args.trace else synthetic_trace(args.synthetic, args.rate, args.seed)
+    trace.sort(key=lambda item: item["t"])
+
+    report = {}
+    for strategy in args.strategies.split(","):
+        report[strategy] = Simulation(specs, trace, strategy, args.seed, args.retries).run()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'strategy':<14}{'ttft p50':>10}{'ttft p99':>10}{'errors':>9}  load share by channel")
+    for strategy, result in report.items():
+        shares = " ".join(f"{chan_id}:{c['share']:.0%}" for chan_id, c in result["channels"].items())
+        print(f"{strategy:<14}{result['ttft_p50']:>9.2f}s{result['ttft_p99']:>9.2f}s{result['error_rate']:>9.2%}  {shares}")
+        if result["rejections"]:
+            rejected = ", ".join(f"{code}: {amount}" for code, amount in result["rejections"].items())
+            print(f"{'':<14}rejected before any attempt: {rejected}")
+
+
+if __name__ == "__main__":
+    main()
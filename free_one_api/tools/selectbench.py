@@ -0,0 +1,140 @@
+"""Benchmark of per-request channel selection.
+
+Times `ChannelManager.select_channel` end to end, hard filters included,
+against the selection it replaced: one `evaluate()` coroutine per
+candidate gathered with `asyncio.gather`, then a sort of score tuples:
+
+    python -m free_one_api.tools.selectbench --channels 100,1000,10000
+
+Every channel serves the requested model and holds `--records` finished
+records, so that `evaluate()` does the work it does in production.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from ..entities import channel, request, exceptions
+from ..models.channel import evaluation
+from ..impls.channel import mgr as chanmgr
+from ..impls.channel import eval as evl
+from . import routesim
+
+
+async def legacy_select(mgr: chanmgr.ChannelManager, path: str, req: request.Request) -> channel.Channel:
+    """Selection before the stats table, kept for comparison only."""
+    channel_copy = [chan for chan in mgr.channels if chan.enabled]
+    channel_copy = [chan for chan in channel_copy if chan.adapter.supported_path() == path]
+    channel_copy = [
+        chan for chan in channel_copy
+        if req.model in list(chan.model_mapping.keys()) + chan.adapter.supported_models()
+    ]
+
+    if len(channel_copy) == 0:
+        raise exceptions.QueryHandlingError(404, "channel_not_found", "No suitable channel found.")
+
+    evaluated_objects = await asyncio.gather(*[obj.eval.evaluate() for obj in channel_copy])
+    evaluated_objects = [int(v*100)/100 for v in evaluated_objects]
+
+    scores = sorted(zip(channel_copy, evaluated_objects), key=lambda x: x[1], reverse=True)
+
+    max_score = scores[0][1]
+    max_score_channels = []
+    for chan in scores:
+        if chan[1] == max_score:
+            max_score_channels.append(chan[0])
+        else:
+            break
+
+    return random.choice(max_score_channels)
+
+
+async def make_manager(amount: int, records: int) -> chanmgr.ChannelManager:
+    channels = []
+    now = time.time()
+    for i in range(amount):
+        eval = evl.ChannelEvaluation()
+        for j in range(records):
+            record = evaluation.Record()
+            record.start_time = now - random.random() * 600
+            record.latency = random.random()
+            record.end_time = record.start_time + record.latency + random.random() * 5
+            record.success = True
+            eval.records.append(record)
+        adapter = routesim.SimulatedAdapter({"models": ["gpt-3.5-turbo"]}, eval)
+        channels.append(channel.Channel(i + 1, f"sim-{i + 1}", adapter, {}, True, 0, eval))
+
+    mgr = chanmgr.ChannelManager(routesim.MemoryDB(channels))
+    mgr.snapshot.enabled = False
+    await mgr.load_channels()
+
+    for chan in channels:
+        slot = mgr.stats.slot(chan.id)
+        mgr.stats.ewma_latency[slot] = random.random()
+        mgr.stats.last_use[slot] -= random.random() * 60
+    return mgr
+
+
+def make_request() -> request.Request:
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+    # counted once by the forward manager in production
+    req.message_tokens, req.prompt_tokens = [5], 5
+    return req
+
+
+async def measure(select, rounds: int) -> float:
+    """Seconds per selection, after a warm up."""
+    for _ in range(min(10, rounds)):
+        await select()
+    before = time.perf_counter()
+    for _ in range(rounds):
+        await select()
+    return (time.perf_counter() - before) / rounds
+
+
+async def run(args: argparse.Namespace) -> dict:
+    report = {}
+    for amount in [int(v) for v in args.channels.split(",")]:
+        mgr = await make_manager(amount, args.records)
+        path = "/v1/chat/completions"
+        rounds = max(10, args.rounds * 100 // amount)
+
+        new = await measure(lambda: mgr.select_channel(path, make_request()), rounds)
+        old = await measure(lambda: legacy_select(mgr, path, make_request()), rounds)
+        report[amount] = {
+            "select_channel": new,
+            "legacy": old,
+            "speedup": old / new,
+        }
+    return report
+
+
+def main(argv: list[str]=None):
+    parser = argparse.ArgumentParser(description="Benchmark channel selection against the legacy gather and sort.")
+    parser.add_argument("--channels", default="100,1000,10000", help="comma separated channel amounts")
+    parser.add_argument("--records", type=int, default=5, help="finished records of every channel")
+    parser.add_argument("--rounds", type=int, default=1000, help="selections at 100 channels, scaled down for more")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'channels':>8}{'select_channel':>16}{'legacy':>12}{'speedup':>9}")
+    for amount, result in report.items():
+        print(
+            f"{amount:>8}{result['select_channel'] * 1e6:>14.0f}us{result['legacy'] * 1e6:>10.0f}us"
+            f"{result['speedup']:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
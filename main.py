@@ -11,6 +11,11 @@ from free_one_api.impls import app
 async def shutdown(signal, loop, app):
     """Cleanup coroutine that is called when the application is shutting down."""
     print(f"Received exit signal {signal.name}...")
+    try:
+        await app.conversation.flush()
+    except Exception as e:
+        print(f"Error flushing conversations: {str(e)}")
+
     tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
     
     for task in tasks:
@@ -20,6 +25,14 @@ async def shutdown(signal, loop, app):
     await asyncio.gather(*tasks, return_exceptions=True)
     loop.stop()
 
+async def reload(application):
+    """Apply changes of config file and channel table, on SIGHUP."""
+    try:
+        report = await application.reload()
+        print(f"Reloaded in {report['seconds']}s, {report['in_flight_affected']} in-flight requests on swapped channels: {report}")
+    except Exception as e:
+        print(f"Error reloading: {str(e)}")
+
 def handle_exception(loop, context):
     """Exception handler for the event loop."""
     msg = context.get("exception", context["message"])
@@ -34,12 +47,16 @@ async def main():
     application = await app.make_application("./data/config.yaml")
     
     # Set up signal handlers
-    signals = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
+    signals = (signal.SIGTERM, signal.SIGINT)
     for s in signals:
         loop.add_signal_handler(
             s, 
             lambda s=s: asyncio.create_task(shutdown(s, loop, application))
         )
+    loop.add_signal_handler(
+        signal.SIGHUP,
+        lambda: asyncio.create_task(reload(application))
+    )
     
     try:
         await application.run()
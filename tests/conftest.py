@@ -0,0 +1,86 @@
+"""Fixtures shared by the tests: simulated channels and managers on an in-memory database."""
+import time
+
+import pytest
+
+from free_one_api.common import clock, tokens
+from free_one_api.entities import channel, apikey
+from free_one_api.impls.channel import mgr as chanmgr
+from free_one_api.impls.channel import eval as evl
+from free_one_api.impls.conversation import mgr as conversationmgr
+from free_one_api.impls.forward import mgr as forwardmgr
+from free_one_api.impls.key import mgr as keymgr
+from free_one_api.impls.router import mgr as routermgr
+from free_one_api.impls.router import forward as forwardgroup
+from free_one_api.tools import routesim
+
+
+@pytest.fixture(autouse=True)
+def offline_tokens(monkeypatch):
+    # tiktoken downloads its encodings, tests count words
+    monkeypatch.setattr(tokens, "count_text", lambda text: len(text.split()))
+
+
+@pytest.fixture
+def now():
+    """Virtual clock of routing code, a list so that tests can move it."""
+    t = [1000.0]
+    clock.use(lambda: t[0])
+    yield t
+    clock.use(time.time)
+
+
+@pytest.fixture
+def make_channel():
+    """Factory of enabled channels, serving gpt-3.5-turbo unless `models` is given."""
+    def make(chan_id: int, adapter: type=routesim.SimulatedAdapter, name: str=None, **config) -> channel.Channel:
+        eval = evl.ChannelEvaluation()
+        config = {"models": ["gpt-3.5-turbo"], **config}
+        return channel.Channel(chan_id, name or f"sim-{chan_id}", adapter(config, eval), {}, True, 0, eval)
+    return make
+
+
+@pytest.fixture
+def make_manager():
+    """Factory of loaded channel managers which never write snapshots."""
+    async def make(channels: list[channel.Channel]) -> chanmgr.ChannelManager:
+        mgr = chanmgr.ChannelManager(routesim.MemoryDB(channels))
+        mgr.snapshot.enabled = False
+        await mgr.load_channels()
+        return mgr
+    return make
+
+
+@pytest.fixture
+def make_forward(make_manager):
+    """Factory of forward managers over `channels`, streams not resumable."""
+    async def make(channels: list[channel.Channel]) -> forwardmgr.ForwardManager:
+        chans = await make_manager(channels)
+        keys = keymgr.APIKeyManager(chans.dbmgr)
+        fwd = forwardmgr.ForwardManager(chans, keys, conversationmgr.ConversationManager(chans.dbmgr))
+        fwd.streams.enabled = False
+        return fwd
+    return make
+
+
+@pytest.fixture
+def make_router(make_forward):
+    """Factory of router managers of the proxy app over `channels`, accepting key `sk-test`."""
+    async def make(channels: list[channel.Channel], **config) -> routermgr.RouterManager:
+        fwd = await make_forward(channels)
+        db = fwd.chanmgr.dbmgr
+        db.keys = [apikey.FreeOneAPIKey(1, "test", 0, "sk-test")]
+        await fwd.keymgr.list_keys()
+
+        group = forwardgroup.ForwardAPIGroup(db, fwd.chanmgr, fwd.keymgr, fwd, fwd.convmgr)
+        return routermgr.RouterManager(group.get_routers(), {"port": 0, **config}, group)
+    return make
+
+
+@pytest.fixture
+def make_client(make_router):
+    """Factory of test clients of the proxy app over `channels`, accepting key `sk-test`."""
+    async def make(channels: list[channel.Channel]):
+        router = await make_router(channels)
+        return router._app.test_client()
+    return make
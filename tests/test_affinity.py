@@ -0,0 +1,109 @@
+import math
+import asyncio
+
+import numpy as np
+import pytest
+
+from free_one_api.entities import request
+from free_one_api.impls.channel import affinity
+
+
+def make_request(session: str) -> request.Request:
+    return request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, session_key=session)
+
+
+@pytest.fixture
+def manager(make_channel, make_manager):
+    mgr = asyncio.run(make_manager([make_channel(i + 1) for i in range(10)]))
+    mgr.affinity.enabled = True
+    return mgr
+
+
+def owners(mgr, keys: list[str]) -> dict[str, int]:
+    return {key: mgr.affinity.pick(make_request(key), mgr.channels, mgr.stats).id for key in keys}
+
+
+def test_ring_does_not_depend_on_order_of_adds():
+    one_by_one = affinity.AffinityRouter()
+    for channel_id in range(1, 51):
+        one_by_one.add(channel_id)
+    at_once = affinity.AffinityRouter()
+    at_once.add_many(list(range(50, 0, -1)))
+
+    assert np.array_equal(one_by_one.points, at_once.points)
+    assert np.array_equal(one_by_one.owners, at_once.owners)
+    assert np.all(at_once.points[1:] >= at_once.points[:-1])
+
+
+def test_adding_a_channel_only_moves_keys_onto_it(manager, make_channel):
+    keys = [f"conversation-{i}" for i in range(2000)]
+    before = owners(manager, keys)
+
+    added = make_channel(11)
+    manager.channels.append(added)
+    manager.stats.allocate(added.id)
+    manager.affinity.add(added.id)
+    after = owners(manager, keys)
+
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == added.id for key in moved)
+    # about 1/11 of keys, consistent hashing moves no others
+    assert 0 < len(moved) < len(keys) * 2 / 11
+
+    manager.channels.remove(added)
+    manager.affinity.remove(added.id)
+    assert owners(manager, keys) == before
+
+
+def test_removed_channel_is_never_picked(manager):
+    keys = [f"conversation-{i}" for i in range(500)]
+    before = owners(manager, keys)
+
+    removed = manager.channels.pop(0)
+    manager.affinity.remove(removed.id)
+    after = owners(manager, keys)
+
+    assert removed.id not in after.values()
+    assert all(after[key] == before[key] for key in keys if before[key] != removed.id)
+
+
+def test_hot_conversation_spills_within_load_bound(manager):
+    req = make_request("hot")
+    load_factor = manager.affinity.load_factor
+
+    for started in range(200):
+        chan = manager.affinity.pick(req, manager.channels, manager.stats)
+        assert chan is not None
+
+        in_flight = [int(manager.stats.in_flight[manager.stats.slot(c.id)]) for c in manager.channels]
+        bound = math.ceil(load_factor * (sum(in_flight) + 1) / len(manager.channels))
+        assert in_flight[manager.channels.index(chan)] < bound
+
+        manager.stats.request_started(manager.stats.slot(chan.id))
+
+    in_flight = [int(manager.stats.in_flight[manager.stats.slot(c.id)]) for c in manager.channels]
+    assert max(in_flight) <= math.ceil(load_factor * 200 / len(manager.channels))
+    assert manager.affinity.spills > 0
+
+
+def test_pick_does_no_ring_work_for_large_fleets():
+    router = affinity.AffinityRouter()
+    router.add_many(list(range(1, 10001)))
+
+    class Stats:
+        in_flight = np.zeros(10001)
+        capacity = np.full(10001, np.inf)
+
+        def slot(self, channel_id):
+            return channel_id
+
+    class Chan:
+        def __init__(self, channel_id):
+            self.id = channel_id
+
+    candidates = [Chan(channel_id) for channel_id in range(1, 11)]
+    points = router.points
+    # the ring is kept up to date by add and remove, pick only reads it
+    assert router.pick(make_request("a"), candidates, Stats()) is not None
+    assert router.points is points
+    assert len(points) == 10000 * router.virtual_nodes
@@ -0,0 +1,157 @@
+import asyncio
+
+import httpx
+import pytest
+
+from free_one_api.entities import exceptions
+from free_one_api.impls.forward import batcher
+from free_one_api.tools import routesim
+
+
+class StrictAdapter(routesim.SimulatedAdapter):
+    """Embedding upstream rejecting batches which hold a `bad` input, or mix kinds."""
+
+    def __init__(self, config: dict, eval):
+        super().__init__(config, eval)
+        self.calls = []
+
+    def supported_models(self) -> list[str]:
+        return []
+
+    def embedding_supported(self) -> bool:
+        return True
+
+    def embedding_models(self) -> list[str]:
+        return ["text-embedding-3-small"]
+
+    async def embed(self, model: str, inputs: list, options: dict):
+        self.calls.append(list(inputs))
+        await asyncio.sleep(0.001)
+        if "bad" in inputs or len({type(item) for item in inputs}) > 1:
+            request = httpx.Request("POST", "http://upstream/v1/embeddings")
+            resp = httpx.Response(400, request=request, json={
+                "error": {"message": "Invalid input", "type": "invalid_request_error", "param": "input", "code": None},
+            })
+            raise httpx.HTTPStatusError("400 Bad Request", request=request, response=resp)
+        return [[float(len(item))] for item in inputs], len(inputs), None
+
+
+@pytest.fixture
+def make_batcher(make_channel, make_manager):
+    async def make():
+        chan = make_channel(1, StrictAdapter, name="strict", models=[])
+        emb = batcher.EmbeddingBatcher(await make_manager([chan]))
+        emb.max_wait = 0.01
+        return emb, chan
+    return make
+
+
+def test_strings_and_token_arrays_are_not_batched_together(make_batcher):
+    async def main():
+        emb, chan = await make_batcher()
+        results = await asyncio.gather(
+            emb.embed("text-embedding-3-small", ["hello"], {}),
+            emb.embed("text-embedding-3-small", [[1, 2, 3]], {}),
+            emb.embed("text-embedding-3-small", ["world"], {}),
+        )
+        return emb, chan, results
+
+    emb, chan, results = asyncio.run(main())
+
+    assert [embeddings for embeddings, _, _ in results] == [[[5.0]], [[3.0]], [[5.0]]]
+    assert sorted(chan.adapter.calls, key=str) == [["hello", "world"], [[1, 2, 3]]]
+    assert emb.rejected_calls == 0
+
+
+def test_rejected_request_fails_alone_without_blaming_channel(make_batcher):
+    async def main():
+        emb, chan = await make_batcher()
+        results = await asyncio.gather(*(
+            emb.embed("text-embedding-3-small", [text], {})
+            for text in ["a", "bb", "bad", "ccc", "dddd"]
+        ), return_exceptions=True)
+        return emb, chan, results
+
+    emb, chan, results = asyncio.run(main())
+
+    error = results[2]
+    assert isinstance(error, exceptions.QueryHandlingError)
+    assert error.status_code == 400
+    assert error.message == "Invalid input"
+    assert error.param == "input"
+
+    for i, text in enumerate(["a", "bb", None, "ccc", "dddd"]):
+        if text is not None:
+            assert results[i][0] == [[float(len(text))]]
+
+    assert emb.failed_calls == 0
+    assert emb.rejected_calls >= 2
+    assert chan.breaker.consecutive == 0
+    assert chan.cooldown_until == 0
+
+
+def test_lone_rejected_request_is_not_retried(make_batcher):
+    async def main():
+        emb, chan = await make_batcher()
+        emb.enabled = False
+        with pytest.raises(exceptions.QueryHandlingError):
+            await emb.embed("text-embedding-3-small", ["bad"], {})
+        return chan
+
+    assert asyncio.run(main()).adapter.calls == [["bad"]]
+
+
+class ShortAdapter(StrictAdapter):
+    """Embedding upstream dropping the last embedding of every call."""
+
+    async def embed(self, model: str, inputs: list, options: dict):
+        embeddings, prompt_tokens, info = await super().embed(model, inputs, options)
+        return embeddings[:-1], prompt_tokens, info
+
+
+def test_missing_embeddings_fail_the_batch_instead_of_hanging(make_channel, make_manager):
+    async def main():
+        chan = make_channel(1, ShortAdapter, models=[])
+        emb = batcher.EmbeddingBatcher(await make_manager([chan]))
+        emb.max_wait = 0.01
+        return emb, await asyncio.wait_for(asyncio.gather(
+            emb.embed("text-embedding-3-small", ["a"], {}),
+            emb.embed("text-embedding-3-small", ["b"], {}),
+            return_exceptions=True,
+        ), 1)
+
+    emb, results = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert emb.failed_calls == emb.retries
+
+
+def test_unexpected_error_fails_waiters(make_batcher, monkeypatch):
+    async def main():
+        emb, chan = await make_batcher()
+
+        def broken(chan, record):
+            raise RuntimeError("broken bookkeeping")
+
+        monkeypatch.setattr(emb.chanmgr, "commit_record", broken)
+        return await asyncio.wait_for(asyncio.gather(
+            emb.embed("text-embedding-3-small", ["a"], {}),
+            emb.embed("text-embedding-3-small", ["b"], {}),
+            return_exceptions=True,
+        ), 1)
+
+    results = asyncio.run(main())
+
+    assert [str(result) for result in results] == ["broken bookkeeping"] * 2
+
+
+def test_no_retries_still_calls_upstream_once(make_batcher):
+    async def main():
+        emb, chan = await make_batcher()
+        emb.retries = 0
+        return await emb.embed("text-embedding-3-small", ["abc"], {}), chan
+
+    (embeddings, _, _), chan = asyncio.run(main())
+
+    assert embeddings == [[3.0]]
+    assert chan.adapter.calls == [["abc"]]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from free_one_api.entities import request, response
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.channel import breaker
+from free_one_api.tools import routesim
+
+
+def test_opens_on_consecutive_failures_and_closes_after_trials(now):
+    b = breaker.CircuitBreaker()
+    for _ in range(b.consecutive_failures):
+        assert b.allow()
+        b.on_start()
+        b.on_result(False)
+    assert b.state == breaker.BreakerState.OPEN
+    assert not b.allow()
+
+    now[0] += b.cooldown
+    assert b.allow()
+    assert b.state == breaker.BreakerState.HALF_OPEN
+
+    for _ in range(b.half_open_trials):
+        b.on_start()
+    # no more trials than half_open_trials at once
+    assert not b.allow()
+
+    for _ in range(b.half_open_trials):
+        b.on_result(True)
+    assert b.state == breaker.BreakerState.CLOSED
+
+
+def test_failed_trial_reopens(now):
+    b = breaker.CircuitBreaker()
+    for _ in range(b.consecutive_failures):
+        b.on_result(False)
+    now[0] += b.cooldown
+    assert b.allow()
+    b.on_start()
+    b.on_result(False)
+
+    assert b.state == breaker.BreakerState.OPEN
+    assert b.opened_at == now[0]
+
+
+def test_cancelled_trial_frees_its_slot_without_outcome(now):
+    b = breaker.CircuitBreaker()
+    for _ in range(b.consecutive_failures):
+        b.on_result(False)
+    now[0] += b.cooldown
+    assert b.allow()
+    for _ in range(b.half_open_trials):
+        b.on_start()
+    assert not b.allow()
+
+    b.on_cancelled()
+    assert b.state == breaker.BreakerState.HALF_OPEN
+    assert b.allow()
+
+
+class EndlessAdapter(routesim.SimulatedAdapter):
+    """Streams until the client goes away."""
+
+    async def query(self, req: request.Request):
+        while True:
+            await asyncio.sleep(0.001)
+            yield response.Response("up", response.FinishReason.NULL, "token ")
+
+
+def make_request(stream: bool) -> request.Request:
+    return request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=stream)
+
+
+def test_client_disconnect_is_not_a_channel_failure(make_channel, make_forward):
+    chan = make_channel(1, EndlessAdapter)
+
+    async def main():
+        fwd = await make_forward([chan])
+        for _ in range(chan.breaker.consecutive_failures + 1):
+            resp = await fwd.query("/v1/chat/completions", make_request(stream=True), {})
+            async with resp.response as body:
+                async for data in body:
+                    break
+        return fwd.chanmgr
+
+    mgr = asyncio.run(main())
+
+    slot = mgr.stats.slot(chan.id)
+    assert chan.breaker.state == breaker.BreakerState.CLOSED
+    assert chan.breaker.consecutive == 0
+    assert mgr.stats.error_rate[slot] == 0
+    assert mgr.stats.samples[slot] == 0
+    assert mgr.stats.in_flight[slot] == 0
+
+
+def test_cancelled_non_stream_query_is_not_a_channel_failure(make_channel, make_forward):
+    chan = make_channel(1, EndlessAdapter)
+
+    async def main():
+        fwd = await make_forward([chan])
+        for _ in range(chan.breaker.consecutive_failures + 1):
+            task = asyncio.create_task(fwd.query("/v1/chat/completions", make_request(stream=False), {}))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return fwd.chanmgr
+
+    mgr = asyncio.run(main())
+
+    assert chan.breaker.consecutive == 0
+    assert mgr.stats.error_rate[mgr.stats.slot(chan.id)] == 0
+
+
+def test_failed_stream_counts_against_channel(make_channel, make_manager):
+    chan = make_channel(1)
+    mgr = asyncio.run(make_manager([chan]))
+
+    record = evaluation.Record()
+    mgr.add_record(chan, record)
+    mgr.commit_record(chan, record)
+
+    assert chan.breaker.consecutive == 1
+    assert mgr.stats.error_rate[mgr.stats.slot(chan.id)] > 0
@@ -0,0 +1,75 @@
+import json
+import asyncio
+
+import pytest
+
+from free_one_api.entities import request, exceptions
+from free_one_api.impls.adapter import gpt
+from free_one_api.tools import routesim
+
+
+class EmbeddingAdapter(routesim.SimulatedAdapter):
+    """Embedding upstream answering an embedding per input."""
+
+    def embedding_supported(self) -> bool:
+        return True
+
+    def embedding_models(self) -> list[str]:
+        return ["text-embedding-3-small"]
+
+    async def embed(self, model: str, inputs: list, options: dict):
+        return [[float(len(item))] for item in inputs], len(inputs), None
+
+
+def test_simulated_adapter_streams_its_reply(make_channel, make_forward):
+    async def main():
+        fwd = await make_forward([make_channel(1, reply="Hi there, friend")])
+        req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=True)
+        resp = await fwd.query("/v1/chat/completions", req, {})
+        return [data async for data in resp.response]
+
+    events = asyncio.run(main())
+
+    choices = [json.loads(event[len("data: "):])["choices"][0] for event in events if event.startswith("data: {")]
+    assert "".join(choice["delta"].get("content", "") for choice in choices) == "Hi there, friend"
+    assert events[-1] == "data: [DONE]\n\n"
+
+
+def test_raw_body_is_queried_on_adapters_without_passthrough(make_channel, make_forward):
+    async def main():
+        fwd = await make_forward([make_channel(1, reply="Not passed through")])
+        body = json.dumps({"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hi"}]}).encode()
+        req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=True, raw_body=body)
+        resp = await fwd.query("/v1/chat/completions", req, {})
+        return [data async for data in resp.response]
+
+    events = asyncio.run(main())
+
+    assert "Not" in events[0]
+    assert events[-1] == "data: [DONE]\n\n"
+
+
+def test_embedding_channel_needs_embedding_support(make_channel, make_manager):
+    # chat-only channel listed first, serving the same model name
+    chat = make_channel(1, models=["text-embedding-3-small"])
+    embedding = make_channel(2, EmbeddingAdapter, models=[])
+    mgr = asyncio.run(make_manager([chat, embedding]))
+
+    for _ in range(10):
+        assert asyncio.run(mgr.select_embedding_channel("text-embedding-3-small")) is embedding
+
+    mgr = asyncio.run(make_manager([make_channel(1)]))
+    with pytest.raises(exceptions.QueryHandlingError) as e:
+        asyncio.run(mgr.select_embedding_channel("text-embedding-3-small"))
+    assert e.value.status_code == 404
+
+
+def test_gpt_adapter_flags_follow_config():
+    adapter = gpt.GPTAdapter({"url": "http://upstream/v1/chat/completions", "key": "sk-up", "models": "gpt-3.5-turbo"}, None)
+    assert not adapter.passthrough_supported()
+    assert not adapter.embedding_supported()
+
+    adapter.config.update(passthrough=True, embedding_models="text-embedding-3-small")
+    assert adapter.passthrough_supported()
+    assert adapter.embedding_supported()
+    assert adapter.embedding_models() == ["text-embedding-3-small"]
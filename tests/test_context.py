@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from free_one_api.common import tokens
+from free_one_api.entities import request, exceptions
+
+
+@pytest.mark.parametrize("model, window", [
+    ("gpt-4", (8192, 8192)),
+    ("gpt-4-0613", (8192, 8192)),
+    ("GPT-4-0613", (8192, 8192)),
+    ("gpt-4-32k-0613", (32768, 32768)),
+    ("gpt-4-turbo-2024-04-09", (128000, 4096)),
+    ("gpt-4o-2024-08-06", (128000, 16384)),
+    ("gpt-4o-mini", (128000, 16384)),
+    ("gpt-3.5-turbo-1106", (16385, 4096)),
+    ("gpt-3.5-turbo-16k-0613", (16385, 4096)),
+    ("claude-3-opus-20240229", (200000, 4096)),
+    ("mixtral-8x7b:latest", (32768, 32768)),
+])
+def test_known_variants(model, window):
+    assert tokens.context_window(model) == window
+
+
+@pytest.mark.parametrize("model", [
+    "gpt-4.1-mini",
+    "gpt-4.5-preview",
+    "gpt-4omni",
+    "claude-3.5-sonnet",
+    "gpt-3.5",
+    "llama-3-70b",
+])
+def test_newer_models_of_a_family_are_unknown(model):
+    assert tokens.context_window(model) is None
+
+
+def make_request(model: str, words: int, max_tokens: int=None) -> request.Request:
+    return request.Request(model, [{"role": "user", "content": "word " * words}], None, max_tokens=max_tokens)
+
+
+def test_long_prompt_goes_to_channel_with_larger_window(make_channel, make_manager):
+    small = make_channel(1, models=["gpt-4"])
+    large = make_channel(2, models=["gpt-4"], context_windows={"gpt-4": 32768})
+    mgr = asyncio.run(make_manager([small, large]))
+
+    for _ in range(10):
+        chan = asyncio.run(mgr.select_channel("/v1/chat/completions", make_request("gpt-4", 10000)))
+        assert chan is large
+
+
+def test_prompt_fitting_nowhere_is_rejected(make_channel, make_manager):
+    mgr = asyncio.run(make_manager([make_channel(1, models=["gpt-4"])]))
+
+    with pytest.raises(exceptions.QueryHandlingError) as e:
+        asyncio.run(mgr.select_channel("/v1/chat/completions", make_request("gpt-4", 8000, max_tokens=500)))
+    assert e.value.status_code == 400
+    assert e.value.code == "context_length_exceeded"
+    assert "8192" in e.value.message
+
+    # the same prompt without max_tokens fits
+    asyncio.run(mgr.select_channel("/v1/chat/completions", make_request("gpt-4", 8000)))
+
+
+def test_unknown_variant_is_not_filtered(make_channel, make_manager):
+    chan = make_channel(1, models=["gpt-4.1-mini"])
+    mgr = asyncio.run(make_manager([chan]))
+
+    assert asyncio.run(mgr.select_channel("/v1/chat/completions", make_request("gpt-4.1-mini", 100000))) is chan
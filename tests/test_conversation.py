@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from free_one_api.entities import request
+from free_one_api.impls.conversation import mgr as conversationmgr
+from free_one_api.tools import routesim
+
+
+class ConversationDB(routesim.MemoryDB):
+    """Memory database keeping conversations and counting writes."""
+
+    def __init__(self):
+        super().__init__([])
+        self.conversations = {}
+        self.saves = 0
+
+    async def get_conversation(self, conversation_id: str):
+        return self.conversations.get(conversation_id)
+
+    async def save_conversation(self, conv) -> None:
+        await asyncio.sleep(0.001)
+        self.saves += 1
+        self.conversations[conv.id] = conv
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        self.conversations.pop(conversation_id, None)
+
+
+@pytest.fixture
+def convmgr(monkeypatch):
+    monkeypatch.setattr(conversationmgr.ConversationManager, "write_delay", 0.05)
+    return conversationmgr.ConversationManager(ConversationDB())
+
+
+async def turn(convmgr, conversation_id: str, text: str, reply: str):
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": text}], None)
+    conv = await convmgr.resume(conversation_id, 1, req, {}, 0.0)
+    await convmgr.commit(req, reply)
+    return conv, req
+
+
+def test_commit_does_not_wait_for_database(convmgr):
+    async def main():
+        conv, _ = await turn(convmgr, "new", "Hi", "Hello")
+        # written later, the next turn reads memory
+        assert convmgr.dbmgr.saves == 0
+        _, req = await turn(convmgr, conv.id, "How are you?", "Fine")
+        assert [m["content"] for m in req.messages] == ["Hi", "Hello", "How are you?"]
+
+        await asyncio.sleep(0.15)
+        return conv
+
+    conv = asyncio.run(main())
+
+    # both turns in one write
+    assert convmgr.dbmgr.saves == 1
+    assert convmgr.coalesced_writes == 1
+    stored = convmgr.dbmgr.conversations[conv.id]
+    assert [m["content"] for m in stored.messages] == ["Hi", "Hello", "How are you?", "Fine"]
+
+
+def test_evicted_conversation_is_read_from_pending_writes(convmgr, monkeypatch):
+    monkeypatch.setattr(conversationmgr.ConversationManager, "cache_size", 1)
+
+    async def main():
+        first, _ = await turn(convmgr, "new", "Hi", "Hello")
+        await turn(convmgr, "new", "Other", "Reply")
+        assert first.id not in convmgr.cache
+
+        _, req = await turn(convmgr, first.id, "Again", "Sure")
+        assert [m["content"] for m in req.messages] == ["Hi", "Hello", "Again"]
+        await convmgr.flush()
+
+    asyncio.run(main())
+
+
+def test_deleted_conversation_is_not_written_back(convmgr):
+    async def main():
+        conv, _ = await turn(convmgr, "new", "Hi", "Hello")
+        assert await convmgr.delete(conv.id, 1)
+        await asyncio.sleep(0.15)
+        return conv
+
+    conv = asyncio.run(main())
+
+    assert conv.id not in convmgr.dbmgr.conversations
+    assert convmgr.dbmgr.saves == 0
+
+
+def test_flush_writes_pending_turns(convmgr, monkeypatch):
+    monkeypatch.setattr(conversationmgr.ConversationManager, "write_delay", 60)
+
+    async def main():
+        conv, _ = await turn(convmgr, "new", "Hi", "Hello")
+        await convmgr.flush()
+        assert convmgr.get_stats()["pending_writes"] == 0
+        convmgr.writer.cancel()
+        return conv
+
+    conv = asyncio.run(main())
+
+    assert conv.id in convmgr.dbmgr.conversations
@@ -0,0 +1,226 @@
+"""Forwarding path against misbehaving upstreams, served by `tools.mockupstream`."""
+import json
+import time
+import socket
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from free_one_api.common import ratelimit
+from free_one_api.entities import channel, request, exceptions
+from free_one_api.impls.adapter import gpt
+from free_one_api.impls.channel import stats
+from free_one_api.tools import mockupstream, routesim
+
+FULL_REPLY = "".join((" " if i else "") + mockupstream.WORDS[i % len(mockupstream.WORDS)] for i in range(20))
+
+
+@pytest.fixture(autouse=True)
+def offline_prompt_tokens(monkeypatch):
+    # prompts are not counted by tiktoken in tests
+    monkeypatch.setattr(channel.Channel, "count_tokens", lambda self, model, messages: 5)
+
+
+@pytest.fixture(autouse=True)
+def faulty_first(monkeypatch):
+    # ties go to the first channel, the faulty upstream is always tried
+    monkeypatch.setattr(stats.random, "randrange", lambda stop: 0)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def upstreams(scripts: list[list[dict]]):
+    """Mock upstreams in this event loop, one per script of steps."""
+    stop = asyncio.Event()
+    mocks, servers, urls = [], [], []
+    for steps in scripts:
+        port = free_port()
+        mock = mockupstream.MockUpstream(mockupstream.FaultScript(steps))
+        servers.append(asyncio.create_task(mock.app.run_task(port=port, shutdown_trigger=stop.wait)))
+        mocks.append(mock)
+        urls.append(f"http://127.0.0.1:{port}")
+
+    async with httpx.AsyncClient() as client:
+        for url in urls:
+            for _ in range(200):
+                try:
+                    await client.get(f"{url}/_mock/stats")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.01)
+    try:
+        yield mocks, urls
+    finally:
+        stop.set()
+        await asyncio.gather(*servers)
+
+
+@pytest.fixture
+def make_proxy(make_channel, make_client):
+    async def make(urls: list[str]):
+        """Test client of the proxy app and a GPT channel per upstream."""
+        channels = [
+            make_channel(i + 1, gpt.GPTAdapter, models="gpt-3.5-turbo", url=f"{url}/v1/chat/completions", key="sk-upstream")
+            for i, url in enumerate(urls)
+        ]
+        return await make_client(channels), channels
+    return make
+
+
+async def complete(client, stream: bool) -> tuple[float, int, str]:
+    """(seconds, status, reply text) of one completion."""
+    before = time.perf_counter()
+    resp = await client.post(
+        "/v1/chat/completions",
+        json={"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hi"}], "stream": stream},
+        headers={"Authorization": "Bearer sk-test"},
+    )
+    body = (await resp.get_data()).decode()
+    seconds = time.perf_counter() - before
+
+    if not stream:
+        text = json.loads(body)["choices"][0]["message"]["content"] if resp.status_code == 200 else body
+        return seconds, resp.status_code, text
+
+    text = ""
+    for event in body.split("\n\n"):
+        if event.startswith("data: {"):
+            choice = json.loads(event[len("data: "):])["choices"][0]
+            text += choice["delta"].get("content") or ""
+            if choice["finish_reason"] == "error":
+                text += "<error>"
+    assert body.endswith("data: [DONE]\n\n")
+    return seconds, resp.status_code, text
+
+
+def median(values: list[float]) -> float:
+    return sorted(values)[len(values) // 2]
+
+
+def test_5xx_fails_over(make_proxy):
+    async def main():
+        async with upstreams([[{"fault": "error", "status": 503, "count": 10 ** 6}], []]) as (mocks, urls):
+            client, _ = await make_proxy(urls)
+            results = [await complete(client, stream=False) for _ in range(10)]
+            return results, mocks
+
+    results, (broken, healthy) = asyncio.run(main())
+
+    assert [status for _, status, _ in results] == [200] * 10
+    assert all(text == FULL_REPLY for _, _, text in results)
+    # the failing upstream is avoided after its failure
+    assert broken.script.counts["error"] == 1
+    assert healthy.script.counts["ok"] == 10
+    assert max(seconds for seconds, _, _ in results) < 1.0
+
+
+def test_429_cools_channel_down(make_proxy):
+    async def main():
+        async with upstreams([[{"fault": "rate_limit", "retry_after": 30, "count": 10 ** 6}], []]) as (mocks, urls):
+            client, channels = await make_proxy(urls)
+            results = [await complete(client, stream=True) for _ in range(10)]
+            return results, mocks, channels
+
+    results, (limited, healthy), channels = asyncio.run(main())
+
+    assert all(status == 200 and text == FULL_REPLY for _, status, text in results)
+    # Retry-After keeps the channel out of selection after the first 429
+    assert limited.script.counts["rate_limit"] == 1
+    assert channels[0].cooldown_until - time.time() > 25
+
+
+def test_drop_before_first_token_fails_over(make_proxy):
+    async def main():
+        async with upstreams([[{"fault": "disconnect", "after": 0, "count": 10 ** 6}], []]) as (mocks, urls):
+            client, _ = await make_proxy(urls)
+            results = [await complete(client, stream=True) for _ in range(5)]
+            return results, mocks
+
+    results, (dropping, _) = asyncio.run(main())
+
+    assert all(status == 200 and text == FULL_REPLY for _, status, text in results)
+    assert dropping.script.counts["disconnect"] == 1
+
+
+def test_drop_mid_stream_ends_with_error_instead_of_restarting(make_proxy):
+    async def main():
+        async with upstreams([[{"fault": "disconnect", "after": 3, "count": 10 ** 6}]] * 2) as (mocks, urls):
+            client, _ = await make_proxy(urls)
+            result = await complete(client, stream=True)
+            return result, mocks
+
+    (_, status, text), mocks = asyncio.run(main())
+
+    assert status == 200
+    # the client got three tokens, another upstream would have repeated them
+    assert text == "lorem ipsum dolor<error>"
+    assert [mock.script.counts["disconnect"] for mock in mocks] == [1, 0]
+
+
+def test_slow_upstream_loses_traffic(make_proxy):
+    async def main():
+        async with upstreams([[{"fault": "latency", "delay": 0.5, "count": 10 ** 6}], []]) as (mocks, urls):
+            client, _ = await make_proxy(urls)
+            results = [await complete(client, stream=True) for _ in range(20)]
+            return results, mocks
+
+    results, (slow, _) = asyncio.run(main())
+
+    assert all(status == 200 and text == FULL_REPLY for _, status, text in results)
+    assert 1 <= slow.script.counts["latency"] <= 2
+    assert median([seconds for seconds, _, _ in results]) < 0.2
+
+
+def test_recovered_upstream_gets_traffic_again(make_proxy, monkeypatch):
+    # scaled down, so that the error penalty is paid off by idle time in a second
+    monkeypatch.setattr(stats.ChannelStatsTable, "error_penalty", 2.0)
+    monkeypatch.setattr(stats.ChannelStatsTable, "idle_step", 0.25)
+
+    async def main():
+        async with upstreams([[{"fault": "error", "status": 500, "duration": 0.3}], []]) as (mocks, urls):
+            client, _ = await make_proxy(urls)
+            started = time.time()
+            results = []
+            while time.time() - started < 3 and not mocks[0].script.recoveries:
+                results.append(await complete(client, stream=False))
+                await asyncio.sleep(0.02)
+            return results, mocks
+
+    results, (flaky, _) = asyncio.run(main())
+
+    assert all(status == 200 for _, status, _ in results)
+    assert flaky.script.recoveries
+    assert flaky.script.recoveries[0] < 2.0
+
+
+class LimitedAdapter(routesim.SimulatedAdapter):
+    """Upstream answering every request with 429."""
+
+    async def query(self, req: request.Request):
+        raise exceptions.RateLimitedError(ratelimit.RateLimitInfo(429, retry_after=30))
+        yield
+
+
+def test_error_of_retry_is_an_sse_chunk(make_channel, make_forward):
+    async def main():
+        fwd = await make_forward([make_channel(1, LimitedAdapter)])
+        req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=True)
+        resp = await fwd.query("/v1/chat/completions", req, {})
+        return [data async for data in resp.response]
+
+    events = asyncio.run(main())
+
+    # the retry finds every channel cooling down
+    assert len(events) == 2
+    assert events[0].startswith("data: {") and events[0].endswith("\n\n")
+    choice = json.loads(events[0][len("data: "):])["choices"][0]
+    assert choice["finish_reason"] == "error"
+    assert choice["error"]["code"] == "rate_limit_exceeded"
+    assert events[1] == "data: [DONE]\n\n"
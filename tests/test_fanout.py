@@ -0,0 +1,55 @@
+import json
+import asyncio
+
+from free_one_api.entities import request, response
+from free_one_api.impls.forward import mgr as forwardmgr
+from free_one_api.tools import routesim
+
+
+class ChoiceAdapter(routesim.SimulatedAdapter):
+    """Answers every choice except those in `config["failing"]`."""
+
+    async def query(self, req: request.Request):
+        if req.choice_index in self.config["failing"]:
+            raise RuntimeError("upstream broke")
+        for text in ("Hel", "lo"):
+            await asyncio.sleep(0)
+            yield response.Response("up", response.FinishReason.NULL, text)
+        yield response.Response("up", response.FinishReason.STOP, "")
+
+
+def make_request(n: int) -> request.Request:
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=True)
+    req.n = n
+    req.message_tokens, req.prompt_tokens = [5], 5
+    return req
+
+
+async def collect(fwd: forwardmgr.ForwardManager, req: request.Request) -> list[str]:
+    resp = await fwd.query("/v1/chat/completions", req, {})
+    assert resp.mimetype == "text/event-stream"
+    return [data async for data in resp.response]
+
+
+def test_failed_choice_ends_with_error_chunk(make_channel, make_forward):
+    async def main():
+        fwd = await make_forward([make_channel(i + 1, ChoiceAdapter, failing={1}) for i in range(3)])
+        return fwd, await collect(fwd, make_request(3))
+
+    fwd, events = asyncio.run(main())
+
+    assert all(event.startswith("data: ") and event.endswith("\n\n") for event in events)
+    assert events[-1] == "data: [DONE]\n\n"
+
+    choices = {}
+    for event in events[:-1]:
+        choice = json.loads(event[len("data: "):])["choices"][0]
+        choices.setdefault(choice["index"], []).append(choice)
+
+    for index in (0, 2):
+        assert "".join(c["delta"].get("content", "") for c in choices[index]) == "Hello"
+
+    assert len(choices[1]) == 1
+    assert choices[1][0]["finish_reason"] == "error"
+    assert choices[1][0]["error"]["message"]
+    assert fwd.fanout["failed_choices"] == 1
@@ -0,0 +1,144 @@
+import json
+import asyncio
+
+import pytest
+
+from free_one_api.entities import request, response
+from free_one_api.tools import routesim
+
+
+async def call(app, method: str, path: str, body: dict=None, auth: str="Bearer sk-test", disconnect_after: int=None) -> tuple[int, dict, bytes]:
+    """Send a request to ASGI app, returns status, headers and body.
+
+    The client disconnects after `disconnect_after` body messages if given.
+    """
+    raw = json.dumps(body).encode() if body is not None else b""
+    headers = [(b"host", b"localhost"), (b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())]
+    if auth is not None:
+        headers.append((b"authorization", auth.encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 3000),
+        "extensions": {},
+    }
+
+    sent = False
+    gone = asyncio.Event()
+    start = {}
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": raw, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False) or len(chunks) == disconnect_after:
+                gone.set()
+
+    await app(scope, receive, send)
+    headers = {name.decode(): value.decode() for name, value in start.get("headers", [])}
+    return start.get("status"), headers, b"".join(chunks)
+
+
+def events(body: bytes) -> list:
+    """Stream events without their random id and creation time."""
+    parsed = []
+    for event in body.decode().split("\n\n"):
+        if event.startswith("data: {"):
+            data = json.loads(event[len("data: "):])
+            del data["id"], data["created"]
+            parsed.append(data)
+        elif event:
+            parsed.append(event)
+    return parsed
+
+
+COMPLETION = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "Hi"}], "stream": True}
+
+
+@pytest.fixture
+def apps(make_channel, make_router):
+    """(Quart app, fast path) over the same channels."""
+    def make(*channels):
+        router = asyncio.run(make_router(list(channels), fast_path=True))
+        return router._app, router._fast
+    return make
+
+
+@pytest.mark.parametrize("body, auth, status", [
+    (COMPLETION, "Bearer sk-test", 200),
+    (COMPLETION, None, 401),
+    (COMPLETION, "Bearer sk-wrong", 401),
+    (dict(COMPLETION, model="no-such-model"), "Bearer sk-test", 404),
+    (dict(COMPLETION, n=-1), "Bearer sk-test", 400),
+])
+def test_fast_path_responds_like_quart(apps, make_channel, body, auth, status):
+    quart_app, fast_app = apps(make_channel(1, reply="Hello there"))
+
+    async def main():
+        return await call(quart_app, "POST", "/v1/chat/completions", body, auth), \
+            await call(fast_app, "POST", "/v1/chat/completions", body, auth)
+
+    (quart_status, quart_headers, quart_body), (fast_status, fast_headers, fast_body) = asyncio.run(main())
+
+    assert fast_status == quart_status == status
+    assert fast_headers.get("content-type") == quart_headers.get("content-type")
+    assert events(fast_body) == events(quart_body)
+
+
+def test_other_requests_go_to_quart(apps, make_channel):
+    quart_app, fast_app = apps(make_channel(1))
+
+    async def main():
+        return await call(fast_app, "GET", "/v1/chat/completions"), await call(quart_app, "GET", "/v1/chat/completions")
+
+    fast, quart = asyncio.run(main())
+
+    assert fast[0] == quart[0] == 405
+
+
+class EndlessAdapter(routesim.SimulatedAdapter):
+    """Streams until the consumer goes away, then records it."""
+
+    async def query(self, req: request.Request):
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield response.Response("up", response.FinishReason.NULL, "more")
+        finally:
+            self.config["closed"] = True
+
+
+def test_client_disconnect_cancels_the_stream(apps, make_channel):
+    chan = make_channel(1, EndlessAdapter)
+    _, fast_app = apps(chan)
+
+    async def main():
+        status, _, body = await asyncio.wait_for(call(fast_app, "POST", "/v1/chat/completions", COMPLETION, disconnect_after=3), 5)
+        await asyncio.sleep(0.01)
+        return status, body
+
+    status, body = asyncio.run(main())
+
+    assert status == 200
+    assert body.count(b"data: ") == 3
+    assert chan.adapter.config["closed"]
+    assert chan.breaker.consecutive == 0
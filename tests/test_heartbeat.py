@@ -0,0 +1,138 @@
+import time
+import asyncio
+
+import pytest
+
+from free_one_api.entities import channel
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.watchdog.tasks import heartbeat
+from free_one_api.tools import routesim
+
+
+class ProbedAdapter(routesim.SimulatedAdapter):
+    """Upstream whose probe answers `healthy` of config after `probe_delay`.
+
+    Probes running at once over all adapters sharing `gauge` of config are counted there.
+    """
+
+    def __init__(self, config: dict, eval):
+        super().__init__(config, eval)
+        self.probes = 0
+
+    async def probe(self):
+        self.probes += 1
+        gauge = self.config.get("gauge", {"running": 0, "max": 0})
+        gauge["running"] += 1
+        gauge["max"] = max(gauge["max"], gauge["running"])
+        try:
+            await asyncio.sleep(self.config.get("probe_delay", 0))
+        finally:
+            gauge["running"] -= 1
+        return self.config.get("healthy", True), ""
+
+
+@pytest.fixture
+def make_task(make_channel, make_manager):
+    """Factory of heartbeat tasks over `amount` probed channels, every channel due."""
+    async def make(amount: int, **cfg) -> heartbeat.HeartBeatTask:
+        mgr = await make_manager([make_channel(i + 1, ProbedAdapter) for i in range(amount)])
+        task = heartbeat.HeartBeatTask(mgr, {"interval": 600, "timeout": 5, "fail_limit": 3, **cfg})
+        for chan in mgr.channels:
+            task.next_probe[chan.id] = 0
+        return task
+    return make
+
+
+async def trigger(task: heartbeat.HeartBeatTask):
+    """Trigger task and wait for the probes it started."""
+    await task.trigger()
+    await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+
+
+def test_first_probes_are_spread(make_task):
+    async def main():
+        task = await make_task(20)
+        task.next_probe.clear()
+        await trigger(task)
+        return task
+
+    task = asyncio.run(main())
+
+    assert all(chan.adapter.probes == 0 for chan in task.channel.channels)
+    now = time.time()
+    assert all(now - 1 < t < now + 60 for t in task.next_probe.values())
+    assert len(set(task.next_probe.values())) == 20
+
+
+def test_due_channel_is_probed_and_rescheduled_with_jitter(make_task):
+    async def main():
+        task = await make_task(1, jitter=0.1)
+        await trigger(task)
+        return task
+
+    task = asyncio.run(main())
+    chan = task.channel.channels[0]
+
+    assert chan.adapter.probes == 1
+    assert task.get_stats()["probes_last_hour"] == 1
+    assert 540 <= task.next_probe[chan.id] - time.time() <= 660
+
+
+def test_live_success_skips_probe(make_task):
+    async def main():
+        task = await make_task(2)
+        stats = task.channel.stats
+        stats.request_finished(stats.slot(1), evaluation.Record(latency=0.1, success=True))
+        await trigger(task)
+        return task
+
+    task = asyncio.run(main())
+    served, idle = task.channel.channels
+
+    assert served.adapter.probes == 0
+    assert idle.adapter.probes == 1
+    assert task.skipped == 1
+    assert task.next_probe[served.id] > time.time() + 500
+
+
+def test_failing_channel_is_retried_sooner_then_disabled(make_task):
+    async def main():
+        task = await make_task(1, retry_interval=30)
+        chan = task.channel.channels[0]
+        chan.adapter.config["healthy"] = False
+
+        await trigger(task)
+        retry_in = task.next_probe[chan.id] - time.time()
+
+        for _ in range(2):
+            task.next_probe[chan.id] = 0
+            await trigger(task)
+        return task, chan, retry_in
+
+    task, chan, retry_in = asyncio.run(main())
+
+    assert retry_in < 40
+    assert chan.adapter.probes == 3
+    assert not chan.enabled
+    assert chan.disabled_reason == channel.DisabledReason.HEARTBEAT
+    # disabled channels are not scheduled anymore
+    asyncio.run(task.trigger())
+    assert chan.id not in task.next_probe
+
+
+def test_probes_are_bounded_by_concurrency(make_task):
+    gauge = {"running": 0, "max": 0}
+
+    async def main():
+        task = await make_task(6, concurrency=2)
+        for chan in task.channel.channels:
+            chan.adapter.config.update(probe_delay=0.01, gauge=gauge)
+        await trigger(task)
+        return task
+
+    task = asyncio.run(main())
+
+    assert all(chan.adapter.probes == 1 for chan in task.channel.channels)
+    assert gauge["max"] == 2
+    assert task.get_stats()["probes_last_hour"] == 6
+    assert task.get_stats()["probing"] == 0
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import itertools
+
+import pytest
+
+from free_one_api.impls.adapter import hugchat
+from free_one_api.impls.channel import eval as evl
+
+
+class FakeChatBot:
+    """Blocking client whose tokens take `delay` seconds each.
+
+    Like hugchat, a query goes to the current conversation, read once
+    the stream is started.
+    """
+
+    def __init__(self, tokens: int, delay: float):
+        self.tokens = tokens
+        self.delay = delay
+        self.current_conversation = None
+        self.queried = []
+
+    def change_conversation(self, conversation_id: str):
+        self.current_conversation = conversation_id
+
+    def query(self, text: str, stream: bool=False):
+        def gen():
+            self.queried.append(self.current_conversation)
+            for i in range(self.tokens):
+                time.sleep(self.delay)
+                yield {"token": f"t{i} "}
+        return gen()
+
+
+@pytest.fixture
+def adapter(monkeypatch):
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "_executor", None)
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "_stream_executor", None)
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "max_workers", 2)
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "stream_workers", 2)
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "pool_size", 1)
+
+    adapter = hugchat.HuggingChatAdapter({"email": "a@example.com", "passwd": "x"}, evl.ChannelEvaluation())
+    account = adapter.accounts[0]
+    ids = itertools.count()
+
+    account.chatbot = FakeChatBot(tokens=10, delay=0.05)
+    account.refresh_models = lambda: ["model-a", "model-b"]
+    account.new_conversation = lambda model: f"conv-{next(ids)}"
+    account.delete_conversation = lambda conversation_id: None
+
+    yield adapter
+
+    hugchat.HuggingChatAdapter._executor and hugchat.HuggingChatAdapter._executor.shutdown(wait=False)
+    hugchat.HuggingChatAdapter._stream_executor and hugchat.HuggingChatAdapter._stream_executor.shutdown(wait=False)
+
+
+def test_blocking_stream_leaves_event_loop_responsive(adapter):
+    async def main():
+        lags = []
+        gaps = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                before = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - before - 0.005)
+
+        async def other_stream():
+            last = time.perf_counter()
+            for _ in range(40):
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        async def hugchat_stream():
+            tokens = [token async for token in adapter.query_conversation("model-a", "Hi")]
+            done.set()
+            return tokens
+
+        tick = asyncio.create_task(ticker())
+        tokens, _ = await asyncio.gather(hugchat_stream(), other_stream())
+        await tick
+        return tokens, lags, gaps
+
+    tokens, lags, gaps = asyncio.run(main())
+
+    assert len(tokens) == 10
+    # a blocked loop would lag by the 50ms of every token
+    assert sorted(lags)[int(len(lags) * 0.95)] < 0.01
+    # 40 ticks of 10ms, a blocked loop would add the 500ms of the stream
+    assert sum(gaps) < 0.6
+
+
+def test_streams_do_not_starve_conversation_creation(adapter):
+    async def main():
+        # occupy every stream worker
+        streams = [
+            asyncio.create_task(consume(adapter.stream_blocking(lambda: adapter.accounts[0].chatbot.query("", stream=True))))
+            for _ in range(adapter.stream_workers + 1)
+        ]
+        await asyncio.sleep(0.05)
+
+        before = time.perf_counter()
+        await adapter.pool.checkout("model-b")
+        waited = time.perf_counter() - before
+
+        await asyncio.gather(*streams)
+        return waited
+
+    async def consume(gen):
+        async for _ in gen:
+            pass
+
+    # streams take 0.5s each, creating a conversation takes no time
+    assert asyncio.run(main()) < 0.2
+
+
+def test_models_fetched_on_start_and_kept_on_failure(adapter):
+    def fail():
+        raise RuntimeError("upstream down")
+
+    async def main():
+        assert adapter.supported_models() == []
+        await adapter.start()
+        assert adapter.supported_models() == ["model-a", "model-b"]
+
+        adapter.accounts[0].refresh_models = fail
+        with pytest.raises(RuntimeError):
+            await adapter.refresh_models()
+        assert adapter.supported_models() == ["model-a", "model-b"]
+
+    asyncio.run(main())
+
+
+def test_start_failure_does_not_raise(adapter):
+    def fail():
+        raise RuntimeError("upstream down")
+
+    adapter.accounts[0].refresh_models = fail
+    asyncio.run(adapter.start())
+
+    assert adapter.supported_models() == []
+
+
+def test_query_is_sent_to_checked_out_conversation(adapter):
+    async def main():
+        return [token async for token in adapter.query_conversation("model-a", "Hi")]
+
+    assert len(asyncio.run(main())) == 10
+    assert adapter.accounts[0].chatbot.queried == ["conv-0"]
+
+
+def test_concurrent_queries_use_own_conversations_and_delete_them(adapter, monkeypatch):
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "pool_size", 2)
+    account = adapter.accounts[0]
+    account.chatbot = FakeChatBot(tokens=3, delay=0.01)
+    deleted = []
+    account.delete_conversation = deleted.append
+
+    async def main():
+        replies = await asyncio.gather(*(
+            consume(adapter.query_conversation("model-a", f"Hi {i}")) for i in range(6)
+        ))
+        await asyncio.sleep(0.05)  # deletions run in background
+        return replies
+
+    async def consume(gen):
+        return [token async for token in gen]
+
+    replies = asyncio.run(main())
+
+    assert all(len(reply) == 3 for reply in replies)
+    queried = account.chatbot.queried
+    # one conversation per query, never shared or reused
+    assert len(queried) == 6
+    assert len(set(queried)) == 6
+    assert sorted(deleted) == sorted(queried)
+    assert adapter.pool.recycled == 6
+    assert adapter.pool.checkouts == 6
+    # the pool is refilled after use
+    assert adapter.pool.idle["model-a"].qsize() == 2
@@ -0,0 +1,134 @@
+import json
+import random
+import asyncio
+
+import pytest
+
+from free_one_api.common import stopseq, tokens
+from free_one_api.entities import request, response
+from free_one_api.impls.forward import limiter
+from free_one_api.tools import routesim
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    # a token per character, tiktoken is not downloaded in tests
+    monkeypatch.setattr(tokens, "truncate_text", lambda text, max_tokens: (text[:max_tokens], min(len(text), max_tokens)))
+
+
+def match(stops: list[str], chunks: list[str]) -> tuple[str, bool]:
+    matcher = stopseq.StopMatcher(stops)
+    emitted = ""
+    for chunk in chunks:
+        text, stopped = matcher.feed(chunk)
+        emitted += text
+        if stopped:
+            return emitted, True
+    return emitted + matcher.flush(), False
+
+
+def reference(stops: list[str], text: str) -> tuple[str, bool]:
+    """Text before the first stop sequence to end, the longest one if several end there."""
+    stops = [stop for stop in stops if stop]
+    for end in range(1, len(text) + 1):
+        found = [stop for stop in stops if text[:end].endswith(stop)]
+        if found:
+            return text[:end - max(len(stop) for stop in found)], True
+    return text, False
+
+
+def test_stop_split_across_chunks():
+    assert match(["###"], ["Hello #", "#", "# world"]) == ("Hello ", True)
+    assert match(["</answer>"], ["4</ans", "wer>", "ignored"]) == ("4", True)
+
+
+def test_partial_stop_is_held_back_then_released():
+    matcher = stopseq.StopMatcher(["###"])
+    assert matcher.feed("a ##") == ("a ", False)
+    assert matcher.feed(" b") == ("## b", False)
+    assert matcher.flush() == ""
+
+    matcher = stopseq.StopMatcher(["###"])
+    assert matcher.feed("end #") == ("end ", False)
+    assert matcher.flush() == "#"
+
+
+def test_overlapping_stops():
+    # "bc" ends before "abcd" does
+    assert match(["abcd", "bc"], ["xab", "cd"]) == ("xa", True)
+    # both end at the same character, the longer one is cut
+    assert match(["cd", "abcd"], ["xa", "bcd"]) == ("x", True)
+    # a failed prefix of one stop is the start of another
+    assert match(["aab"], ["aa", "aab"]) == ("aa", True)
+    assert match(["abab", "bac"], ["aba", "c"]) == ("a", True)
+
+
+def test_empty_stop_is_ignored():
+    assert match(["", "z"], ["abc"]) == ("abc", False)
+
+
+def test_matcher_agrees_with_reference_on_random_splits():
+    rng = random.Random(0)
+    for _ in range(2000):
+        stops = ["".join(rng.choice("ab#") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+        text = "".join(rng.choice("ab# ") for _ in range(rng.randint(0, 30)))
+        cuts = sorted(rng.sample(range(len(text) + 1), rng.randint(0, min(len(text), 6))))
+        chunks = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+        assert match(stops, chunks) == reference(stops, text), (stops, chunks)
+
+
+def test_max_tokens_truncates_and_finishes_with_length():
+    limit = limiter.OutputLimiter(None, 5)
+    assert limit.feed("ab") == "ab"
+    assert limit.finish_reason is None
+    assert limit.feed("cdef") == "cde"
+    assert limit.finish_reason == response.FinishReason.LENGTH
+    assert limit.feed("gh") == ""
+    assert limit.completion_tokens == 5
+
+
+def test_stop_before_max_tokens_wins():
+    limit = limiter.OutputLimiter(["##"], 10)
+    assert limit.feed("abc#") == "abc"
+    assert limit.feed("#def") == ""
+    assert limit.finish_reason == response.FinishReason.STOP
+    assert limit.completion_tokens == 3
+
+
+def test_held_back_text_counts_against_max_tokens():
+    limit = limiter.OutputLimiter(["###"], 4)
+    assert limit.feed("abc#") == "abc"
+    assert limit.flush() == "#"
+    assert limit.finish_reason == response.FinishReason.LENGTH
+
+
+class ChunkAdapter(routesim.SimulatedAdapter):
+    """Streams `config["chunks"]`, recording whether upstream was cancelled early."""
+
+    async def query(self, req: request.Request):
+        self.config["closed_early"] = True
+        for text in self.config["chunks"]:
+            await asyncio.sleep(0)
+            yield response.Response("up", response.FinishReason.NULL, text)
+        self.config["closed_early"] = False
+        yield response.Response("up", response.FinishReason.STOP, "")
+
+
+def test_stream_stops_at_split_stop_and_cancels_upstream(make_channel, make_forward):
+    chan = make_channel(1, ChunkAdapter, chunks=["Hel", "lo #", "## world", " and more"])
+
+    async def main():
+        fwd = await make_forward([chan])
+        req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None, stream=True, stop=["###"])
+        resp = await fwd.query("/v1/chat/completions", req, {})
+        return fwd, [data async for data in resp.response]
+
+    fwd, events = asyncio.run(main())
+
+    choices = [json.loads(event[len("data: "):])["choices"][0] for event in events if event.startswith("data: {")]
+    assert "".join(choice["delta"].get("content", "") for choice in choices) == "Hello "
+    assert choices[-1]["finish_reason"] == "stop"
+    assert events[-1] == "data: [DONE]\n\n"
+    assert chan.adapter.config["closed_early"]
+    assert fwd.cancellations["stop"] == 1
@@ -0,0 +1,48 @@
+from free_one_api.common import stream
+from free_one_api.impls.forward import passthrough, resume
+
+
+def forward(body: bytes) -> bytes:
+    parser = stream.SSEParser(raw=True)
+    events = parser.feed(body) + parser.close()
+    return b"".join(passthrough.rewrite_event(event, "abc", 7) for event in events)
+
+
+def test_patch_model_only_touches_model():
+    body = b'{"model": "gpt-4", "messages": [{"role": "user", "content": "\\"model\\": x"}], "tools": []}'
+    assert passthrough.patch_model(body, "gpt-4o") == body.replace(b'"model": "gpt-4"', b'"model":"gpt-4o"')
+
+
+def test_rewrite_object_keeps_nested_ids():
+    data = b'{"id":"up","choices":[{"delta":{"tool_calls":[{"id":"call_1"}]}}]}'
+    assert passthrough.rewrite_object(data, "abc", 7) == \
+        b'{"provider":7,"id":"chatcmpl-abc","choices":[{"delta":{"tool_calls":[{"id":"call_1"}]}}]}'
+
+
+def test_event_and_id_fields_are_forwarded():
+    body = (
+        b": keep-alive\n\n"
+        b"event: completion\nid: up-1\ndata: {\"id\":\"up\",\"choices\":[]}\n\n"
+        b"data: [DONE]\n\n"
+    )
+    assert forward(body) == (
+        b": keep-alive\n\n"
+        b"event: completion\nid: up-1\ndata: {\"provider\":7,\"id\":\"chatcmpl-abc\",\"choices\":[]}\n\n"
+        b"data: [DONE]\n\n"
+    )
+
+
+def test_crlf_upstream_is_forwarded_with_lf():
+    body = b"data:{\"id\":\"up\"}\r\n\r\ndata: [DONE]\r\n\r\n"
+    assert forward(body) == b"data: {\"provider\":7,\"id\":\"chatcmpl-abc\"}\n\ndata: [DONE]\n\n"
+
+
+def test_resumable_buffer_replaces_upstream_ids():
+    buf = resume.StreamBuffer("chatcmpl-abc", "sk")
+    buf.append(b": keep-alive\n\n")
+    buf.append(b"event: completion\nid: up-1\ndata: {}\n\n")
+
+    assert buf.items == [
+        b": keep-alive\n\n",
+        b"id: chatcmpl-abc/2\nevent: completion\ndata: {}\n\n",
+    ]
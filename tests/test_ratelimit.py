@@ -0,0 +1,133 @@
+import asyncio
+import email.utils
+
+import httpx
+import pytest
+
+from free_one_api.common import ratelimit
+from free_one_api.entities import request, exceptions
+from free_one_api.models.channel import evaluation
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("1h2m3s", 3723.0),
+    ("20ms", 0.02),
+    ("0.5s", 0.5),
+    ("7", 7.0),
+    ("-3", 0.0),
+    ("soon", None),
+    ("5s later", None),
+    (None, None),
+])
+def test_parse_duration(value, seconds):
+    assert ratelimit.parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert ratelimit.parse_retry_after("30") == 30.0
+    assert ratelimit.parse_retry_after(email.utils.formatdate(1060.0, usegmt=True), now=1000.0) == 60.0
+    # dates in the past mean no wait
+    assert ratelimit.parse_retry_after(email.utils.formatdate(900.0, usegmt=True), now=1000.0) == 0.0
+    assert ratelimit.parse_retry_after("tomorrow") is None
+
+
+def test_from_headers_reads_openai_headers():
+    info = ratelimit.RateLimitInfo.from_headers(200, httpx.Headers({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "10",
+        "x-ratelimit-reset-requests": "1m",
+        "x-ratelimit-limit-tokens": "10000",
+        "x-ratelimit-remaining-tokens": "5000",
+        "x-ratelimit-reset-tokens": "6s",
+    }))
+    assert info.quota() == 0.1
+    assert info.quota_reset() == 6.0
+    assert info.cooldown() == 0.0
+
+    assert ratelimit.RateLimitInfo.from_headers(200, httpx.Headers({"content-type": "application/json"})) is None
+    assert ratelimit.RateLimitInfo.from_headers(429, httpx.Headers()).cooldown() == ratelimit.RateLimitInfo.default_cooldown
+
+
+def test_cooldown_prefers_retry_after_then_exhausted_reset():
+    assert ratelimit.RateLimitInfo(429, retry_after=3, reset_requests=50).cooldown() == 3
+    # of two resets, wait for the exhausted quota
+    assert ratelimit.RateLimitInfo(
+        429, limit_requests=10, remaining_requests=5, reset_requests=2, limit_tokens=100, remaining_tokens=0, reset_tokens=40,
+    ).cooldown() == 40
+    # exhausted quota without a 429 cools down too
+    assert ratelimit.RateLimitInfo(200, limit_requests=10, remaining_requests=0, reset_requests=5).cooldown() == 5
+    assert ratelimit.RateLimitInfo(429, retry_after=86400).cooldown() == ratelimit.RateLimitInfo.max_cooldown
+
+
+def test_raise_for_status():
+    req = httpx.Request("POST", "http://upstream/v1/chat/completions")
+
+    with pytest.raises(exceptions.RateLimitedError) as e:
+        ratelimit.raise_for_status(httpx.Response(429, request=req, headers={"retry-after": "12"}))
+    assert e.value.info.cooldown() == 12
+
+    with pytest.raises(httpx.HTTPStatusError):
+        ratelimit.raise_for_status(httpx.Response(500, request=req))
+
+    info = ratelimit.raise_for_status(httpx.Response(200, request=req, headers={"x-ratelimit-remaining-requests": "3"}))
+    assert info.remaining_requests == 3
+
+
+def test_cooled_down_channel_is_skipped_until_retry_after(make_channel, make_manager, now):
+    limited, other = make_channel(1), make_channel(2)
+    mgr = asyncio.run(make_manager([limited, other]))
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+
+    mgr.apply_rate_limit(limited, ratelimit.RateLimitInfo(429, retry_after=30))
+    assert all(asyncio.run(mgr.select_channel("/v1/chat/completions", req)) is other for _ in range(10))
+
+    mgr.apply_rate_limit(other, ratelimit.RateLimitInfo(429, retry_after=60))
+    with pytest.raises(exceptions.QueryHandlingError) as e:
+        asyncio.run(mgr.select_channel("/v1/chat/completions", req))
+    assert e.value.status_code == 429
+    assert "retry after 30s" in e.value.message
+
+    now[0] += 30
+    assert asyncio.run(mgr.select_channel("/v1/chat/completions", req)) is limited
+
+
+def test_rate_limit_applies_to_the_channel_of_its_record(make_channel, make_manager):
+    limited, other = make_channel(1), make_channel(2)
+    mgr = asyncio.run(make_manager([limited, other]))
+
+    records = []
+    for chan in (limited, other):
+        record = evaluation.Record()
+        mgr.add_record(chan, record)
+        records.append(record)
+
+    # both share an adapter type, only the first response carried a 429
+    records[0].rate_limit = ratelimit.RateLimitInfo(429, retry_after=30)
+    for chan, record in zip((limited, other), records):
+        record.success = True
+        mgr.commit_record(chan, record)
+
+    assert limited.cooldown_until > 0
+    assert other.cooldown_until == 0
+
+
+def test_records_without_signals_leave_channel_usable(make_channel, make_manager):
+    chan = make_channel(1)
+    mgr = asyncio.run(make_manager([chan]))
+
+    limited = evaluation.Record()
+    mgr.add_record(chan, limited)
+    plain = evaluation.Record()
+    mgr.add_record(chan, plain)
+
+    # a request finishing without signals must not consume those of another
+    plain.success = True
+    mgr.commit_record(chan, plain)
+    assert chan.cooldown_until == 0
+
+    limited.rate_limit = ratelimit.RateLimitInfo(200, limit_requests=10, remaining_requests=0, reset_requests=5)
+    limited.success = True
+    mgr.commit_record(chan, limited)
+    assert chan.cooldown_until > 0
@@ -0,0 +1,121 @@
+import time
+import asyncio
+
+import pytest
+
+from free_one_api.entities import channel, request
+from free_one_api.impls.watchdog.tasks import recovery
+from free_one_api.tools import routesim
+
+
+class ProbedAdapter(routesim.SimulatedAdapter):
+    """Upstream whose probe answers `healthy` of config."""
+
+    def __init__(self, config: dict, eval):
+        super().__init__(config, eval)
+        self.probes = 0
+
+    async def probe(self):
+        self.probes += 1
+        return self.config.get("healthy", True), ""
+
+
+@pytest.fixture
+def make_task(make_channel, make_manager):
+    """Factory of recovery tasks over channels disabled for `reasons`, without jitter."""
+    async def make(reasons: list[channel.DisabledReason], **cfg) -> recovery.ChannelRecoveryTask:
+        channels = [make_channel(i + 1, ProbedAdapter) for i in range(len(reasons))]
+        for chan, reason in zip(channels, reasons):
+            chan.enabled = False
+            chan.disabled_reason = reason
+        mgr = await make_manager(channels)
+        return recovery.ChannelRecoveryTask(mgr, {"jitter": 0, **cfg})
+    return make
+
+
+async def probe_due(task: recovery.ChannelRecoveryTask):
+    """Make every known channel due, trigger task and wait for the probes it started."""
+    for state in task.states.values():
+        state["next_probe"] = 0
+    await task.trigger()
+    await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+
+
+def test_backoff_doubles_up_to_max_delay():
+    task = recovery.ChannelRecoveryTask(None, {"jitter": 0, "base_delay": 60, "max_delay": 3600})
+    assert [task.backoff(attempts) for attempts in range(8)] == [60, 120, 240, 480, 960, 1920, 3600, 3600]
+    assert task.backoff(1000) == 3600
+
+
+def test_only_heartbeat_disabled_channels_are_probed(make_task):
+    async def main():
+        task = await make_task([channel.DisabledReason.HEARTBEAT, channel.DisabledReason.ADMIN])
+        await task.trigger()  # schedules first probes
+        await probe_due(task)
+        return task
+
+    task = asyncio.run(main())
+    auto, admin = task.channel.channels
+
+    assert auto.adapter.probes == 1
+    assert admin.adapter.probes == 0
+    assert list(task.states) == [auto.id]
+
+
+def test_failed_probes_back_off(make_task):
+    async def main():
+        task = await make_task([channel.DisabledReason.HEARTBEAT], base_delay=60)
+        task.channel.channels[0].adapter.config["healthy"] = False
+        await task.trigger()
+
+        delays = []
+        for _ in range(3):
+            await probe_due(task)
+            delays.append(task.states[1]["next_probe"] - time.time())
+        return task, delays
+
+    task, delays = asyncio.run(main())
+
+    assert task.states[1]["attempts"] == 3
+    assert [round(delay) for delay in delays] == [120, 240, 480]
+    assert not task.channel.channels[0].enabled
+
+
+def test_consecutive_successes_enable_and_ramp(make_task, now):
+    async def main():
+        task = await make_task([channel.DisabledReason.HEARTBEAT], successes=3, ramp_duration=600, initial_share=0.1)
+        await task.trigger()
+        for _ in range(2):
+            await probe_due(task)
+        enabled_early = task.channel.channels[0].enabled
+        await probe_due(task)
+        return task, enabled_early
+
+    task, enabled_early = asyncio.run(main())
+    chan = task.channel.channels[0]
+
+    assert not enabled_early
+    assert chan.enabled
+    assert chan.disabled_reason == channel.DisabledReason.NONE
+    assert task.states == {}
+    assert task.get_stats()["recovered_last_day"] == 1
+
+    assert chan.traffic_share() == pytest.approx(0.1)
+    now[0] += 300
+    assert chan.traffic_share() == pytest.approx(0.55)
+    now[0] += 300
+    assert chan.traffic_share() == 1.0
+
+
+def test_ramping_channel_takes_its_share_of_traffic(make_channel, make_manager, now):
+    ramping, steady = make_channel(1), make_channel(2)
+    ramping.start_ramp(600, 0.1)
+    mgr = asyncio.run(make_manager([ramping, steady]))
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+
+    picked = [asyncio.run(mgr.select_channel("/v1/chat/completions", req)) for _ in range(1000)]
+    assert picked.count(ramping) < 200
+
+    # never starved if it is the only candidate
+    mgr = asyncio.run(make_manager([ramping]))
+    assert asyncio.run(mgr.select_channel("/v1/chat/completions", req)) is ramping
@@ -0,0 +1,148 @@
+import asyncio
+
+from free_one_api.common import ratelimit
+import pytest
+
+from free_one_api.entities import channel
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.adapter import hugchat
+from free_one_api.impls.channel import mgr as chanmgr
+from free_one_api.impls.channel import eval as evl
+from free_one_api.tools import routesim
+
+
+class LifecycleAdapter(routesim.SimulatedAdapter):
+    """Simulated adapter recording start and close."""
+
+    def __init__(self, config: dict, eval):
+        super().__init__(config, eval)
+        self.started = False
+        self.closed = False
+
+    async def start(self):
+        self.started = True
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_channel(make_channel):
+    def make(chan_id: int, name: str=None) -> channel.Channel:
+        return make_channel(chan_id, LifecycleAdapter, name=name)
+    return make
+
+
+async def reload(mgr: chanmgr.ChannelManager, channels: list[channel.Channel]) -> dict:
+    await mgr.prepare_channels(channels)
+    report = mgr.swap_channels(channels)
+    await asyncio.sleep(0)  # let adapters close
+    return report
+
+
+def test_only_changed_channels_are_replaced(make_channel, make_manager):
+    async def main():
+        kept, changed, removed = make_channel(1), make_channel(2), make_channel(3)
+        mgr = await make_manager([kept, changed, removed])
+
+        loaded = [make_channel(1), make_channel(2, "renamed"), make_channel(4)]
+        report = await reload(mgr, loaded)
+        return mgr, report, (kept, changed, removed), loaded
+
+    mgr, report, (kept, changed, removed), loaded = asyncio.run(main())
+
+    assert report["added"] == [4]
+    assert report["updated"] == [2]
+    assert report["removed"] == [3]
+    assert mgr.channels == [kept, loaded[1], loaded[2]]
+
+    # unchanged channel keeps its adapter, the loaded copy is never started
+    assert not kept.adapter.closed
+    assert not loaded[0].adapter.started
+    # fresh adapters are started before they are selectable, replaced ones closed
+    assert loaded[1].adapter.started and loaded[2].adapter.started
+    assert changed.adapter.closed and removed.adapter.closed
+    assert loaded[1].breaker is changed.breaker
+
+
+def test_in_flight_commit_of_removed_channel_keeps_its_slot_free(make_channel, make_manager):
+    async def main():
+        chan = make_channel(1)
+        mgr = await make_manager([chan, make_channel(2)])
+
+        record = evaluation.Record()
+        record.model = "gpt-3.5-turbo"
+        mgr.add_record(chan, record)
+
+        await reload(mgr, [make_channel(2)])
+        assert 1 not in mgr.stats.slots
+
+        record.success = True
+        mgr.commit_record(chan, record)
+        return mgr
+
+    mgr = asyncio.run(main())
+
+    assert 1 not in mgr.stats.slots
+    assert list(mgr.model_stats.keys_of(1)) == []
+
+
+def test_cooldown_of_in_flight_request_reaches_reloaded_channel(make_channel, make_manager):
+    async def main():
+        old = make_channel(1)
+        mgr = await make_manager([old])
+
+        record = evaluation.Record()
+        mgr.add_record(old, record)
+
+        # an update swaps the channel while the request is in flight
+        await reload(mgr, [make_channel(1, "renamed")])
+
+        record.rate_limit = ratelimit.RateLimitInfo(429, retry_after=30)
+        mgr.commit_record(old, record)
+        return mgr
+
+    mgr = asyncio.run(main())
+
+    assert mgr.channels[0].name == "renamed"
+    assert mgr.channels[0].cooldown_until > 0
+
+
+def test_closed_hugchat_pool_deletes_conversations_and_stops_refilling(monkeypatch):
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "_executor", None)
+    monkeypatch.setattr(hugchat.HuggingChatAdapter, "pool_size", 2)
+
+    adapter = hugchat.HuggingChatAdapter({"email": "a@example.com", "passwd": "x"}, evl.ChannelEvaluation())
+    account = adapter.accounts[0]
+    created = []
+    deleted = []
+
+    def new_conversation(model):
+        created.append(f"conv-{len(created)}")
+        return created[-1]
+
+    account.new_conversation = new_conversation
+    account.delete_conversation = deleted.append
+
+    async def main():
+        account_, conversation_id = await adapter.pool.checkout("model-a")
+        await asyncio.sleep(0.05)
+
+        await adapter.close()
+        adapter.pool.recycle("model-a", account_, conversation_id)
+        await asyncio.sleep(0.05)
+
+        try:
+            await adapter.pool.checkout("model-a")
+        except ValueError:
+            return True
+        return False
+
+    try:
+        assert asyncio.run(main())
+    finally:
+        hugchat.HuggingChatAdapter._executor.shutdown(wait=False)
+
+    # every conversation created is deleted, none was created after close
+    assert sorted(deleted) == sorted(created)
+    assert adapter.pool.members[("model-a", "a@example.com")] == 0
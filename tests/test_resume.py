@@ -0,0 +1,109 @@
+import asyncio
+
+from free_one_api.entities import request
+from free_one_api.impls.forward import mgr as forwardmgr
+from free_one_api.impls.forward import resume
+
+
+class Upstream:
+    """Endless stream recording whether it was closed."""
+
+    def __init__(self):
+        self.sent = 0
+        self.closed = asyncio.Event()
+
+    async def gen(self):
+        try:
+            while True:
+                self.sent += 1
+                yield f"data: {self.sent}\n\n"
+                await asyncio.sleep(0.01)
+        finally:
+            self.closed.set()
+
+
+def make_forward() -> forwardmgr.ForwardManager:
+    return forwardmgr.ForwardManager(None, None, None)
+
+
+def make_request(resumable: bool=None) -> request.Request:
+    return request.Request("gpt-3.5-turbo", [], None, stream=True, owner="sk-client", resumable=resumable)
+
+
+async def read_then_leave(body, events: int):
+    got = []
+    async for item in body:
+        got.append(item)
+        if len(got) == events:
+            break
+    await body.aclose()
+    return got
+
+
+def test_streams_are_not_resumable_unless_asked():
+    async def main():
+        fwd = make_forward()
+        upstream = Upstream()
+        gen = upstream.gen()
+        # the body is the generator itself, closing it closes upstream
+        assert fwd.resumable(gen, "abc", make_request()) is gen
+        await read_then_leave(gen, 2)
+        assert upstream.closed.is_set()
+        assert fwd.streams.started == 0
+
+    asyncio.run(main())
+
+
+def test_always_makes_streams_resumable_unless_refused(monkeypatch):
+    monkeypatch.setattr(resume.StreamRegistry, "always", True)
+
+    async def main():
+        fwd = make_forward()
+        gen = Upstream().gen()
+        assert fwd.resumable(gen, "abc", make_request(resumable=False)) is gen
+        assert fwd.resumable(Upstream().gen(), "def", make_request()) is not gen
+        assert fwd.streams.started == 1
+        for buf in fwd.streams.streams.values():
+            buf.task.cancel()
+
+    asyncio.run(main())
+
+
+def test_resumable_stream_survives_disconnect(monkeypatch):
+    monkeypatch.setattr(resume.StreamRegistry, "detach_timeout", 0.2)
+
+    async def main():
+        fwd = make_forward()
+        upstream = Upstream()
+        body = fwd.resumable(upstream.gen(), "abc", make_request(resumable=True))
+        first = await read_then_leave(body, 2)
+
+        await asyncio.sleep(0.05)
+        assert not upstream.closed.is_set()
+
+        buf, after = fwd.streams.find(first[-1].decode().split("\n")[0][len("id: "):], "sk-client")
+        assert after == 2
+        rest = await read_then_leave(fwd.streams.follow(buf, after), 1)
+        assert rest[0].startswith(b"id: chatcmpl-abc/3\n")
+
+        # left again, upstream is cancelled after detach_timeout
+        await asyncio.wait_for(upstream.closed.wait(), 1)
+        assert fwd.streams.abandoned == 1
+
+    asyncio.run(main())
+
+
+def test_unresumable_buffer_cancels_upstream_on_disconnect(monkeypatch):
+    monkeypatch.setattr(resume.StreamRegistry, "max_bytes", 10)
+
+    async def main():
+        fwd = make_forward()
+        upstream = Upstream()
+        body = fwd.resumable(upstream.gen(), "abc", make_request(resumable=True))
+        await read_then_leave(body, 3)
+
+        # too large to resume, nobody can reconnect
+        await asyncio.wait_for(upstream.closed.wait(), 0.1)
+        assert fwd.streams.abandoned == 1
+
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+import json
+import time
+
+from free_one_api.common import clock
+from free_one_api.tools import routesim
+
+
+CHANNELS = [
+    {"id": 1, "models": ["gpt-3.5-turbo"], "ttft_median": 0.3, "ttft_sigma": 0.2, "tps": 80, "failure_rate": 0.0, "concurrency": 64},
+    {"id": 2, "models": ["gpt-3.5-turbo"], "ttft_median": 3.0, "ttft_sigma": 0.2, "tps": 20, "failure_rate": 0.3, "concurrency": 64},
+]
+
+
+def simulate(strategy: str, trace: list[dict], seed: int=0, retries: int=0, channels: list[dict]=CHANNELS) -> dict:
+    return routesim.Simulation(channels, trace, strategy, seed, retries).run()
+
+
+def gpt35_trace(amount: int=400) -> list[dict]:
+    return [dict(item, model="gpt-3.5-turbo") for item in routesim.synthetic_trace(amount, 5.0, 0)]
+
+
+def test_replay_is_deterministic_and_restores_clock():
+    trace = routesim.synthetic_trace(300, 10.0, 1)
+    assert simulate("score", trace, seed=1) == simulate("score", trace, seed=1)
+    assert clock.now is time.time
+
+
+def test_scoring_moves_traffic_to_the_healthy_channel():
+    trace = gpt35_trace()
+    score, rand = simulate("score", trace), simulate("random", trace)
+
+    assert score["channels"][1]["share"] > 0.8
+    assert 0.3 < rand["channels"][1]["share"] < 0.7
+    assert score["ttft_p50"] < rand["ttft_p50"]
+    assert score["error_rate"] < rand["error_rate"]
+
+
+def test_retries_turn_failures_into_attempts():
+    trace = gpt35_trace()
+    plain, retried = simulate("random", trace), simulate("random", trace, retries=2)
+
+    assert plain["attempts"] == len(trace)
+    assert retried["attempts"] > len(trace)
+    assert retried["error_rate"] < plain["error_rate"]
+
+
+def test_unserved_model_is_rejected_before_any_attempt():
+    trace = [{"t": 0.1 * i, "model": "gpt-4", "prompt_tokens": 10, "output_tokens": 10} for i in range(5)]
+    result = simulate("score", trace)
+
+    assert result["rejections"] == {"channel_not_found": 5}
+    assert result["attempts"] == 0
+    assert result["error_rate"] == 1.0
+
+
+def test_main_replays_files_as_json(tmp_path, capsys):
+    channels = tmp_path / "channels.json"
+    channels.write_text(json.dumps(CHANNELS))
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text("\n".join(json.dumps(item) for item in gpt35_trace(50)) + "\n")
+
+    routesim.main(["--channels", str(channels), "--trace", str(trace), "--strategies", "score,least_loaded", "--json"])
+    report = json.loads(capsys.readouterr().out)
+
+    assert set(report) == {"score", "least_loaded"}
+    assert report["score"]["requests"] == 50
+    assert set(report["score"]["channels"]) == {"1", "2"}
@@ -0,0 +1,91 @@
+import asyncio
+
+from free_one_api.entities import request, response
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.channel import eval as evl
+from free_one_api.impls.forward import shadow
+from free_one_api.tools import routesim
+
+
+class RecordingAdapter(routesim.SimulatedAdapter):
+    """Answers every query and keeps the requests it got."""
+
+    def __init__(self, config: dict, eval: evl.ChannelEvaluation):
+        super().__init__(config, eval)
+        self.requests = []
+
+    async def query(self, req: request.Request):
+        self.requests.append(req)
+        yield response.Response("shadow", response.FinishReason.STOP, "Hi")
+
+
+def test_shadow_request_sends_whole_history(make_channel, make_manager):
+    primary, shadow_chan = make_channel(1, RecordingAdapter), make_channel(2, RecordingAdapter)
+
+    req = request.Request("gpt-3.5-turbo", [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {"role": "user", "content": "How are you?"},
+    ], None)
+    # the primary continued its own upstream conversation
+    req.continuation = {"conversation_id": "primary-conv"}
+    req.continued_messages = 2
+    req.next_continuation = {"conversation_id": "primary-conv", "parent": "m3"}
+
+    record = evaluation.Record()
+    record.latency = 0.1
+    record.success = True
+
+    async def main():
+        mirror = shadow.ShadowMirror(await make_manager([primary, shadow_chan]))
+        mirror.in_flight += 1
+        await mirror.run(shadow_chan, primary, req, record)
+        return mirror
+
+    mirror = asyncio.run(main())
+
+    sent = shadow_chan.adapter.requests[0]
+    assert sent.continuation is None
+    assert sent.continued_messages == 0
+    assert sent.next_continuation is None
+    assert len(sent.messages) == 3
+    # the primary's request is left alone
+    assert req.continuation == {"conversation_id": "primary-conv"}
+    assert mirror.comparisons[shadow_chan.id][0][3] is True
+
+
+def test_enabled_shadow_channel_gets_no_client_traffic(make_channel, make_manager, monkeypatch):
+    monkeypatch.setattr(shadow.ShadowMirror, "enabled", True)
+    monkeypatch.setattr(shadow.ShadowMirror, "rules", [{"channel": 2, "rate": 1.0}])
+    primary, shadow_chan = make_channel(1, RecordingAdapter), make_channel(2, RecordingAdapter)
+
+    async def main():
+        mgr = await make_manager([primary, shadow_chan])
+        mirror = shadow.ShadowMirror(mgr)
+        selected = set()
+        for _ in range(50):
+            req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+            chan = await mgr.select_channel("/v1/chat/completions", req)
+            selected.add(chan.id)
+
+            record = evaluation.Record()
+            record.latency = 0.1
+            record.success = True
+            mirror.mirror(chan, req, record)
+            await asyncio.sleep(0.001)  # stay below the concurrency of mirroring
+        return selected, mirror
+
+    selected, mirror = asyncio.run(main())
+
+    assert selected == {1}
+    # it is still evaluated with mirrored requests
+    assert mirror.mirrored[2] == 50
+    assert len(shadow_chan.adapter.requests) == 50
+
+
+def test_shadow_channel_is_routed_normally_once_mirroring_is_off(make_channel, make_manager, monkeypatch):
+    monkeypatch.setattr(shadow.ShadowMirror, "rules", [{"channel": 2, "rate": 1.0}])
+    mgr = asyncio.run(make_manager([make_channel(2)]))
+
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+    assert asyncio.run(mgr.select_channel("/v1/chat/completions", req)).id == 2
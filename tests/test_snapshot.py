@@ -0,0 +1,108 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.channel import mgr as chanmgr
+from free_one_api.impls.channel import breaker
+from free_one_api.impls.watchdog.tasks import snapshot as snapshottask
+from free_one_api.tools import routesim
+
+
+@pytest.fixture
+def make_snapshotted(make_channel, tmp_path):
+    """Factory of managers over fresh channels 1 and 2, snapshotting to a file in tmp_path."""
+    async def make() -> chanmgr.ChannelManager:
+        mgr = chanmgr.ChannelManager(routesim.MemoryDB([make_channel(1), make_channel(2)]))
+        mgr.snapshot.path = str(tmp_path / "stats_snapshot.json")
+        await mgr.load_channels()
+        return mgr
+    return make
+
+
+def serve(mgr: chanmgr.ChannelManager, channel_id: int, latency: float, success: bool=True):
+    chan = next(chan for chan in mgr.channels if chan.id == channel_id)
+    record = evaluation.Record(latency=latency, success=success)
+    record.model = "gpt-3.5-turbo"
+    mgr.add_record(chan, record)
+    mgr.commit_record(chan, record)
+
+
+def age_snapshot(mgr: chanmgr.ChannelManager, seconds: float):
+    with open(mgr.snapshot.path) as f:
+        data = json.load(f)
+    data["time"] = time.time() - seconds
+    with open(mgr.snapshot.path, "w") as f:
+        json.dump(data, f)
+
+
+def test_statistics_survive_restart(make_snapshotted):
+    async def main():
+        before = await make_snapshotted()
+        for _ in range(4):
+            serve(before, 1, 0.5)
+        serve(before, 2, 2.0, success=False)
+        await snapshottask.StatsSnapshotTask(before, before.snapshot).trigger()
+        return before, await make_snapshotted()
+
+    before, after = asyncio.run(main())
+
+    for channel_id in (1, 2):
+        assert after.stats.export(channel_id) == pytest.approx(before.stats.export(channel_id), rel=1e-3)
+    assert after.model_stats.export((1, "gpt-3.5-turbo")) == pytest.approx(before.model_stats.export((1, "gpt-3.5-turbo")), rel=1e-3)
+    # in-process columns start over
+    assert after.stats.in_flight[after.stats.slot(1)] == 0
+
+
+def test_restored_statistics_decay_with_age(make_snapshotted):
+    async def main():
+        before = await make_snapshotted()
+        for _ in range(10):
+            serve(before, 1, 1.0, success=False)
+        await snapshottask.StatsSnapshotTask(before, before.snapshot).trigger()
+        age_snapshot(before, before.snapshot.half_life)
+        return before, await make_snapshotted()
+
+    before, after = asyncio.run(main())
+
+    saved, restored = before.stats.export(1), after.stats.export(1)
+    assert restored["error_rate"] == pytest.approx(saved["error_rate"] / 2, rel=0.01)
+    assert restored["samples"] == 5
+
+
+def test_old_or_broken_snapshots_are_ignored(make_snapshotted):
+    async def main():
+        before = await make_snapshotted()
+        serve(before, 1, 1.0, success=False)
+        await snapshottask.StatsSnapshotTask(before, before.snapshot).trigger()
+
+        age_snapshot(before, before.snapshot.max_age + 1)
+        old = await make_snapshotted()
+
+        with open(before.snapshot.path, "w") as f:
+            f.write("{not json")
+        broken = await make_snapshotted()
+        return old, broken
+
+    old, broken = asyncio.run(main())
+
+    assert old.stats.samples[old.stats.slot(1)] == 0
+    assert broken.stats.samples[broken.stats.slot(1)] == 0
+
+
+def test_open_breaker_stays_open_after_restart(make_snapshotted):
+    async def main():
+        before = await make_snapshotted()
+        for _ in range(breaker.CircuitBreaker.consecutive_failures):
+            serve(before, 2, 1.0, success=False)
+        await snapshottask.StatsSnapshotTask(before, before.snapshot).trigger()
+        return before, await make_snapshotted()
+
+    before, after = asyncio.run(main())
+
+    opened = [chan.breaker for chan in after.channels if chan.id == 2][0]
+    assert opened.state == breaker.BreakerState.OPEN
+    assert not opened.allow()
+    assert [chan.breaker for chan in after.channels if chan.id == 1][0].state == breaker.BreakerState.CLOSED
@@ -0,0 +1,140 @@
+import asyncio
+import collections
+
+import numpy as np
+
+from free_one_api.entities import request
+from free_one_api.models.channel import evaluation
+from free_one_api.impls.channel import stats
+
+
+def finished(latency: float=0.5, success: bool=True, chars: int=400, generating: float=1.0) -> evaluation.Record:
+    record = evaluation.Record(start_time=0.0, latency=latency, resp_message_length=chars, success=success)
+    record.end_time = latency + generating
+    return record
+
+
+def test_slots_are_reused_and_table_grows_keeping_rows(now):
+    table = stats.ChannelStatsTable()
+    first = table.allocate(1)
+    table.request_finished(first, finished(latency=2.0))
+
+    for channel_id in range(2, table.initial_size * 2 + 1):
+        table.allocate(channel_id)
+    assert len(table.in_flight) >= table.initial_size * 2
+    assert table.ewma_latency[table.slot(1)] == 2.0
+
+    table.release(5)
+    assert table.allocate(1000) == 4
+    # a reused slot starts over
+    assert table.samples[4] == 0
+
+
+def test_request_finished_updates_ewma_columns(now):
+    table = stats.ChannelStatsTable()
+    slot = table.allocate(1)
+
+    table.request_started(slot)
+    assert table.in_flight[slot] == 1
+    table.request_finished(slot, finished(latency=1.0, chars=400, generating=1.0))
+    assert table.in_flight[slot] == 0
+    assert table.ewma_latency[slot] == 1.0
+    assert table.ewma_tps[slot] == 100.0
+    assert table.last_success[slot] == now[0]
+
+    table.request_finished(slot, finished(latency=2.0, success=False))
+    # failures tell nothing about latency
+    assert table.ewma_latency[slot] == 1.0
+    assert table.error_rate[slot] == table.ewma_alpha
+    assert table.samples[slot] == 2
+
+
+def test_score_penalizes_busy_slow_failing_and_exhausted_slots(now):
+    table = stats.ChannelStatsTable()
+    idle, busy, slow, failing, exhausted, full = (table.allocate(i) for i in range(1, 7))
+
+    table.request_started(busy)
+    table.ewma_latency[slow] = 10.0
+    table.error_rate[failing] = 0.5
+    table.update_quota(exhausted, 0.0, reset=30.0)
+    table.capacity[full] = 1
+    table.request_started(full)
+
+    scores = table.score(np.array([idle, busy, slow, failing, exhausted, full]))
+    assert scores[0] == 0.0
+    assert scores[1] == -table.idle_step
+    assert scores[2] == -10.0
+    assert scores[3] == -0.5 * table.error_penalty
+    assert scores[4] == -table.quota_penalty
+    assert scores[5] == -np.inf
+
+    # quota is full again after reset
+    now[0] += 30.0
+    assert table.score(np.array([exhausted]))[0] >= 0.0
+
+
+def test_select_breaks_ties_randomly(now):
+    table = stats.ChannelStatsTable()
+    slots = np.array([table.allocate(i) for i in range(1, 5)])
+    table.error_rate[slots[3]] = 1.0
+
+    picked = collections.Counter(table.select(slots) for _ in range(400))
+    assert set(picked) == {0, 1, 2}
+
+
+def test_select_channel_prefers_faster_channel(make_channel, make_manager, now):
+    fast, slow = make_channel(1), make_channel(2)
+    mgr = asyncio.run(make_manager([fast, slow]))
+    mgr.stats.request_finished(mgr.stats.slot(fast.id), finished(latency=0.2))
+    mgr.stats.request_finished(mgr.stats.slot(slow.id), finished(latency=3.0))
+
+    req = request.Request("gpt-3.5-turbo", [{"role": "user", "content": "Hi"}], None)
+    for _ in range(10):
+        assert asyncio.run(mgr.select_channel("/v1/chat/completions", req)) is fast
+
+
+def serve(mgr, chan, model: str, latency: float, success: bool=True):
+    """Add and commit a record of a request for model on chan."""
+    record = evaluation.Record(latency=latency, success=success)
+    record.model = model
+    mgr.add_record(chan, record)
+    mgr.commit_record(chan, record)
+
+
+def test_select_channel_routes_on_statistics_of_requested_model(make_channel, make_manager, now):
+    mixed = make_channel(1, models=["gpt-3.5-turbo", "gpt-4"])
+    steady = make_channel(2, models=["gpt-3.5-turbo", "gpt-4"])
+    mgr = asyncio.run(make_manager([mixed, steady]))
+
+    for _ in range(5):
+        serve(mgr, mixed, "gpt-3.5-turbo", 0.2)
+        serve(mgr, mixed, "gpt-4", 6.0)
+        serve(mgr, steady, "gpt-3.5-turbo", 1.0)
+        serve(mgr, steady, "gpt-4", 1.0)
+
+    # channel-wide, the mixed channel looks slower for every model
+    assert mgr.stats.ewma_latency[mgr.stats.slot(mixed.id)] > mgr.stats.ewma_latency[mgr.stats.slot(steady.id)]
+
+    def select(model: str):
+        req = request.Request(model, [{"role": "user", "content": "Hi"}], None)
+        return asyncio.run(mgr.select_channel("/v1/chat/completions", req))
+
+    assert all(select("gpt-3.5-turbo") is mixed for _ in range(10))
+    assert all(select("gpt-4") is steady for _ in range(10))
+
+
+def test_model_rows_are_keyed_by_upstream_model_and_released_with_channel(make_channel, make_manager):
+    chan = make_channel(1, models=["gpt-4"])
+    chan.model_mapping = {"fast": "gpt-4"}
+    mgr = asyncio.run(make_manager([chan]))
+
+    serve(mgr, chan, "gpt-4", 0.5, success=False)
+    req = request.Request("fast", [{"role": "user", "content": "Hi"}], None)
+    assert asyncio.run(mgr.select_channel("/v1/chat/completions", req)) is chan
+    # the requested name is scored on the row of the upstream model
+    assert mgr.model_stats.keys_of(chan.id) == [(chan.id, "gpt-4")]
+    assert mgr.model_stats.error_rate[mgr.model_stats.slot((chan.id, "gpt-4"))] > 0
+
+    asyncio.run(mgr.delete_channel(chan.id))
+    assert mgr.model_stats.keys_of(chan.id) == []
+    assert chan.id not in mgr.stats.slots
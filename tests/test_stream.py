@@ -0,0 +1,195 @@
+import json
+import random
+import asyncio
+
+import pytest
+
+from free_one_api.common import stream
+
+
+def feed_sse(body: bytes, cuts: list[int]) -> list[tuple]:
+    parser = stream.SSEParser()
+    events = []
+    last = 0
+    for cut in cuts + [len(body)]:
+        events.extend(parser.feed(body[last:cut]))
+        last = cut
+    events.extend(parser.close())
+    return [(event.event, event.data, event.id) for event in events]
+
+
+def feed_ndjson(body: bytes, cuts: list[int]) -> list[bytes]:
+    parser = stream.NDJSONParser()
+    lines = []
+    last = 0
+    for cut in cuts + [len(body)]:
+        lines.extend(parser.feed(body[last:cut]))
+        last = cut
+    lines.extend(parser.close())
+    return lines
+
+
+def random_cuts(rng: random.Random, size: int) -> list[int]:
+    return sorted(rng.sample(range(1, size), rng.randint(0, min(size - 1, 40)))) if size > 1 else []
+
+
+SSE_BODY = (
+    b": keep-alive comment\n"
+    b"event: message\n"
+    b"id: 1\n"
+    b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n'
+    b"\n"
+    b'data:{"choices":[{"delta":{"content":"lo"}}]}\n'
+    b"\n"
+    b"data: first line\n"
+    b"data: second line\n"
+    b"data:\n"
+    b"\n"
+    b"event: ping\n"
+    b"\n"
+    b"data: [DONE]\n"
+    b"\n"
+)
+
+SSE_EVENTS = [
+    ("message", b'{"choices":[{"delta":{"content":"Hel"}}]}', "1"),
+    (None, b'{"choices":[{"delta":{"content":"lo"}}]}', "1"),
+    (None, b"first line\nsecond line\n", "1"),
+    (None, b"[DONE]", "1"),
+]
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_sse_line_endings(newline):
+    body = SSE_BODY.replace(b"\n", newline)
+    assert feed_sse(body, []) == SSE_EVENTS
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_sse_random_splits(newline):
+    rng = random.Random(newline)
+    body = SSE_BODY.replace(b"\n", newline)
+    for _ in range(500):
+        assert feed_sse(body, random_cuts(rng, len(body))) == SSE_EVENTS
+
+
+def test_sse_byte_by_byte_crlf():
+    body = SSE_BODY.replace(b"\n", b"\r\n")
+    assert feed_sse(body, list(range(1, len(body)))) == SSE_EVENTS
+
+
+def test_sse_mixed_line_endings_fuzz():
+    rng = random.Random(0)
+    for _ in range(300):
+        body = b""
+        for line in SSE_BODY.split(b"\n")[:-1]:
+            # a blank line ending with \n after \r would make one \r\n
+            choices = [b"\r\n", b"\r"] if not line and body.endswith(b"\r") else [b"\n", b"\r\n", b"\r"]
+            body += line + rng.choice(choices)
+        assert feed_sse(body, random_cuts(rng, len(body))) == SSE_EVENTS
+
+
+def test_sse_space_after_colon_is_optional():
+    assert feed_sse(b"data:a\n\ndata: b\n\ndata:  c\n\n", []) == [
+        (None, b"a", None),
+        (None, b"b", None),
+        (None, b" c", None),
+    ]
+
+
+def test_sse_comments_and_unknown_fields_ignored():
+    body = b":comment\nretry: 100\nfoo: bar\ndata: x\n: another\n\n"
+    assert feed_sse(body, []) == [(None, b"x", None)]
+
+
+def test_sse_unterminated_last_event():
+    assert feed_sse(b"data: a\n\ndata: b", []) == [(None, b"a", None), (None, b"b", None)]
+    assert feed_sse(b"data: a\r", []) == [(None, b"a", None)]
+
+
+def test_sse_cr_at_chunk_end_followed_by_lf():
+    parser = stream.SSEParser()
+    assert parser.feed(b"data: a\r") == []
+    assert parser.feed(b"\n\r") == []
+    assert [event.data for event in parser.feed(b"\ndata: b\r\r")] == [b"a"]
+    # the last \r may still be followed by \n
+    assert [event.data for event in parser.close()] == [b"b"]
+
+
+def test_sse_random_events_fuzz():
+    rng = random.Random(1)
+    alphabet = "ab :é中{}\""
+    for _ in range(300):
+        newline = rng.choice([b"\n", b"\r\n", b"\r"])
+        body = b""
+        expected = []
+        for _ in range(rng.randint(1, 8)):
+            lines = [
+                "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20))).lstrip(" ").encode("utf-8")
+                for _ in range(rng.randint(1, 3))
+            ]
+            for line in lines:
+                if rng.random() < 0.3:
+                    body += b": comment" + newline
+                body += b"data:" + b" " * rng.randint(0, 1) + line + newline
+            body += newline
+            expected.append((None, b"\n".join(lines), None))
+
+        assert feed_sse(body, random_cuts(rng, len(body))) == expected
+
+
+NDJSON_LINES = [
+    json.dumps({"message": {"content": {"parts": ["Hi"]}}}).encode(),
+    json.dumps({"text": "café 中"}, ensure_ascii=False).encode(),
+    b'{"done":true}',
+]
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_ndjson_random_splits(newline):
+    rng = random.Random(newline)
+    body = newline.join(NDJSON_LINES) + newline + newline
+    for _ in range(500):
+        assert feed_ndjson(body, random_cuts(rng, len(body))) == NDJSON_LINES
+
+
+def test_ndjson_blank_lines_and_unterminated_last_line():
+    body = b"\n\n" + b"\n \n".join(NDJSON_LINES)
+    assert feed_ndjson(body, []) == NDJSON_LINES
+
+
+def test_ndjson_mixed_line_endings_fuzz():
+    rng = random.Random(2)
+    for _ in range(300):
+        body = b"".join(line + rng.choice([b"\n", b"\r\n", b"\r", b"\n\n"]) for line in NDJSON_LINES)
+        assert feed_ndjson(body, random_cuts(rng, len(body))) == NDJSON_LINES
+
+
+def test_aiter_chat_deltas_stops_at_done():
+    chunks = [
+        {"choices": [{"index": 0, "delta": {"content": "Hel"}, "finish_reason": None}]},
+        {"choices": [{"index": 0, "delta": {"content": "lo \\\"x\\\""}, "finish_reason": None}]},
+        {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+    ]
+    body = b"".join(b"data:" + json.dumps(chunk, separators=(",", ":")).encode() + b"\r\n\r\n" for chunk in chunks)
+    body += b"data: [DONE]\r\n\r\ndata: ignored\r\n\r\n"
+
+    async def pieces():
+        for i in range(0, len(body), 7):
+            yield body[i:i + 7]
+
+    async def collect():
+        return [delta async for delta in stream.aiter_chat_deltas(pieces())]
+
+    assert asyncio.run(collect()) == [("Hel", None), ('lo \\"x\\"', None), (None, "stop")]
+
+
+def test_sse_raw_keeps_lines_and_data_less_blocks():
+    body = b": ping\r\n\r\nevent: delta\r\nid: 7\r\ndata: {}\r\n\r\n"
+    parser = stream.SSEParser(raw=True)
+    events = parser.feed(body) + parser.close()
+
+    assert [(event.data, event.lines) for event in events] == [
+        (None, [b": ping"]),
+        (b"{}", [b"event: delta", b"id: 7", b"data: {}"]),
+    ]
@@ -0,0 +1,102 @@
+import asyncio
+
+from free_one_api.common import tokens
+from free_one_api.entities import request, response
+from free_one_api.tools import routesim
+
+
+def roles(messages: list[dict]) -> str:
+    return "".join(message["role"][0] for message in messages)
+
+
+def test_prompt_within_budget_is_untouched():
+    messages = [{"role": "user", "content": "Hi"}]
+    assert tokens.trim_messages(messages, [10], 100) == (messages, [10], 0, 0)
+
+
+def test_oldest_non_system_messages_are_dropped_first():
+    messages = [
+        {"role": "system", "content": "s"},
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "u2"},
+        {"role": "assistant", "content": "a2"},
+        {"role": "user", "content": "u3"},
+    ]
+    message_tokens = [10, 20, 20, 20, 20, 10]
+
+    kept, kept_tokens, dropped, dropped_tokens = tokens.trim_messages(messages, message_tokens, 63 + tokens.REPLY_PRIMER_TOKENS)
+    assert [message["content"] for message in kept] == ["s", "u2", "a2", "u3"]
+    assert kept_tokens == [10, 20, 20, 10]
+    assert (dropped, dropped_tokens) == (2, 40)
+
+    # system and last messages stay even if they don't fit
+    kept, _, dropped, _ = tokens.trim_messages(messages, message_tokens, 1)
+    assert roles(kept) == "su"
+    assert dropped == 4
+    assert tokens.min_prompt_tokens(messages, message_tokens) == 20 + tokens.REPLY_PRIMER_TOKENS
+
+
+def test_tool_results_are_dropped_with_their_call():
+    messages = [
+        {"role": "user", "content": "weather?"},
+        {"role": "assistant", "content": "", "tool_calls": []},
+        {"role": "tool", "content": "sunny"},
+        {"role": "tool", "content": "warm"},
+        {"role": "assistant", "content": "Sunny and warm."},
+        {"role": "user", "content": "thanks"},
+    ]
+    message_tokens = [10] * 6
+
+    kept, _, dropped, _ = tokens.trim_messages(messages, message_tokens, 35 + tokens.REPLY_PRIMER_TOKENS)
+    # dropping the call takes its results too, no orphan tool message is left
+    assert roles(kept) == "au"
+    assert dropped == 4
+
+
+class RecordingAdapter(routesim.SimulatedAdapter):
+    """Answers every query and keeps the messages it got."""
+
+    async def query(self, req: request.Request):
+        self.config["messages"] = list(req.messages)
+        yield response.Response("up", response.FinishReason.STOP, "Hello")
+
+
+def history(turns: int, words: int) -> list[dict]:
+    """System prompt, `turns` old messages of `words` words and a short question."""
+    messages = [{"role": "system", "content": "Be brief."}]
+    for i in range(turns):
+        messages.append({"role": "user" if i % 2 == 0 else "assistant", "content": " ".join([f"m{i}"] * words)})
+    messages.append({"role": "user", "content": "What did I say first?"})
+    return messages
+
+
+def test_opted_in_request_is_trimmed_to_fit(make_channel, make_client):
+    chan = make_channel(1, RecordingAdapter, models=["gpt-4"])
+    messages = history(10, 1000)
+
+    async def main():
+        client = await make_client([chan])
+        rejected = await client.post(
+            "/v1/chat/completions",
+            json={"model": "gpt-4", "messages": messages},
+            headers={"Authorization": "Bearer sk-test"},
+        )
+        trimmed = await client.post(
+            "/v1/chat/completions",
+            json={"model": "gpt-4", "messages": messages, "stream": True},
+            headers={"Authorization": "Bearer sk-test", "X-Trim-Prompt": "true"},
+        )
+        await trimmed.get_data()
+        return rejected, trimmed
+
+    rejected, trimmed = asyncio.run(main())
+
+    assert rejected.status_code == 400
+    assert trimmed.status_code == 200
+
+    # 8192 token window, 1024 reserved for the completion, every old message is 1005 tokens
+    sent = chan.adapter.config["messages"]
+    assert sent[0] == messages[0] and sent[-1] == messages[-1]
+    assert sent[1:-1] == messages[4:-1]
+    assert trimmed.headers["X-Prompt-Trimmed"] == "messages=3; tokens=3015"